@@ -69,14 +69,15 @@ configs['mail_script'] = config.IT50_analysis['mail_script']
 import sys
 from util import tools as t
 from util.tools import DirHop
-from util import mutt
+import outbox
+import metrics
 
 
 
 # ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
 def email_notification(new_runs_dict):
     '''
-    Send an email notifcation about the new runs
+    Queue an email notifcation about the new runs
     '''
     reply_to_address = t.reply_to_address(servername = configs['reply_to_servername'])
     email_recipients = configs['email_recipients']
@@ -84,11 +85,8 @@ def email_notification(new_runs_dict):
 
     message_file = emaillog_handler_path
 
-    email_command = mutt.mutt_mail(recipient_list = email_recipients, reply_to = reply_to_address, subject_line = email_subject_line, message = 'This message should have been replaced by the script log file contents. If you are reading it, something broke, sorry', message_file = message_file, return_only_mode = True, quiet = True)
-
-    logger.debug('Email command is:\n\n{0}\n\n'.format(email_command))
-
-    mutt.subprocess_cmd(command = email_command)
+    outbox.get_outbox().put(recipients = email_recipients, reply_to = reply_to_address, subject = email_subject_line, message_file = message_file)
+    logger.debug('Email added to the outbox: {0}'.format(email_subject_line))
 
 
 def main(extra_handlers = None, download = True):
@@ -110,7 +108,8 @@ def main(extra_handlers = None, download = True):
     # change working directory to the pipeline dir and execute Python scripts there
     with DirHop(pipeline_dir) as d:
         from code import check_for_new_runs
-        new_runs_dict = check_for_new_runs.main(download = download) # output = {'runs': [validated_missing_runs], 'samplesheet_file': samplesheet_file}
+        with metrics.span('check_for_new_runs', task = 'IT50_analysis'):
+            new_runs_dict = check_for_new_runs.main(download = download) # output = {'runs': [validated_missing_runs], 'samplesheet_file': samplesheet_file}
         logger.info('New runs found: {0}'.format(new_runs_dict['runs']))
         if download:
             logger.info('New runs files will be transferred from IonTorrent server')
@@ -137,6 +136,7 @@ cd {0}
         configs['mail_script']
         ))
         # logger.info('New IonTorrent runs are available for analysis. Please start the analysis at the following server location:\n\n{0}'.format(configs['pipeline_dir']))
+        metrics.increment('runs_found', value = len(new_runs_dict['runs']), task = 'IT50_analysis')
         email_notification(new_runs_dict)
 
 
@@ -146,6 +146,7 @@ def run():
     arg parsing goes here, if program was run as a script
     '''
     main()
+    outbox.send_all()
 
 if __name__ == "__main__":
     run()
@@ -17,6 +17,7 @@ script_timestamp = log.timestamp()
 scriptdir = os.path.dirname(os.path.realpath(__file__))
 scriptname = os.path.basename(__file__)
 logdir = os.path.join(scriptdir, 'logs')
+catalog_file = os.path.join(scriptdir, 'db', 'run_catalog.sqlite')
 file_timestamp = log.timestamp()
 log_file = os.path.join(scriptdir, logdir, '{0}.{1}.log'.format(scriptname, file_timestamp))
 
@@ -30,7 +31,9 @@ logger.debug("loading NGS580_analysis module")
 
 # ~~~~ GET EXTERNAL CONFIGS ~~~~~~ #
 import config
-sequencer_dir = config.NextSeq['location']
+import locations
+sequencer_locations = locations.get_locations(config.NextSeq['locations'])
+sequencer_dir = sequencer_locations[0].path
 analysis_output_dir = config.NGS580_analysis['analysis_output_dir']
 start_NGS580_script = config.NGS580_analysis['script']
 email_recipients = config.NGS580_analysis['email_recipients']
@@ -48,6 +51,7 @@ configs['email_recipients'] = email_recipients
 configs['reply_to_servername'] = reply_to_servername
 configs['scriptdir'] = scriptdir
 configs['logdir'] = logdir
+configs['catalog_file'] = catalog_file
 configs['log_file'] = log_file
 configs['main_filehandler'] = main_filehandler
 configs['script_timestamp'] = script_timestamp
@@ -57,6 +61,16 @@ configs['seqtype_file'] = config.NGS580_analysis['seqtype_file']
 configs['analysis_started_file'] = config.NGS580_analysis['analysis_started_file']
 configs['samples_pairs_sheet_pattern'] = config.NGS580_analysis['samples_pairs_sheet_pattern']
 configs['samplesheet_source_dir'] = config.NGS580_analysis['samplesheet_source_dir']
+configs['min_sample_reads'] = config.NGS580_analysis['min_sample_reads']
+configs['max_undetermined_fraction'] = config.NGS580_analysis['max_undetermined_fraction']
+configs['validation_threads'] = config.NextSeq['validation_threads']
+configs['explain_validations'] = config.NextSeq['explain_validations']
+configs['launch_threads'] = config.NextSeq['launch_threads']
+configs['launch_timeout'] = config.NextSeq['launch_timeout']
+configs['RTA_completion_window'] = config.NextSeq['RTA_completion_window']
+configs['discovery_processes'] = config.NextSeq['discovery_processes']
+configs['admission'] = config.NGS580_analysis['admission']
+configs['max_run_age_days'] = config.NextSeq['max_run_age_days']
 
 # ~~~~ LOAD MORE PACKAGES ~~~~~~ #
 import sys
@@ -64,9 +78,24 @@ import getpass
 from datetime import datetime
 from util import tools as t
 from util import find
-from util import mutt
+import outbox
 from util.classes import LoggedObject
-from util.tools import SubprocessCmd
+import catalog
+import parallel
+from snapshot import RunSnapshot
+from snapshot import scan_dir
+import rules
+import fnmatch
+import samplesheet_index
+import deferred_log
+import launcher
+import sge_tracker
+import deadlines
+import demux_stats
+import metrics
+import lease
+import admission
+import run_ids
 
 
 
@@ -96,9 +125,36 @@ class NextSeqRun(LoggedObject):
         '''
         Initialize the logging for the object
         set a run-specific Info log file for email
+        the run's log messages are held, and its log file is not created, until the run is started; see 'open_log'
         '''
         self.logfile = os.path.join(self.config['logdir'], '{0}.{1}.log'.format(self.id, self.config['script_timestamp']))
-        self.logger = log.add_handlers(logger = self.logger, handlers = [log.email_log_filehandler(log_file = self.logfile) ])
+        self.log_handler = deferred_log.defer_handlers(logger = self.logger, handler_factory = lambda: log.email_log_filehandler(log_file = self.logfile))
+
+    def open_log(self):
+        '''
+        Create the run's log file, and write out all of the run's log messages so far
+        '''
+        deferred_log.open_handler(logger = self.logger, handler = self.log_handler)
+        self.log_handler_paths(logger = self.logger, types = ['FileHandler'])
+
+    def log_skipped(self):
+        '''
+        Log a single line to the module log for a run that will not be started, and drop the run's held log messages
+        with 'explain_validations' set, the held messages are written to the main log instead
+        '''
+        failed = [name for name, passed in self.validations.items() if not passed]
+        logger.info('Skipped run {0}; failed validations: {1}'.format(self.id, ', '.join(failed)))
+        if self.config.get('explain_validations', False):
+            self.log_handler.discard(handlers = self.log_handler.handlers)
+        else:
+            self.log_handler.discard()
+
+    def log_deferred(self, reason):
+        '''
+        Log a single line to the module log for a valid run that will be started in a later cycle, and drop the run's held log messages
+        '''
+        logger.info('Deferred run {0}; {1}'.format(self.id, reason))
+        self.log_handler.discard()
 
     def _init_attrs(self):
         '''
@@ -142,8 +198,11 @@ class NextSeqRun(LoggedObject):
 
         # ~~~~ MISC ATTRIBUTES ~~~~~~ #
         self.RTAComplete_time = None
-        self.seqtype = self.get_seqtype(seqtype_file = self.seqtype_file)
+        self.seqtype = None
+        self.demux_stats = None
+        self.snapshot = None
         self.is_valid = False
+        self.validations = {}
 
         self.timestamp = self.config['timestamp']
         self.seqtype_file = os.path.join(self.run_dir, self.config['seqtype_file'])
@@ -163,42 +222,33 @@ class NextSeqRun(LoggedObject):
         else:
             self.command = '{0} {1}'.format(self.start_NGS580_script, self.id)
 
-    def get_seqtype(self, seqtype_file):
+    def get_seqtype(self):
         '''
-        Get the sequencing type from the file
-        only the contents of the first line
+        Get the sequencing type from the run's snapshot
+        only the contents of the first line of the seqtype file
         '''
-        contents = None
-        try:
-            with open(seqtype_file, "rb") as f:
-                contents = f.readlines()[0].strip()
-        except:
-            self.logger.error("Seqtype file could not be read! File:\n{0}\nContents:\n{1}".format(seqtype_file, contents))
+        contents = self.snapshot.seqtype
+        if contents is None:
+            self.logger.error("Seqtype file could not be read! File:\n{0}".format(self.seqtype_file))
         return(contents)
 
     def get_RTAComplete_time(self):
         '''
-        Get the time listed in the contents of the RTAComplete file
+        Get the time listed in the contents of the RTAComplete file, from the run's snapshot
         ex:
         RTA 2.4.11 completed on 5/20/2017 9:47:13 PM
         '''
-        RTA_time = None
-        try:
-            with open(self.RTAComplete_file) as f:
-                for line in f:
-                    RTA_string = line.strip()
-                    break
-            self.logger.debug('RTAComplete_file contents:\n{0}'.format(str(RTA_string)))
-            RTA_time = RTA_string.split("on ")[-1]
-            RTA_time = datetime.strptime(RTA_time, '%m/%d/%Y %I:%M:%S %p')
-        except IOError:
+        RTA_string = self.snapshot.RTAComplete_string
+        if RTA_string is None:
             logger.debug('RTAComplete_file file could not be opened! File: {0}'.format(self.RTAComplete_file))
-        return(RTA_time)
+        else:
+            self.logger.debug('RTAComplete_file contents:\n{0}'.format(str(RTA_string)))
+        return(self.snapshot.RTAComplete_time)
 
     def valiate_RTA_completion_time(self):
         '''
-        Make sure that at least 90 minutes have passed since the RTAcomplete file's stated timestamp
-        90min = 5400 seconds
+        Make sure that the RTA completion window (90 minutes by default) has passed since the RTAcomplete file's stated timestamp
+        the window is the 'RTA_completion_window' config, in seconds
         '''
         self.logger.debug('Validating Basecalling completetion time')
         is_valid = False
@@ -216,9 +266,9 @@ class NextSeqRun(LoggedObject):
             complete_time = self.RTAComplete_time
             td = now - complete_time
             self.logger.info('Time difference: {0}'.format(td))
-            self.logger.debug('Time difference seconds: {0}'.format(td.seconds))
-            if td.seconds > 5400:
-                self.logger.info('More than 90 mintes have passed since run completetion')
+            self.logger.debug('Time difference seconds: {0}'.format(td.total_seconds()))
+            if RTA_completion_time_passed(RTAComplete_time = complete_time, window = self.config['RTA_completion_window'], now = now):
+                self.logger.info('More than {0} seconds have passed since run completetion'.format(self.config['RTA_completion_window']))
                 is_valid = True
             else:
                 self.logger.warning('Not enough time has passed since run completetion, run will NOT be demultiplexed.')
@@ -244,55 +294,85 @@ class NextSeqRun(LoggedObject):
             exists = not exists
         return(exists)
 
-    def validate(self):
+    def validate_seqtype(self):
         '''
-        Check to make sure the run is valid and can be demultiplexed
-        add more criteria
+        Make sure that the run was marked as an NGS580 run by the demultiplexing
         '''
-        self.logger.info("Validating run: {0}".format(self.id))
-        is_valid = False
-
-
-        # check basecalling completion time; at least 90 minutes must have passed
-        RTA_completion_time_validation = self.valiate_RTA_completion_time()
-        unaligned_dir_validation = self.item_exists(item = self.unaligned_dir, item_type = 'dir')
-        self.logger.debug('Unaligned dir exists: {0}'.format(unaligned_dir_validation))
-
-        run_dir_validation = self.item_exists(item = self.run_dir, item_type = 'dir')
-        self.logger.debug('Run dir exists: {0}'.format(run_dir_validation))
-
-        basecalls_dir_validation = self.item_exists(item = self.basecalls_dir, item_type = 'dir')
-        self.logger.debug('Basecalls dir exists: {0}'.format(basecalls_dir_validation))
-
-        RTAComplete_file_validation = self.item_exists(item = self.RTAComplete_file, item_type = 'file')
-        self.logger.debug('RTAComplete file exists: {0}'.format(RTAComplete_file_validation))
+        self.seqtype = self.get_seqtype()
+        is_valid = self.seqtype == 'NGS580'
+        self.logger.debug('seqtype is "NGS580": {0}'.format(is_valid))
+        return(is_valid)
 
-        RunInfo_file_validation = self.item_exists(item = self.RunInfo_file, item_type = 'file')
-        self.logger.debug('RunInfo file exists: {0}'.format(RunInfo_file_validation))
+    def validate_demux_stats(self):
+        '''
+        Make sure that the demultiplexing produced enough reads for each sample, and not too many undetermined reads
+        '''
+        self.demux_stats = demux_stats.get_demux_stats(unaligned_dir = self.unaligned_dir, html_file = self.demultiplex_stats_file)
+        if not self.demux_stats:
+            self.logger.debug('Could not read the demultiplexing stats for the run')
+            return(False)
+        self.logger.debug(demux_stats.describe(self.demux_stats))
+        problems = demux_stats.check_thresholds(stats = self.demux_stats,
+        min_sample_reads = self.config['min_sample_reads'],
+        max_undetermined_fraction = self.config['max_undetermined_fraction'])
+        for problem in problems:
+            self.logger.debug('Demultiplexing stats check failed: {0}'.format(problem))
+        return(not problems)
+
+    def validate(self, explain = None):
+        '''
+        Check to make sure the run is valid and can be started
+        The 'run_rules' are checked from cheapest to most expensive, and checking stops at the
+        first one that fails; with explain = True all of the rules are checked
+        '''
+        if explain is None:
+            explain = self.config.get('explain_validations', False)
+        self.logger.info("Validating run: {0}".format(self.id))
 
-        RunCompletionStatus_file_validation = self.item_exists(item = self.RunCompletionStatus_file, item_type = 'file')
-        self.logger.debug('RunCompletionStatus file exists: {0}'.format(RunCompletionStatus_file_validation))
+        # facts about the run's files are collected in one pass, when the first rule needs them
+        self.snapshot = RunSnapshot(run_dir = self.run_dir, seqtype_file = self.config['seqtype_file'])
+        is_valid, validations = run_rules.evaluate(subject = self, explain = explain)
 
-        seqtype_validation = self.seqtype == 'NGS580'
-        self.logger.debug('seqtype is "NGS580": {0}'.format(seqtype_validation))
+        self.validations = dict(validations)
+        self.logger.debug(self.validations)
+        self.logger.info('All run validations passed: {0}'.format(is_valid))
+        return(is_valid)
 
-        validations = {}
-        validations['RTA_completion_time_validation'] = RTA_completion_time_validation
-        validations['unaligned_dir_validation'] = unaligned_dir_validation
-        validations['run_dir_validation'] = run_dir_validation
-        validations['basecalls_dir_validation'] = basecalls_dir_validation
-        validations['RTAComplete_file_validation'] = RTAComplete_file_validation
-        validations['RunInfo_file_validation'] = RunInfo_file_validation
-        validations['RunCompletionStatus_file_validation'] = RunCompletionStatus_file_validation
-        validations['seqtype_validation'] = seqtype_validation
+    def recheck(self):
+        '''
+        Check the 'recheck_rules' again for a run that was validated in a worker process, just before it is started
+        the facts from the worker's validation are kept, so the rest of the run's files are not read again
+        '''
+        self.logger.info("Checking run again before starting: {0}".format(self.id))
+        self.snapshot = RunSnapshot(run_dir = self.run_dir, seqtype_file = self.config['seqtype_file'])
+        is_valid, validations = recheck_rules.evaluate(subject = self)
+        self.validations.update(validations)
+        self.logger.info('Run validations passed again: {0}'.format(is_valid))
+        return(is_valid)
 
-        # for name, value in validations.items():
-        #     self.logger.debug('{0}: {1}'.format(name, value))
-        self.logger.debug(validations)
+    def get_facts(self):
+        '''
+        Get the facts gathered during the last validation, to save in the run catalog
+        '''
+        facts = {}
+        facts['validations'] = self.validations
+        facts['seqtype'] = self.seqtype
+        facts['RTAComplete_time'] = None
+        if self.RTAComplete_time:
+            facts['RTAComplete_time'] = self.RTAComplete_time.strftime(catalog_time_format)
+        return(facts)
 
-        is_valid = all(validations.values())
-        self.logger.info('All run validations passed: {0}'.format(is_valid))
-        return(is_valid)
+    def set_facts(self, facts):
+        '''
+        Keep the facts from a validation done in a worker process, for the run made again in the monitor process
+        '''
+        self.validations = dict(facts['validations'])
+        self.seqtype = facts['seqtype']
+        self.demux_stats = facts.get('demux_stats')
+        if 'log_records' in facts:
+            # the run's log messages from the worker's validation, in place of the ones held when this run was made again
+            self.log_handler.discard()
+            self.log_handler.import_records(facts['log_records'])
 
     def get_reply_to_address(self, server):
         '''
@@ -304,17 +384,17 @@ class NextSeqRun(LoggedObject):
 
     def email_results(self):
         '''
-        Send an email using the object's INFO log as the body of the message
+        Queue an email using the object's INFO log as the body of the message
         '''
         email_recipients = self.email_recipients
         email_subject_line = self.email_subject_line
         reply_to = self.reply_to
         message_file = log.logger_filepath(logger = self.logger, handler_name = 'emaillog')
 
-        email_command = mutt.mutt_mail(recipient_list = email_recipients, reply_to = reply_to, subject_line = email_subject_line, message = 'This message should have been replaced by the script log file contents. If you are reading it, something broke, sorry', message_file = message_file, return_only_mode = True, quiet = True)
-
-        self.logger.debug('Email command is:\n\n{0}\n\n'.format(email_command))
-        mutt.subprocess_cmd(command = email_command)
+        outbox.get_outbox().put(recipients = email_recipients, reply_to = reply_to, subject = email_subject_line, message_file = message_file)
+        self.logger.debug('Email added to the outbox: {0}'.format(email_subject_line))
+        # the run's log file has been read into the email
+        deferred_log.close_handler(logger = self.logger, handler = self.log_handler)
 
     def mark_analysis_started(self, analysis_started_file, timestamp):
         '''
@@ -327,91 +407,294 @@ class NextSeqRun(LoggedObject):
     def search_for_samples_pairs_sheet(self, id, search_dir, sheet_pattern):
         '''
         Search for a tumor-normal samples pairs samplesheet to match the current sequencing run
+        Uses the shared index of the search dir, so the directory is only listed once per cycle
 
-        from util import find
         search_dir = '/ifs/data/molecpathlab/quicksilver/to_be_demultiplexed/NGS580'
         id = '170824_NB501073_0020_AHHK37BGX3'
         sheet_pattern = '*-samples.pairs.csv'
         '''
-        sheet = []
-        patterns = [ str(id) + '*', sheet_pattern]
-        sheet = find.find(search_dir = search_dir, search_type = 'file', inclusion_patterns = patterns, level_limit = 0, match_mode = 'all')
+        index = samplesheet_index.get_index(search_dir = search_dir)
+        sheet = index.find_run_files(id = id, pattern = sheet_pattern)
         self.logger.debug('Found tumor-normal samplesheet for run {0}: {1}'.format(id, sheet))
         return(sheet)
 
 
 
-    def start(self):
+    def start(self, validate = True):
         '''
         Start the analysis on the run
+        pass validate = False if the run's 'is_valid' attribute has already been set
+        return the launcher.CommandResult for the start script, or None if the run was not started
+        the run is claimed for the task before anything is done, so it is never started twice
         '''
-        self.is_valid = self.validate()
+        if validate:
+            self.is_valid = self.validate()
+        if self.is_valid and not lease.claim_run(run_dir = self.run_dir, task = 'NGS580_analysis'):
+            logger.warning('Run {0} was already claimed for analysis: {1}'.format(self.id, lease.get_claim(run_dir = self.run_dir, task = 'NGS580_analysis')))
+            return(None)
         if self.is_valid:
+            self.open_log()
+            if self.demux_stats:
+                self.logger.info(demux_stats.describe(self.demux_stats))
             self.logger.debug('Start command is:\n\n{0}\n\n'.format(self.command))
-            self.logger.debug('Running command')
-            x = SubprocessCmd(command = self.command)
-            x.run()
-            if x.process.returncode < 1:
-                # self.logger.info('NGS580 script started successfully:\n\n{0}\n\n'.format(x.proc_stdout))
+            result = launcher.run_command(command = self.command, logger = self.logger, timeout = self.config['launch_timeout'])
+            if result.succeeded:
                 self.logger.info('NGS580 script started successfully')
-                self.logger.debug(x.proc_stdout)
                 self.mark_analysis_started(analysis_started_file = self.analysis_started_file, timestamp = self.timestamp)
-                log.log_all_handler_filepaths(logger = self.logger)
-                self.email_results()
+                sge_tracker.track_jobs(run_id = self.id, task = 'NGS580_analysis', output = result.output)
+            elif result.timed_out:
+                self.logger.error('NGS580 script did not finish starting within {0}s and was stopped!!\n\n{1}\n\n'.format(self.config['launch_timeout'], result.output))
             else:
-                self.logger.error('Demultiplexing script may not have started successfully!!\n\n{0}\n\n'.format(x.proc_stdout))
-                log.log_all_handler_filepaths(logger = self.logger)
-                self.email_results()
+                self.logger.error('NGS580 script may not have started successfully!!\n\n{0}\n\n'.format(result.output))
+            if not result.succeeded:
+                # try to start the run again in a later cycle
+                lease.release_claim(run_dir = self.run_dir, task = 'NGS580_analysis')
+            log.log_all_handler_filepaths(logger = self.logger)
+            self.email_results()
+            return(result)
 
         else:
-            log.log_all_handler_filepaths(logger = self.logger)
-            self.logger.error('Run will not be demultiplexed because some validations failed')
+            self.logger.error('Run will not be started because some validations failed')
+            self.log_skipped()
+
+
 
 
 
 
 
 
+# ~~~~ VALIDATION RULES ~~~~~~ #
+# rules that a run must pass to be started; checked by NextSeqRun.validate from cheapest to most expensive
+# the RTA completion time depends on the current time, so it is checked last
+run_rules = rules.RuleSet(rules = [
+rules.Rule(name = 'run_dir_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.run_dir_exists),
+rules.Rule(name = 'claim_validation', cost = rules.COST_STAT, func = lambda run: not run.snapshot.has_file(lease.get_claim_name('NGS580_analysis'))),
+rules.Rule(name = 'RTAComplete_file_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.RTAComplete_file_exists),
+rules.Rule(name = 'RunInfo_file_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.RunInfo_file_exists),
+rules.Rule(name = 'RunCompletionStatus_file_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.RunCompletionStatus_file_exists),
+rules.Rule(name = 'basecalls_dir_validation', cost = rules.COST_SUBDIR, func = lambda run: run.snapshot.basecalls_dir_exists),
+rules.Rule(name = 'unaligned_dir_validation', cost = rules.COST_SUBDIR, func = lambda run: run.snapshot.unaligned_dir_exists),
+rules.Rule(name = 'seqtype_validation', cost = rules.COST_READ, func = lambda run: run.validate_seqtype()),
+rules.Rule(name = 'demux_stats_validation', cost = rules.COST_READ, func = lambda run: run.validate_demux_stats()),
+rules.Rule(name = 'RTA_completion_time_validation', cost = rules.COST_TIME, func = lambda run: run.valiate_RTA_completion_time())
+])
+# rules checked again by NextSeqRun.recheck just before a run is started; another monitor may have claimed the run
+# since it was validated, and the RTA completion time depends on the current time
+recheck_rules = run_rules.select(names = ['claim_validation', 'RTA_completion_time_validation'])
+
+# directory name patterns that correspond to test and debug dirs that should be excluded from the monitoring program
+excludes = [
+"to_be_demultiplexed",
+"automatic_demultiplexing_logs",
+"ArcherRun",
+"run_index",
+"*_test*",
+"*_run_before_sequencing_done*"
+]
+
+# rules for the directory names in a sequencer location, checked from the directory listing alone;
+# names that are not run IDs, and runs older than 'max_run_age_days', are dropped before any other checks
+name_rules = [
+rules.Rule(name = 'run_id_validation', cost = rules.COST_MEMORY, func = lambda name: run_ids.parse(name) is not None),
+rules.Rule(name = 'run_age_validation', cost = rules.COST_MEMORY, func = lambda name: run_ids.parse(name).is_recent(max_age_days = configs['max_run_age_days'])),
+rules.Rule(name = 'exclude_validation', cost = rules.COST_MEMORY, func = lambda name: not any(fnmatch.fnmatch(name, pattern) for pattern in excludes))
+]
 
 
 # ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
-def find_available_NextSeq_runs(sequencer_dir):
+# format for saving datetimes in the run catalog
+catalog_time_format = '%Y-%m-%d %H:%M:%S'
+
+def RTA_completion_time_passed(RTAComplete_time, window, now = None):
+    '''
+    Check if the RTA completion window, in seconds, has passed since the RTAComplete time
+    pass the window from the run's config, so that a location's 'RTA_completion_window' option is used
+    '''
+    return(deadlines.completion_time_passed(RTAComplete_time = RTAComplete_time, window = window, now = now))
+
+def get_run_signature(run_dir):
+    '''
+    Get the catalog signature for a run; the mtimes of the run dir, its BaseCalls dir, and its 'Unaligned/Stats' dir
+    new files in the run dir (e.g. RTAComplete.txt, seqtype.txt), a new 'Unaligned' dir,
+    or new demultiplexing stats will change the signature
+    '''
+    basecalls_dir = os.path.join(run_dir, "Data", "Intensities", "BaseCalls")
+    unaligned_dir = os.path.join(basecalls_dir, "Unaligned")
+    return(catalog.get_signature([run_dir, basecalls_dir, unaligned_dir, os.path.join(unaligned_dir, "Stats")]))
+
+def facts_are_valid(facts, window):
+    '''
+    Check if a run would pass validation, based on the facts saved in the run catalog
+    Only the RTA completion time needs to be checked again with the run's 'window', since it depends on the current time
+    The saved validations stop at the first rule that failed, and the RTA completion time is the last rule checked
+    '''
+    validations = dict(facts['validations'])
+    RTAComplete_time = facts['RTAComplete_time']
+    if RTAComplete_time:
+        RTAComplete_time = datetime.strptime(RTAComplete_time, catalog_time_format)
+        validations['RTA_completion_time_validation'] = RTA_completion_time_passed(RTAComplete_time = RTAComplete_time, window = window)
+    return(all(validations.values()))
+
+def make_run(id, location = None):
     '''
-    Find directories in the sequencer_dir that match
+    Create a NextSeqRun object for the run ID, with the configs for its sequencer location
+    '''
+    return(NextSeqRun(id = id, config = get_run_config(run_id = id, location = location), extra_handlers = [x for x in log.get_all_handlers(logger = logger)]))
+
+def get_run_config(run_id, location = None):
+    '''
+    Get the configs for a run in a sequencer location; the module configs are used for runs without a location
+    '''
+    if location is None:
+        return(configs)
+    return(location.get_run_config(config = configs, run_id = run_id))
+
+def find_available_NextSeq_runs(sequencer_dir, completed_runs = None, run_catalog = None, threads = 1):
+    '''
+    Find directories in the sequencer_dir that are NGS580 runs ready to be started
     sequencer_dir = "/ifs/data/molecpathlab/quicksilver"
-    import find
-    find.find(search_dir = sequencer_dir, search_type = 'dir', level_limit = 0)
+
+    return a list of NextSeqRun objects; see 'check_runs'
+    '''
+    with metrics.span('discovery', task = 'NGS580_analysis'):
+        entries = scan_dir(sequencer_dir) or {}
+    names = [name for name, is_dir in sorted(entries.items()) if is_dir]
+    location = locations.Location(name = 'sequencer_dir', path = sequencer_dir)
+    metrics.increment('runs_scanned', value = len(names), task = 'NGS580_analysis')
+    return(check_runs(names = names, location = location, completed_runs = completed_runs, run_catalog = run_catalog, threads = threads))
+
+def check_runs(names, location, completed_runs = None, run_catalog = None, threads = 1):
+    '''
+    Check the run directories with the given names in a sequencer location, and find the NGS580 runs ready to be started
+
+    Directories are first checked with 'candidate_rules' using only their names;
+    names that are not run IDs, runs older than 'max_run_age_days', and runs that match an exclude
+    pattern or are in 'completed_runs' are skipped without any more filesystem calls. If a run catalog is passed, runs that have not changed since they last
+    failed validation are skipped without creating objects for them or reading their files
+
+    The remaining runs are created and validated in a pool of 'threads' threads
 
     return a list of NextSeqRun objects
     '''
-    # directory name patterns that correspond to test and debug dirs that should be excluded from the monitoring program
-    excludes = [
-    "to_be_demultiplexed",
-    "automatic_demultiplexing_logs",
-    "ArcherRun",
-    "run_index",
-    "*_test*",
-    "*_run_before_sequencing_done*"
-    ]
-    sequencer_dirs = {}
-    for item in find.find(search_dir = sequencer_dir, exclusion_patterns = excludes, search_type = 'dir', level_limit = 0):
-        item_id = os.path.basename(item)
-        sequencer_dirs[item_id] = item
-    runs = [NextSeqRun(id = name, config = configs, extra_handlers = [x for x in log.get_all_handlers(logger = logger)]) for name, path in sequencer_dirs.items()]
+    if completed_runs is None:
+        completed_runs = {}
+    signatures = {}
+
+    def catalog_validation(name):
+        '''
+        Check the run catalog; runs that are new or have changed need to be validated again
+        '''
+        signatures[name] = None
+        if not run_catalog:
+            return(True)
+        signatures[name] = get_run_signature(run_dir = os.path.join(location.get_sequencer_dir(name), name))
+        facts = run_catalog.lookup(id = name, signature = signatures[name])
+        if facts is None:
+            return(True)
+        # the window can be changed by the location's options
+        return(facts_are_valid(facts, window = get_run_config(run_id = name, location = location)['RTA_completion_window']))
+
+    candidate_rules = rules.RuleSet(rules = name_rules + [
+    rules.Rule(name = 'completed_validation', cost = rules.COST_MEMORY, func = lambda name: name not in completed_runs),
+    rules.Rule(name = 'catalog_validation', cost = rules.COST_STAT, func = catalog_validation)
+    ])
+
+    with metrics.span('discovery', task = 'NGS580_analysis'):
+        candidates = []
+        skipped_runs = {}
+        for name in names:
+            is_valid, results = candidate_rules.evaluate(subject = name)
+            if is_valid:
+                candidates.append(name)
+            else:
+                failed_rule = list(results.keys())[-1]
+                skipped_runs[failed_rule] = skipped_runs.get(failed_rule, 0) + 1
+    logger.debug("Runs skipped before validation: {0}".format(skipped_runs))
+    metrics.increment('runs_skipped', value = sum(skipped_runs.values()), task = 'NGS580_analysis')
+
+    with metrics.span('validation', task = 'NGS580_analysis'):
+        runs = parallel.map_threads(func = lambda name: make_run(id = name, location = location), items = candidates, threads = threads)
+        parallel.validate_runs(runs = runs, threads = threads)
+    metrics.increment('runs_skipped', value = len([run for run in runs if not run.is_valid]), task = 'NGS580_analysis')
+    metrics.increment('runs_valid', value = len([run for run in runs if run.is_valid]), task = 'NGS580_analysis')
+    deadlines.schedule_waiting_runs(runs = runs, task = 'NGS580_analysis')
 
     NGS580_runs = []
     for run in runs:
-        if run.validate():
+        if run.is_valid:
             NGS580_runs.append(run)
+        else:
+            run.log_skipped()
+        if run_catalog:
+            run_catalog.update(id = run.id, signature = signatures[run.id], facts = run.get_facts())
     # logger.debug(NGS580_runs)
     return(NGS580_runs)
 
-def find_completed_NGS580_runs(analysis_output_dir):
+def check_shard(shard):
+    '''
+    Check the runs in one shard of a sequencer location; run in a worker process by 'plan_runs'
+    shard is a tuple of (location, run names, completed_runs); the worker uses its own connection to the run catalog
+    return a list of (run ID, facts) for the runs that are ready to be started, since the run objects cannot be sent back from a worker process;
+    the facts include the log records held for each run, so they can be written to the run's log file when it is started
+    '''
+    location, names, completed_runs = shard
+    run_catalog = catalog.RunCatalog(db_file = configs['catalog_file'])
+    try:
+        runs = check_runs(names = names, location = location, completed_runs = completed_runs, run_catalog = run_catalog, threads = configs['validation_threads'])
+    finally:
+        run_catalog.close()
+    return([(run.id, dict(run.get_facts(), demux_stats = run.demux_stats, log_records = run.log_handler.export_records())) for run in runs])
+
+def plan_runs(completed_runs = None, processes = 1):
+    '''
+    Find the NGS580 runs that are ready to be started in all of the sequencer locations
+
+    Each location is listed in its own thread, and the names that fail the 'name_rules' are dropped.
+    The runs left are split into shards by location and instrument, and the shards are checked in a pool
+    of 'processes' processes, so the time taken grows with the largest shard instead of with the total number of runs
+
+    return a list of NextSeqRun objects for the runs that are ready, made again in this process with the facts from their validation
+    '''
+    with metrics.span('discovery', task = 'NGS580_analysis'):
+        listings = parallel.map_threads(func = lambda location: location.list_runs(), items = sequencer_locations, threads = len(sequencer_locations))
+    name_rule_set = rules.RuleSet(rules = name_rules)
+    items = []
+    pruned = 0
+    for location, listing in zip(sequencer_locations, listings):
+        for name in listing:
+            if name_rule_set.evaluate(subject = name)[0]:
+                items.append((location, name))
+            else:
+                pruned += 1
+    logger.debug("Dropped {0} names from the sequencer location listings".format(pruned))
+    # every listed name is counted here, whether it is dropped or checked in a worker process
+    metrics.increment('runs_scanned', value = sum(len(listing) for listing in listings), task = 'NGS580_analysis')
+    metrics.increment('runs_skipped', value = pruned, task = 'NGS580_analysis')
+    shards = locations.make_shards(items)
+    logger.debug("Checking {0} runs in {1} shards: {2}".format(len(items), len(shards), ', '.join('{0}/{1}: {2}'.format(location.name, instrument, len(names)) for location, instrument, names in shards)))
+    with metrics.span('shards', task = 'NGS580_analysis'):
+        results = parallel.map_processes(func = check_shard, items = [(location, names, completed_runs) for location, instrument, names in shards], processes = processes)
+    NGS580_runs = []
+    for (location, instrument, names), ready in zip(shards, results):
+        for run_id, facts in ready:
+            run = make_run(id = run_id, location = location)
+            run.set_facts(facts)
+            NGS580_runs.append(run)
+    return(sorted(NGS580_runs, key = lambda run: run.id))
+
+def find_completed_NGS580_runs(analysis_output_dir, run_catalog = None):
     '''
     Find the NGS580 runs that have been done already
+    If a run catalog is passed, the listing is only searched again when the directory has changed
 
     return a dict of NGS580_dirs[item_id] = item
     '''
+    if run_catalog:
+        NGS580_dirs = run_catalog.get_listing(path = analysis_output_dir)
+        if NGS580_dirs is not None:
+            return(NGS580_dirs)
+        signature = catalog.get_signature([analysis_output_dir])
     excludes = [
     "targets"
     ]
@@ -420,16 +703,24 @@ def find_completed_NGS580_runs(analysis_output_dir):
         item_id = os.path.basename(item)
         NGS580_dirs[item_id] = item
     # logger.debug(NGS580_dirs.items())
+    if run_catalog:
+        run_catalog.update_listing(path = analysis_output_dir, items = NGS580_dirs, signature = signature)
     return(NGS580_dirs)
 
-def start_runs(runs):
+def start_runs(runs, threads = 1):
     '''
-    Run the start method on each run
+    Check the 'recheck_rules' again on each run, then run the start method; the rest of the rules were checked by 'plan_runs'
+    the valid runs are started in priority order, as far as the 'admission' limits allow, and the rest are deferred
     '''
     if len(runs) > 0:
         logger.debug("starting runs: {0}".format(runs))
-    for run in runs:
-        run.start()
+    with metrics.span('validation', task = 'NGS580_analysis'):
+        parallel.validate_runs(runs = runs, threads = threads, method = 'recheck')
+    admitted_runs = admission.admit_runs(runs = [run for run in runs if run.is_valid], task = 'NGS580_analysis', settings = configs['admission'], get_output_dir = lambda run: run.config['analysis_output_dir'])
+    invalid_runs = [run for run in runs if not run.is_valid]
+    with metrics.span('submission', task = 'NGS580_analysis'):
+        results = launcher.map_runs(func = lambda run: run.start(validate = False), runs = admitted_runs + invalid_runs, threads = configs['launch_threads'])
+    metrics.increment('runs_started', value = len([result for result in results if result and result.succeeded]), task = 'NGS580_analysis')
 
 
 
@@ -450,16 +741,14 @@ def main(extra_handlers = None):
     logger.info("Log file path: {0}".format(log.logger_filepath(logger = logger, handler_name = "NGS580_analysis")))
 
     logger.debug("Finding runs...")
-    available_NGS580_runs = find_available_NextSeq_runs(sequencer_dir = sequencer_dir)
-    completed_NGS580_dirs = find_completed_NGS580_runs(analysis_output_dir = analysis_output_dir)
-
-    runs_to_start = []
-    for run in available_NGS580_runs:
-        if run.id not in completed_NGS580_dirs.keys():
-            runs_to_start.append(run)
+    run_catalog = catalog.RunCatalog(db_file = configs['catalog_file'])
+    with metrics.span('discovery', task = 'NGS580_analysis'):
+        completed_NGS580_dirs = find_completed_NGS580_runs(analysis_output_dir = analysis_output_dir, run_catalog = run_catalog)
+    run_catalog.close()
+    runs_to_start = plan_runs(completed_runs = completed_NGS580_dirs, processes = configs['discovery_processes'])
 
     logger.debug("runs_to_start: {0}".format(runs_to_start))
-    start_runs(runs = runs_to_start)
+    start_runs(runs = runs_to_start, threads = configs['validation_threads'])
 
 
 
@@ -472,6 +761,7 @@ def run():
     arg parsing goes here, if program was run as a script
     '''
     main()
+    outbox.send_all()
 
 if __name__ == "__main__":
     run()
@@ -30,8 +30,10 @@ logger.debug("loading NGS580_demultiplexing module")
 
 # ~~~~ GET EXTERNAL CONFIGS ~~~~~~ #
 import config
+import locations
 samplesheet_source_dir = config.NGS580_demultiplexing['samplesheet_source_dir']
-sequencer_dir = config.NextSeq['location']
+sequencer_locations = locations.get_locations(config.NextSeq['locations'])
+sequencer_dir = sequencer_locations[0].path
 demultiplex_580_script = config.NGS580_demultiplexing['script']
 # logdir = config.NGS580_demultiplexing['logdir']
 samplesheet_processed_dir = config.NGS580_demultiplexing['samplesheet_processed_dir']
@@ -60,18 +62,42 @@ configs['script_timestamp'] = script_timestamp
 configs['demultiplexing_started_file'] = demultiplexing_started_file
 configs['seqtype_file'] = config.NGS580_demultiplexing['seqtype_file']
 configs['timestamp'] = file_timestamp
+configs['validation_threads'] = config.NextSeq['validation_threads']
+configs['explain_validations'] = config.NextSeq['explain_validations']
+configs['launch_threads'] = config.NextSeq['launch_threads']
+configs['launch_timeout'] = config.NextSeq['launch_timeout']
+configs['RTA_completion_window'] = config.NextSeq['RTA_completion_window']
+configs['copy_quiet_period'] = config.NextSeq['copy_quiet_period']
+configs['discovery_processes'] = config.NextSeq['discovery_processes']
+configs['admission'] = config.NGS580_demultiplexing['admission']
+configs['barcode_mismatches'] = config.NGS580_demultiplexing['barcode_mismatches']
+configs['resources'] = config.NGS580_demultiplexing['resources']
 
 
 # ~~~~ LOAD MORE PACKAGES ~~~~~~ #
 import shutil
 import sys
-import subprocess as sp
 import getpass
 from datetime import datetime
 from util import tools as t
-from util import find
-from util import mutt
+import outbox
 from util.classes import LoggedObject
+import parallel
+from snapshot import RunSnapshot
+import samplesheet_index
+import rules
+import deferred_log
+import launcher
+import sge_tracker
+import run_metadata
+from samplesheet import read_samplesheet
+import resources
+import deadlines
+import metrics
+import lease
+import admission
+import quiescence
+import time
 
 
 
@@ -85,7 +111,10 @@ class NextSeqRun(LoggedObject):
     - run directory exists
     - Basecalls subdirectory exists
     - RunCompletionStatus.xml, RunInfo.xml, RTAComplete.txt files exist
-    - RTAComplete.txt file contains a timestamp; need to wait at least 90 minutes after timestamp before processing to
+    - RunCompletionStatus.xml shows that the run completed as planned
+    - the samplesheet has no duplicate sample ID's or index collisions
+    - RTAComplete.txt file contains a timestamp; need to wait at least 90 minutes after timestamp, or until the files in
+    the BaseCalls dir stop changing, before processing to
     make sure that all files have been copied over from local machine to storage location for the run
     '''
     def __init__(self, id, samplesheet, config, extra_handlers = None):
@@ -102,13 +131,39 @@ class NextSeqRun(LoggedObject):
         '''
         Initialize the logging for the object
         set a run-specific Info log file for email
+        the run's log messages are held, and its log file is not created, until the run is started; see 'open_log'
         '''
         self.logfile = os.path.join(self.config['logdir'], '{0}.{1}.log'.format(self.id, self.config['script_timestamp']))
-        self.logger = log.add_handlers(logger = self.logger, handlers = [log.email_log_filehandler(log_file = self.logfile) ])
+        self.log_handler = deferred_log.defer_handlers(logger = self.logger, handler_factory = lambda: log.email_log_filehandler(log_file = self.logfile))
 
         self.logger.info("Found NextSeq NGS580 run: {0}".format(self.id))
+
+    def open_log(self):
+        '''
+        Create the run's log file, and write out all of the run's log messages so far
+        '''
+        deferred_log.open_handler(logger = self.logger, handler = self.log_handler)
         self.log_handler_paths(logger = self.logger, types = ['FileHandler'])
 
+    def log_skipped(self):
+        '''
+        Log a single line to the module log for a run that will not be started, and drop the run's held log messages
+        with 'explain_validations' set, the held messages are written to the main log instead
+        '''
+        failed = [name for name, passed in self.validations.items() if not passed]
+        logger.info('Skipped run {0}; failed validations: {1}'.format(self.id, ', '.join(failed)))
+        if self.config.get('explain_validations', False):
+            self.log_handler.discard(handlers = self.log_handler.handlers)
+        else:
+            self.log_handler.discard()
+
+    def log_deferred(self, reason):
+        '''
+        Log a single line to the module log for a valid run that will be started in a later cycle, and drop the run's held log messages
+        '''
+        logger.info('Deferred run {0}; {1}'.format(self.id, reason))
+        self.log_handler.discard()
+
     def _init_attrs(self):
         '''
         Initialize the paths and attributes for items associated with the sequencing run
@@ -138,6 +193,12 @@ class NextSeqRun(LoggedObject):
         # shell command to run to start the demultiplexing script
         self.demultiplex_580_script = self.config['demultiplex_580_script']
         self.command = '{0} {1}'.format(self.demultiplex_580_script, self.id)
+        # cluster resources estimated for the demultiplexing job; see 'estimate_resources'
+        self.resources = None
+        # samples parsed from the samplesheet by 'validate_samplesheet'
+        self.samples = None
+        # metadata from the run's RunInfo.xml file, read during validation
+        self.run_info = None
 
         # metadata file with more info about the run
         self.RunInfo_file = os.path.join(self.run_dir, "RunInfo.xml")
@@ -157,6 +218,10 @@ class NextSeqRun(LoggedObject):
         # ~~~~ MISC ATTRIBUTES ~~~~~~ #
         self.seqtype = self.config['seqtype']
         self.RTAComplete_time = None
+        # time when the run should be checked again if it is not ready yet, in seconds since the epoch
+        self.next_check_time = None
+        self.snapshot = None
+        self.validations = {}
         self.is_valid = False
         self.demultiplexing_started_file = os.path.join(self.run_dir, self.config['demultiplexing_started_file'])
         self.timestamp = self.config['timestamp']
@@ -164,23 +229,18 @@ class NextSeqRun(LoggedObject):
 
     def get_RTAComplete_time(self):
         '''
-        Get the time listed in the contents of the RTAComplete file
+        Get the time listed in the contents of the RTAComplete file, from the run's snapshot
         ex:
         RTA 2.4.11 completed on 5/20/2017 9:47:13 PM
         '''
-        with open(self.RTAComplete_file) as f:
-            for line in f:
-                RTA_string = line.strip()
-                break
-        self.logger.debug('RTAComplete_file contents:\n{0}'.format(str(RTA_string)))
-        RTA_time = RTA_string.split("on ")[-1]
-        RTA_time = datetime.strptime(RTA_time, '%m/%d/%Y %I:%M:%S %p')
-        return(RTA_time)
+        self.logger.debug('RTAComplete_file contents:\n{0}'.format(str(self.snapshot.RTAComplete_string)))
+        return(self.snapshot.RTAComplete_time)
 
     def valiate_RTA_completion_time(self):
         '''
-        Make sure that at least 90 minutes have passed since the RTAcomplete file's stated timestamp
-        90min = 5400 seconds
+        Make sure that the RTA completion window (90 minutes by default) has passed since the RTAcomplete file's stated timestamp
+        the window is the 'RTA_completion_window' config, in seconds
+        Before the window has passed, the run is also valid once its files have finished copying; see 'validate_copy_complete'
         '''
 
         self.logger.debug('Validating Basecalling completetion time')
@@ -194,32 +254,102 @@ class NextSeqRun(LoggedObject):
         self.RTAComplete_time = self.get_RTAComplete_time()
         self.logger.info('RTAComplete_time: {0}'.format(self.RTAComplete_time))
 
-        # check the time difference
-        complete_time = self.RTAComplete_time
-        td = now - complete_time
-        self.logger.info('Time difference: {0}'.format(td))
-        self.logger.debug('Time difference seconds: {0}'.format(td.seconds))
-        if td.seconds > 5400:
-            self.logger.info('More than 90 mintes have passed since run completetion')
-            is_valid = True
+        if self.RTAComplete_time:
+            # check the time difference
+            complete_time = self.RTAComplete_time
+            td = now - complete_time
+            self.logger.info('Time difference: {0}'.format(td))
+            self.logger.debug('Time difference seconds: {0}'.format(td.total_seconds()))
+            if deadlines.completion_time_passed(RTAComplete_time = complete_time, window = self.config['RTA_completion_window'], now = now):
+                self.logger.info('More than {0} seconds have passed since run completetion'.format(self.config['RTA_completion_window']))
+                is_valid = True
+            elif self.validate_copy_complete():
+                is_valid = True
+            else:
+                self.logger.warning('Not enough time has passed since run completetion, run will NOT be demultiplexed.')
         else:
-            self.logger.warning('Not enough time has passed since run completetion, run will NOT be demultiplexed.')
+            self.logger.error('RTAComplete_time is not valid.')
 
         self.logger.info('Run time completetion is valid: {0}'.format(is_valid))
         return(is_valid)
 
-    def validate_unaligned_dir(self, unaligned_dir):
+    def validate_copy_complete(self):
+        '''
+        Check if the files in the BaseCalls dir have stopped changing for the 'copy_quiet_period', meaning that
+        the run has finished copying from the sequencer
+        the manifest of the files is saved between checks, so the first check of a run only starts the quiet period
+        '''
+        quiet_period = self.config['copy_quiet_period']
+        quiet_seconds = quiescence.get_store().update(id = self.id, path = self.basecalls_dir, recent_seconds = quiet_period)
+        self.logger.debug('BaseCalls files have not changed for {0:.0f} seconds'.format(quiet_seconds))
+        if quiet_seconds >= quiet_period:
+            self.logger.info('BaseCalls files have not changed for {0} seconds, the run has finished copying'.format(quiet_period))
+            return(True)
+        self.next_check_time = time.time() + quiet_period - quiet_seconds
+        return(False)
+
+    def validate_claim(self):
+        '''
+        Make sure that the run has not already been claimed for demultiplexing
+        a new samplesheet for a claimed run is logged to the module log, since the run's claim file has to be deleted to demultiplex it again
+        '''
+        if not self.snapshot.has_file(lease.get_claim_name('NGS580_demultiplexing')):
+            return(True)
+        logger.warning('Run {0} has a samplesheet but was already claimed for demultiplexing; delete {1} to demultiplex it again'.format(
+        self.id, lease.get_claim_file(run_dir = self.run_dir, task = 'NGS580_demultiplexing')))
+        return(False)
+
+    def validate_unaligned_dir(self):
         '''
         Make sure that the Unaligned dir does not already exist
         '''
-        self.logger.debug('Validating unaligned_dir: {0}'.format(unaligned_dir))
-        is_valid = False
-        exists = os.path.isdir(unaligned_dir)
+        self.logger.debug('Validating unaligned_dir: {0}'.format(self.unaligned_dir))
+        exists = self.snapshot.unaligned_dir_exists
         self.logger.debug('Unaligned dir exists: {0}'.format(exists))
-        if exists == False:
-            is_valid = True
+        return(not exists)
+
+    def validate_completion_status(self):
+        '''
+        Make sure that the RunCompletionStatus.xml file shows that the run finished sequencing normally,
+        so that runs which ended early or with errors are not demultiplexed
+        '''
+        completion_status = self.snapshot.completion_status
+        if completion_status is None:
+            self.logger.error('RunCompletionStatus.xml file could not be read for run: {0}'.format(self.id))
+            return(False)
+        is_valid = run_metadata.is_completed(completion_status)
+        self.logger.debug('Run completion status: {0}'.format(completion_status['status']))
+        if not is_valid:
+            self.logger.error('Run did not complete successfully; status: {0}, error: {1}'.format(completion_status['status'], completion_status['error_description']))
         return(is_valid)
 
+    def validate_samplesheet(self):
+        '''
+        Check the input samplesheet for duplicate sample ID's and for samples whose indexes bcl2fastq could not
+        tell apart with the allowed 'barcode_mismatches', so that a bad samplesheet is caught before any cluster time is used
+        '''
+        parsed, self.samplesheet_problems = read_samplesheet(path = self.samplesheet, mismatches = self.config['barcode_mismatches'])
+        if parsed:
+            self.samples = parsed['samples']
+        for problem in self.samplesheet_problems:
+            self.logger.error('Samplesheet problem: {0}'.format(problem))
+        return(not self.samplesheet_problems)
+
+    def estimate_resources(self):
+        '''
+        Estimate the cluster resources for demultiplexing the run from the number of samples in its samplesheet,
+        and the cycles and lanes in its RunInfo.xml; these are passed to the demultiplexing script
+        return None if the run's metadata is not available
+        '''
+        run_info = self.run_info
+        if not run_info or not run_info['lane_count'] or not self.samples:
+            self.logger.warning('Could not estimate the resources for demultiplexing run {0}; the script will use its defaults'.format(self.id))
+            return(None)
+        self.resources = resources.estimate_run(samples = len(self.samples), cycles = sum(read['cycles'] for read in run_info['reads']),
+        lanes = run_info['lane_count'], task = 'NGS580_demultiplexing', settings = self.config['resources'])
+        self.logger.info('Estimated resources for demultiplexing: {0}'.format(resources.describe_estimate(self.resources)))
+        return(self.resources)
+
     def item_exists(self, item, item_type = 'any', n = False):
         '''
         Check that an item exists
@@ -237,42 +367,58 @@ class NextSeqRun(LoggedObject):
             exists = not exists
         return(exists)
 
-    def validate(self):
+    def validate(self, explain = None):
         '''
         Check to make sure the run is valid and can be demultiplexed
-        add more criteria
+        The 'run_rules' are checked from cheapest to most expensive, and checking stops at the
+        first one that fails; with explain = True all of the rules are checked
         '''
+        if explain is None:
+            explain = self.config.get('explain_validations', False)
         self.logger.info("Validating run: {0}".format(self.id))
-        is_valid = False
 
-        # check basecalling completion time; at least 90 minutes must have passed
-        RTA_completion_time_validation = self.valiate_RTA_completion_time()
-        unaligned_dir_validation = self.validate_unaligned_dir(unaligned_dir = self.unaligned_dir)
-        run_dir_validation = self.item_exists(item = self.run_dir, item_type = 'dir')
-        basecalls_dir_validation = self.item_exists(item = self.basecalls_dir, item_type = 'dir')
-        RTAComplete_file_validation = self.item_exists(item = self.RTAComplete_file, item_type = 'file')
-        RunInfo_file_validation = self.item_exists(item = self.RunInfo_file, item_type = 'file')
-        RunCompletionStatus_file_validation = self.item_exists(item = self.RunCompletionStatus_file, item_type = 'file')
-        input_samplesheet_validation = self.item_exists(item = self.samplesheet, item_type = 'file')
-
-        validations = {}
-        validations['RTA_completion_time_validation'] = RTA_completion_time_validation
-        validations['unaligned_dir_validation'] = unaligned_dir_validation
-        validations['run_dir_validation'] = run_dir_validation
-        validations['basecalls_dir_validation'] = basecalls_dir_validation
-        validations['RTAComplete_file_validation'] = RTAComplete_file_validation
-        validations['RunInfo_file_validation'] = RunInfo_file_validation
-        validations['RunCompletionStatus_file_validation'] = RunCompletionStatus_file_validation
-        validations['input_samplesheet_validation'] = input_samplesheet_validation
-
-        # for name, value in validations.items():
-        #     self.logger.debug('{0}: {1}'.format(name, value))
-
-        self.logger.debug(validations)
-        is_valid = all(validations.values())
+        # facts about the run's files are collected in one pass, when the first rule needs them
+        self.snapshot = RunSnapshot(run_dir = self.run_dir, seqtype_file = self.config['seqtype_file'])
+        is_valid, validations = run_rules.evaluate(subject = self, explain = explain)
+
+        self.validations = validations
+        self.run_info = self.snapshot.run_info
+        if self.run_info:
+            self.logger.info('Run info: {0}'.format(run_metadata.describe_run_info(self.run_info)))
+        self.logger.debug(dict(validations))
         self.logger.info('All run validations passed: {0}'.format(is_valid))
         return(is_valid)
 
+    def recheck(self):
+        '''
+        Check the 'recheck_rules' again for a run that was validated in a worker process, just before it is started
+        the facts from the worker's validation are kept, so the rest of the run's files are not read again
+        '''
+        self.logger.info("Checking run again before starting: {0}".format(self.id))
+        self.snapshot = RunSnapshot(run_dir = self.run_dir, seqtype_file = self.config['seqtype_file'])
+        is_valid, validations = recheck_rules.evaluate(subject = self)
+        self.validations.update(validations)
+        self.logger.info('Run validations passed again: {0}'.format(is_valid))
+        return(is_valid)
+
+    def get_facts(self):
+        '''
+        Get the facts gathered during the last validation that are needed to start the run
+        '''
+        return({'validations': self.validations, 'run_info': self.run_info, 'samples': self.samples})
+
+    def set_facts(self, facts):
+        '''
+        Keep the facts from a validation done in a worker process, for the run made again in the monitor process
+        '''
+        self.validations = facts['validations']
+        self.run_info = facts['run_info']
+        self.samples = facts['samples']
+        if 'log_records' in facts:
+            # the run's log messages from the worker's validation, in place of the ones held when this run was made again
+            self.log_handler.discard()
+            self.log_handler.import_records(facts['log_records'])
+
     def set_new_samplesheet(self, input_samplesheet, output_samplesheet):
         '''
         Copy the input samplesheet to the output path; backup any existing files at that path
@@ -285,33 +431,44 @@ class NextSeqRun(LoggedObject):
         '''
         Run the demultiplexing command for the run
         mark whether it started in the run
+        return the launcher.CommandResult for the command
         '''
-        self.logger.debug('Demultiplexing command is:\n\n{}\n\n'.format(self.command))
         command = self.command
+        if self.resources:
+            command = resources.format_command(command = self.command, estimate = self.resources)
+        self.logger.debug('Demultiplexing command is:\n\n{}\n\n'.format(command))
         #  run the shell command to start the demult script
-        process = sp.Popen(command, stdout = sp.PIPE, shell = True, universal_newlines = True)
-        proc_stdout = process.communicate()[0]
-        if process.returncode < 1:
-            self.logger.info('Demultiplexing script started successfully:\n\n{0}\n\n'.format(proc_stdout.strip()))
+        result = launcher.run_command(command = command, logger = self.logger, timeout = self.config['launch_timeout'])
+        if result.succeeded:
+            self.logger.info('Demultiplexing script started successfully:\n\n{0}\n\n'.format(result.output.strip()))
+            if self.resources:
+                resources.get_history().add_estimate(run_id = self.id, task = 'NGS580_demultiplexing', estimate = self.resources)
             self.mark_demultiplexing_started(demultiplexing_started_file = self.demultiplexing_started_file, timestamp = self.timestamp)
+            sge_tracker.track_jobs(run_id = self.id, task = 'NGS580_demultiplexing', output = result.output)
+        elif result.timed_out:
+            self.logger.error('Demultiplexing script did not finish starting within {0}s and was stopped!!\n\n{1}\n\n'.format(self.config['launch_timeout'], result.output.strip()))
         else:
-            self.logger.error('Demultiplexing script may not have started successfully!!\n\n{0}\n\n'.format(proc_stdout.strip()))
+            self.logger.error('Demultiplexing script may not have started successfully!!\n\n{0}\n\n'.format(result.output.strip()))
+        if not result.succeeded:
+            # the run can be demultiplexed again once a new samplesheet is put in place
+            lease.release_claim(run_dir = self.run_dir, task = 'NGS580_demultiplexing')
         self.move_samplesheet_to_processed(samplesheet = self.samplesheet, processed_dir = self.samplesheet_processed_dir)
         self.email_results()
+        return(result)
 
     def email_results(self):
         '''
-        Send an email using the object's INFO log as the body of the message
+        Queue an email using the object's INFO log as the body of the message
         '''
         email_recipients = self.email_recipients
         email_subject_line = self.email_subject_line
         reply_to = self.reply_to
         message_file = log.logger_filepath(logger = self.logger, handler_name = 'emaillog')
 
-        email_command = mutt.mutt_mail(recipient_list = email_recipients, reply_to = reply_to, subject_line = email_subject_line, message = 'This message should have been replaced by the script log file contents. If you are reading it, something broke, sorry', message_file = message_file, return_only_mode = True, quiet = True)
-
-        self.logger.debug('Email command is:\n\n{0}\n\n'.format(email_command))
-        mutt.subprocess_cmd(command = email_command)
+        outbox.get_outbox().put(recipients = email_recipients, reply_to = reply_to, subject = email_subject_line, message_file = message_file)
+        self.logger.debug('Email added to the outbox: {0}'.format(email_subject_line))
+        # the run's log file has been read into the email
+        deferred_log.close_handler(logger = self.logger, handler = self.log_handler)
 
     def get_reply_to_address(self, server):
         '''
@@ -354,22 +511,54 @@ mv {0} {1}
         with open(demultiplexing_started_file, 'w') as f:
             f.write(timestamp)
 
-    def start(self):
+    def start(self, validate = True):
         '''
         Start the demultiplexing for the run
+        pass validate = False if the run's 'is_valid' attribute has already been set
+        return the launcher.CommandResult for the demultiplexing script, or None if the run was not started
+        the run is claimed for the task before anything is done, so it is never started twice
         '''
-        self.is_valid = self.validate()
+        if validate:
+            self.is_valid = self.validate()
+        if self.is_valid and not lease.claim_run(run_dir = self.run_dir, task = 'NGS580_demultiplexing'):
+            logger.warning('Run {0} was already claimed for demultiplexing: {1}'.format(self.id, lease.get_claim(run_dir = self.run_dir, task = 'NGS580_demultiplexing')))
+            return(None)
         if self.is_valid:
+            self.open_log()
+            quiescence.get_store().remove(id = self.id)
             self.set_new_samplesheet(input_samplesheet = self.samplesheet, output_samplesheet = self.samplesheet_output_file)
             self.mark_run_seqtype(seqtype = self.seqtype, seqtype_file = self.seqtype_file)
-            self.submit_demultiplexing()
+            self.estimate_resources()
+            return(self.submit_demultiplexing())
         else:
             self.logger.error('Run will not be demultiplexed because some validations failed')
+            self.log_skipped()
+
+
 
 
 
 
 
+# ~~~~ VALIDATION RULES ~~~~~~ #
+# rules that a run must pass to be demultiplexed; checked by NextSeqRun.validate from cheapest to most expensive
+# the RTA completion time depends on the current time, so it is checked last
+run_rules = rules.RuleSet(rules = [
+rules.Rule(name = 'input_samplesheet_validation', cost = rules.COST_STAT, func = lambda run: run.item_exists(item = run.samplesheet, item_type = 'file')),
+rules.Rule(name = 'run_dir_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.run_dir_exists),
+rules.Rule(name = 'claim_validation', cost = rules.COST_STAT, func = lambda run: run.validate_claim()),
+rules.Rule(name = 'RTAComplete_file_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.RTAComplete_file_exists),
+rules.Rule(name = 'RunInfo_file_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.RunInfo_file_exists),
+rules.Rule(name = 'RunCompletionStatus_file_validation', cost = rules.COST_STAT, func = lambda run: run.snapshot.RunCompletionStatus_file_exists),
+rules.Rule(name = 'basecalls_dir_validation', cost = rules.COST_SUBDIR, func = lambda run: run.snapshot.basecalls_dir_exists),
+rules.Rule(name = 'unaligned_dir_validation', cost = rules.COST_SUBDIR, func = lambda run: run.validate_unaligned_dir()),
+rules.Rule(name = 'samplesheet_validation', cost = rules.COST_READ, func = lambda run: run.validate_samplesheet()),
+rules.Rule(name = 'RunCompletionStatus_validation', cost = rules.COST_READ, func = lambda run: run.validate_completion_status()),
+rules.Rule(name = 'RTA_completion_time_validation', cost = rules.COST_TIME, func = lambda run: run.valiate_RTA_completion_time())
+])
+# rules checked again by NextSeqRun.recheck just before a run is started; another monitor may have claimed the run
+# since it was validated, and the RTA completion time depends on the current time
+recheck_rules = run_rules.select(names = ['claim_validation', 'RTA_completion_time_validation'])
 
 
 # ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
@@ -387,28 +576,92 @@ def find_samplesheets():
     '''
     # global samplesheet_source_dir
     file_pattern = "*-SampleSheet.csv"
-    samplesheet_files = [item for item in find.find(search_dir = samplesheet_source_dir, inclusion_patterns = file_pattern, search_type = 'file', level_limit = 1)]
+    index = samplesheet_index.get_index(search_dir = samplesheet_source_dir)
+    samplesheet_files = index.find_files(pattern = file_pattern, max_depth = 1)
     logger.debug("Samplesheets found: {0}".format(samplesheet_files))
     return(samplesheet_files)
 
-def make_runs(samplesheets):
+def get_run_config(run_id, location = None):
+    '''
+    Get the configs for a run in a sequencer location; the module configs are used for runs without a location
+    '''
+    if location is None:
+        return(configs)
+    return(location.get_run_config(config = configs, run_id = run_id))
+
+def make_runs(samplesheets, location = None):
     '''
-    Create NextSeqRun objects from a list of samplesheet files
+    Create NextSeqRun objects from a list of samplesheet files, for runs in the sequencer location
     '''
     logger.debug("making runs for samplesheets: {0}".format(samplesheets))
     runs = []
     for samplesheet in samplesheets:
         runID = get_runID(samplesheet_file = samplesheet)
         logger.debug("runID is: {0}".format(runID))
-        runs.append(NextSeqRun(id = runID, samplesheet = samplesheet, config = configs, extra_handlers = [x for x in log.get_all_handlers(logger = logger)]))
+        runs.append(NextSeqRun(id = runID, samplesheet = samplesheet, config = get_run_config(run_id = runID, location = location), extra_handlers = [x for x in log.get_all_handlers(logger = logger)]))
     return(runs)
 
-def start_runs(runs):
+def check_shard(shard):
     '''
-    Run the validation method on each run
+    Validate the runs for one shard of samplesheets; run in a worker process by 'plan_runs'
+    shard is a tuple of (location, samplesheets); runs that are not ready yet are scheduled to be checked again,
+    and the runs that failed validation are logged as skipped
+    return a list of (samplesheet, facts) for the runs that are ready, since the run objects cannot be sent back from a worker process;
+    the facts include the log records held for each run, so they can be written to the run's log file when it is started
     '''
+    location, samplesheets = shard
+    runs = make_runs(samplesheets = samplesheets, location = location)
+    with metrics.span('validation', task = 'NGS580_demultiplexing'):
+        parallel.validate_runs(runs = runs, threads = configs['validation_threads'])
+    valid_runs = [run for run in runs if run.is_valid]
+    metrics.increment('runs_valid', value = len(valid_runs), task = 'NGS580_demultiplexing')
+    metrics.increment('runs_skipped', value = len(runs) - len(valid_runs), task = 'NGS580_demultiplexing')
+    deadlines.schedule_waiting_runs(runs = runs, task = 'NGS580_demultiplexing')
     for run in runs:
-        run.start()
+        if not run.is_valid:
+            run.logger.error('Run will not be demultiplexed because some validations failed')
+            run.log_skipped()
+    return([(run.samplesheet, dict(run.get_facts(), log_records = run.log_handler.export_records())) for run in valid_runs])
+
+def plan_runs(samplesheets, processes = 1):
+    '''
+    Find the runs for the samplesheets that are ready to be demultiplexed
+
+    Each run is looked for in all of the sequencer locations. The runs are split into shards by location
+    and instrument, and the shards are checked in a pool of 'processes' processes, so the time taken grows
+    with the largest shard instead of with the total number of runs
+
+    return a list of NextSeqRun objects for the runs that are ready, made again in this process with the facts from their validation
+    '''
+    items = []
+    for samplesheet in samplesheets:
+        runID = get_runID(samplesheet_file = samplesheet)
+        items.append((locations.find_run_location(locations = sequencer_locations, run_id = runID), runID, samplesheet))
+    shards = locations.make_shards(items)
+    logger.debug("Checking {0} runs in {1} shards".format(len(items), len(shards)))
+    with metrics.span('shards', task = 'NGS580_demultiplexing'):
+        results = parallel.map_processes(func = check_shard, items = [(location, shard_samplesheets) for location, instrument, shard_samplesheets in shards], processes = processes)
+    runs = []
+    for (location, instrument, shard_samplesheets), ready in zip(shards, results):
+        shard_runs = make_runs(samplesheets = [samplesheet for samplesheet, facts in ready], location = location)
+        for run, (samplesheet, facts) in zip(shard_runs, ready):
+            run.set_facts(facts)
+        runs.extend(shard_runs)
+    return(sorted(runs, key = lambda run: run.id))
+
+def start_runs(runs):
+    '''
+    Start the runs that are ready to be demultiplexed
+    only the 'recheck_rules' are checked again just before each run is started, since the rest were checked by 'plan_runs';
+    the valid runs are started in priority order, as far as the 'admission' limits allow, and the rest are deferred
+    '''
+    with metrics.span('validation', task = 'NGS580_demultiplexing'):
+        parallel.validate_runs(runs = runs, threads = configs['validation_threads'], method = 'recheck')
+    admitted_runs = admission.admit_runs(runs = [run for run in runs if run.is_valid], task = 'NGS580_demultiplexing', settings = configs['admission'], get_output_dir = lambda run: run.run_dir)
+    invalid_runs = [run for run in runs if not run.is_valid]
+    with metrics.span('submission', task = 'NGS580_demultiplexing'):
+        results = launcher.map_runs(func = lambda run: run.start(validate = False), runs = admitted_runs + invalid_runs, threads = configs['launch_threads'])
+    metrics.increment('runs_started', value = len([result for result in results if result and result.succeeded]), task = 'NGS580_demultiplexing')
 
 
 def main(extra_handlers = None):
@@ -425,10 +678,12 @@ def main(extra_handlers = None):
         logger.debug(h.get_name())
     logger.info("Current time: {0}".format(t.timestamp()))
     logger.info("Log file path: {0}".format(log.logger_filepath(logger = logger, handler_name = "NGS580_demultiplexing.email")))
-    samplesheets = find_samplesheets()
-    logger.debug("samplesheets found: {0}".format(samplesheets))
-    runs = make_runs(samplesheets = samplesheets)
-    logger.debug("Runs found: {0}".format([run.id for run in runs]))
+    with metrics.span('discovery', task = 'NGS580_demultiplexing'):
+        samplesheets = find_samplesheets()
+        logger.debug("samplesheets found: {0}".format(samplesheets))
+    metrics.increment('runs_scanned', value = len(samplesheets), task = 'NGS580_demultiplexing')
+    runs = plan_runs(samplesheets = samplesheets, processes = configs['discovery_processes'])
+    logger.debug("Runs ready: {0}".format([run.id for run in runs]))
     start_runs(runs = runs)
 
 
@@ -438,6 +693,7 @@ def run():
     arg parsing goes here, if program was run as a script
     '''
     main()
+    outbox.send_all()
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Admission control for starting the runs' demultiplexing and analysis scripts
+
+The runs that passed validation are put in priority order: runs matching a pattern in the 'priorities'
+setting first, then the oldest RTAComplete time first. Each run is then admitted only if:
+- the task has fewer than 'max_in_flight_runs' runs with queued or running cluster jobs, counting the runs admitted in this cycle
+- the cluster queue, from one 'qstat -u *' call, has fewer than 'max_queue_depth' jobs from all users
+- the filesystem the run's output will be written to has at least 'min_free_gb' GB free (os.statvfs)
+
+Runs that are not admitted are deferred; they are not claimed or started, and are checked again after
+'retry_interval' seconds or in the next cycle. A limit of 0 turns that check off.
+
+admitted = admit_runs(runs = valid_runs, task = 'NGS580_analysis', settings = configs['admission'], get_output_dir = lambda run: run.config['analysis_output_dir'])
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("admission")
+logger.debug("loading admission module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import time
+import fnmatch
+from datetime import datetime
+import sge_tracker
+import deadlines
+import metrics
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_priority(run_id, priorities):
+    '''
+    Get the priority of a run from the 'priorities' setting, a dict of run ID patterns to priorities; 0 if no pattern matches
+    '''
+    matches = [priority for pattern, priority in priorities.items() if fnmatch.fnmatch(run_id, pattern)]
+    return(max(matches) if matches else 0)
+
+def sort_runs(runs, priorities = None):
+    '''
+    Put the runs in the order they should be started; highest priority first, then the oldest RTAComplete time first
+    runs without an RTAComplete time go last
+    '''
+    priorities = priorities or {}
+    return(sorted(runs, key = lambda run: (-get_priority(run.id, priorities), run.RTAComplete_time or datetime.max, run.id)))
+
+def get_free_gb(path):
+    '''
+    Get the free space on the filesystem that holds the path, in GB; the path does not need to exist yet
+    return None if the space could not be checked
+    '''
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try:
+        stats = os.statvfs(path)
+    except (OSError, AttributeError):
+        return(None)
+    return(stats.f_bavail * stats.f_frsize / float(1024 ** 3))
+
+def count_in_flight_runs(task):
+    '''
+    Count the runs for a task that have cluster jobs that are queued or running; see sge_tracker.JobTracker.get_in_flight_runs
+    '''
+    return(len(sge_tracker.get_tracker().get_in_flight_runs(task = task)))
+
+def get_queue_depth():
+    '''
+    Get the number of jobs in the cluster queue; None if qstat could not be run
+    '''
+    return(sge_tracker.get_tracker().get_queue_depth())
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class Admission(object):
+    '''
+    Decide which of the runs for a task can be started in this cycle
+
+    admission = Admission(task = 'NGS580_demultiplexing', settings = configs['admission'], in_flight = 2, queue_depth = 150)
+    admitted, deferred = admission.admit(runs = runs, get_output_dir = lambda run: run.run_dir)
+
+    'in_flight' and 'queue_depth' are looked up from the job tracker and qstat when they are not given,
+    and only if their limits are set
+    '''
+    def __init__(self, task, settings, in_flight = None, queue_depth = None, get_free_gb = get_free_gb):
+        self.task = task
+        self.settings = settings
+        self.in_flight = in_flight
+        self.queue_depth = queue_depth
+        self.get_free_gb = get_free_gb
+        self.free_gb = {}
+
+    def check_cluster(self):
+        '''
+        Check the limits that apply to every run of the task
+        return the reason for deferring the runs, or None if runs can be admitted
+        '''
+        max_in_flight_runs = self.settings['max_in_flight_runs']
+        if max_in_flight_runs:
+            if self.in_flight is None:
+                self.in_flight = count_in_flight_runs(task = self.task)
+            if self.in_flight >= max_in_flight_runs:
+                return('{0} runs already have cluster jobs in progress (max_in_flight_runs: {1})'.format(self.in_flight, max_in_flight_runs))
+        max_queue_depth = self.settings['max_queue_depth']
+        if max_queue_depth:
+            if self.queue_depth is None:
+                self.queue_depth = get_queue_depth()
+            if self.queue_depth is not None and self.queue_depth >= max_queue_depth:
+                return('{0} jobs are in the cluster queue (max_queue_depth: {1})'.format(self.queue_depth, max_queue_depth))
+        return(None)
+
+    def check_space(self, output_dir):
+        '''
+        Check that the filesystem for a run's output has enough free space; each path is only checked once
+        return the reason for deferring the run, or None if there is enough space
+        '''
+        min_free_gb = self.settings['min_free_gb']
+        if not min_free_gb:
+            return(None)
+        if output_dir not in self.free_gb:
+            self.free_gb[output_dir] = self.get_free_gb(output_dir)
+        free_gb = self.free_gb[output_dir]
+        if free_gb is not None and free_gb < min_free_gb:
+            return('only {0:.0f} GB free for {1} (min_free_gb: {2})'.format(free_gb, output_dir, min_free_gb))
+        return(None)
+
+    def admit(self, runs, get_output_dir):
+        '''
+        Split the runs into the runs that can be started now, and the runs that are deferred
+        return a list of the admitted runs in priority order, and a list of (run, reason) for the deferred runs
+        '''
+        admitted = []
+        deferred = []
+        for run in sort_runs(runs = runs, priorities = self.settings['priorities']):
+            reason = self.check_cluster() or self.check_space(output_dir = get_output_dir(run))
+            if reason:
+                deferred.append((run, reason))
+                continue
+            admitted.append(run)
+            if self.in_flight is not None:
+                self.in_flight += 1
+        return(admitted, deferred)
+
+
+def admit_runs(runs, task, settings, get_output_dir):
+    '''
+    Get the runs that can be started now, in priority order
+    the deferred runs are logged, and scheduled to be checked again after 'retry_interval' seconds
+    '''
+    admitted, deferred = Admission(task = task, settings = settings).admit(runs = runs, get_output_dir = get_output_dir)
+    due = time.time() + settings['retry_interval']
+    for run, reason in deferred:
+        run.log_deferred(reason = reason)
+        deadlines.get_queue().schedule(task = task, run_id = run.id, due = due)
+    metrics.increment('runs_deferred', value = len(deferred), task = task)
+    return(admitted)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the run discovery and validation for the NGS580 monitors
+
+Runs each phase of the NGS580 demultiplexing and analysis monitors against a synthetic sequencer tree
+(see synthetic_tree.py), and records how long each phase took and how many filesystem calls it made.
+The results are appended as one JSON line per benchmark to a results file, with the git version of the
+code, so that the results can be compared across versions.
+
+Phases:
+- demux_find_samplesheets: index the samplesheet dir and find the samplesheets
+- demux_make_runs: create the run objects for the samplesheets
+- demux_validate: validate the runs
+- analysis_find_completed: list the analysis output dir
+- analysis_find_runs_cold: find and validate the runs ready for analysis with an empty run catalog
+- analysis_find_runs_warm: the same, with the catalog filled by the cold pass
+- analysis_plan_runs: find the runs ready for analysis, split by instrument across a pool of 'processes' processes
+
+The filesystem calls are counted with metrics.CallCounter, by wrapping the Python functions that make them
+(os.stat, os.lstat, os.listdir, scandir, and open), so calls made by other programs or by C extensions are not counted.
+Calls made in the worker processes of 'analysis_plan_runs' are not counted either.
+
+Usage:
+python benchmark.py --runs 5000 --label "before catalog change"
+python benchmark.py --tree /tmp/quicksilver_tree --threads 8
+python benchmark.py --runs 5000 --processes 4
+python benchmark.py --compare
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("benchmark")
+logger.debug("loading benchmark module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess as sp
+from collections import OrderedDict
+import synthetic_tree
+from metrics import CallCounter
+
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+default_output = os.path.join(scriptdir, 'benchmarks', 'results.jsonl')
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_version():
+    '''
+    Get the git version of the code, e.g. '2282790-dirty'; None if it is not in a git repo
+    '''
+    try:
+        process = sp.Popen(['git', 'describe', '--always', '--dirty'], cwd = scriptdir, stdout = sp.PIPE, stderr = sp.PIPE, universal_newlines = True)
+        stdout, stderr = process.communicate()
+    except OSError:
+        return(None)
+    if process.returncode != 0:
+        return(None)
+    return(stdout.strip())
+
+def time_phase(results, name, func):
+    '''
+    Run one phase of the benchmark, and save its time and filesystem call counts to the results
+    return the value returned by the phase
+    '''
+    with CallCounter() as counter:
+        start = time.time()
+        value = func()
+        seconds = time.time() - start
+    items = len(value) if hasattr(value, '__len__') else None
+    results[name] = OrderedDict([('seconds', round(seconds, 4)), ('items', items), ('calls', counter.total), ('call_counts', counter.counts)])
+    logger.info("{0}: {1:.3f}s, {2} items, {3} filesystem calls".format(name, seconds, items, counter.total))
+    return(value)
+
+def configure_modules(layout, db_dir, threads):
+    '''
+    Point the NGS580 monitor modules at the synthetic tree, with their databases in a temporary dir
+    return the demultiplexing and analysis modules
+    '''
+    import NGS580_demultiplexing
+    import NGS580_analysis
+    import deadlines
+    import quiescence
+    import locations
+    from util import log
+    for module in [NGS580_demultiplexing, NGS580_analysis]:
+        module.sequencer_locations = [locations.Location(name = 'synthetic', path = layout['sequencer_dir'])]
+        module.configs['sequencer_dir'] = layout['sequencer_dir']
+        module.configs['samplesheet_source_dir'] = layout['samplesheet_source_dir']
+        module.configs['validation_threads'] = threads
+        # the runs' messages are held until a run is started, so only the modules' own handlers need to be removed
+        log.remove_all_handlers(logger = module.logger)
+    NGS580_demultiplexing.samplesheet_source_dir = layout['samplesheet_source_dir']
+    NGS580_demultiplexing.configs['samplesheet_processed_dir'] = layout['samplesheet_processed_dir']
+    NGS580_analysis.configs['catalog_file'] = os.path.join(db_dir, 'run_catalog.sqlite')
+    # keep the benchmark's waiting runs and manifests out of the monitors' databases
+    deadlines._queue = deadlines.DeadlineQueue(db_file = os.path.join(db_dir, 'deadlines.sqlite'))
+    quiescence._store = quiescence.ManifestStore(db_file = os.path.join(db_dir, 'manifests.sqlite'))
+    return(NGS580_demultiplexing, NGS580_analysis)
+
+def run_benchmark(layout, db_dir, threads = 1, processes = 1):
+    '''
+    Run all of the phases of the benchmark on a synthetic tree
+    return a dict of results[phase] = {'seconds': ..., 'items': ..., 'calls': ..., 'call_counts': {...}}
+    '''
+    import catalog
+    import parallel
+    import samplesheet_index
+    demux, analysis = configure_modules(layout = layout, db_dir = db_dir, threads = threads)
+    results = OrderedDict()
+
+    samplesheet_index.reset()
+    samplesheets = time_phase(results, 'demux_find_samplesheets', lambda: demux.find_samplesheets())
+    runs = time_phase(results, 'demux_make_runs', lambda: demux.make_runs(samplesheets = samplesheets))
+    time_phase(results, 'demux_validate', lambda: parallel.validate_runs(runs = runs, threads = threads) or runs)
+
+    run_catalog = catalog.RunCatalog(db_file = os.path.join(db_dir, 'run_catalog.sqlite'))
+    completed_runs = time_phase(results, 'analysis_find_completed', lambda: analysis.find_completed_NGS580_runs(analysis_output_dir = layout['analysis_output_dir'], run_catalog = run_catalog))
+    for name in ['analysis_find_runs_cold', 'analysis_find_runs_warm']:
+        samplesheet_index.reset()
+        time_phase(results, name, lambda: analysis.find_available_NextSeq_runs(sequencer_dir = layout['sequencer_dir'], completed_runs = completed_runs, run_catalog = run_catalog, threads = threads))
+    run_catalog.close()
+    samplesheet_index.reset()
+    time_phase(results, 'analysis_plan_runs', lambda: analysis.plan_runs(completed_runs = completed_runs, processes = processes))
+    return(results)
+
+def save_results(output, record):
+    '''
+    Append the results of a benchmark to the results file, as one line of JSON
+    '''
+    parent = os.path.dirname(output)
+    if parent and not os.path.isdir(parent):
+        os.makedirs(parent)
+    with open(output, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    logger.info("Results saved to {0}".format(output))
+
+def load_results(output):
+    '''
+    Get all of the saved benchmark results
+    '''
+    records = []
+    if not os.path.exists(output):
+        return(records)
+    with open(output) as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line, object_pairs_hook = OrderedDict))
+    return(records)
+
+def format_comparison(records):
+    '''
+    Make a table of the seconds and filesystem calls for each phase of the saved benchmarks
+    '''
+    phases = []
+    for record in records:
+        for phase in record['phases']:
+            if phase not in phases:
+                phases.append(phase)
+    lines = []
+    for record in records:
+        lines.append('{0} {1} ({2}, {3} runs, {4} threads, {5} processes)'.format(record['timestamp'], record['version'], record['label'] or '-', record['runs'], record['threads'], record.get('processes', 1)))
+        for phase in phases:
+            result = record['phases'].get(phase)
+            if result:
+                lines.append('    {0:<28} {1:>10.3f}s {2:>10} calls'.format(phase, result['seconds'], result['calls']))
+    return('\n'.join(lines))
+
+def main(n_runs = 1000, tree = None, threads = 1, processes = 1, seed = 0, label = None, output = default_output):
+    '''
+    Make a synthetic tree if one was not given, run the benchmark on it, and save the results
+    '''
+    tmpdir = tempfile.mkdtemp(prefix = 'lyz_benchmark_')
+    try:
+        if tree is None:
+            tree = os.path.join(tmpdir, 'tree')
+            logger.info("Making a synthetic tree with {0} runs".format(n_runs))
+            synthetic_tree.make_tree(root = tree, n_runs = n_runs, seed = seed)
+        else:
+            n_runs = None
+        layout = synthetic_tree.get_layout(tree)
+        db_dir = os.path.join(tmpdir, 'db')
+        os.makedirs(db_dir)
+        record = OrderedDict()
+        record['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        record['version'] = get_version()
+        record['label'] = label
+        record['python'] = platform.python_version()
+        record['tree'] = tree
+        record['runs'] = n_runs
+        record['seed'] = seed
+        record['threads'] = threads
+        record['processes'] = processes
+        record['phases'] = run_benchmark(layout = layout, db_dir = db_dir, threads = threads, processes = processes)
+        save_results(output = output, record = record)
+    finally:
+        shutil.rmtree(tmpdir)
+    return(record)
+
+def run():
+    '''
+    Run the benchmark from the command line arguments
+    '''
+    parser = argparse.ArgumentParser(description = 'Benchmark the NGS580 run discovery and validation on a synthetic sequencer tree')
+    parser.add_argument("--runs", default = 1000, type = int, dest = 'n_runs', help = "Number of runs in the synthetic tree")
+    parser.add_argument("--tree", default = None, dest = 'tree', help = "Existing tree made with synthetic_tree.py to use instead of making a new one")
+    parser.add_argument("--threads", default = 1, type = int, dest = 'threads', help = "Number of threads to validate runs with")
+    parser.add_argument("--processes", default = 1, type = int, dest = 'processes', help = "Number of processes to check the shards of runs with in the 'analysis_plan_runs' phase")
+    parser.add_argument("--seed", default = 0, type = int, dest = 'seed', help = "Random seed for the synthetic tree")
+    parser.add_argument("--label", default = None, dest = 'label', help = "Label to save with the results")
+    parser.add_argument("--output", default = default_output, dest = 'output', help = "File to append the results to")
+    parser.add_argument("--compare", default = False, action = 'store_true', dest = 'compare', help = "Print the saved results instead of running the benchmark")
+    args = parser.parse_args()
+    # only show the benchmark's own messages; the monitors' messages would be too verbose here
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.INFO)
+    for module_logger in [logger, synthetic_tree.logger]:
+        module_logger.setLevel(logging.INFO)
+        module_logger.addHandler(handler)
+        module_logger.propagate = False
+    if args.compare:
+        print(format_comparison(load_results(args.output)))
+        return
+    main(n_runs = args.n_runs, tree = args.tree, threads = args.threads, processes = args.processes, seed = args.seed, label = args.label, output = args.output)
+
+if __name__ == "__main__":
+    run()
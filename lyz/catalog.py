@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Persistent on-disk catalog of sequencing run directories
+
+Each run is stored by its ID along with the modification times of its directories
+('signature') and the facts that were gathered the last time the run was validated.
+Runs whose signature has not changed since then can be evaluated from the catalog without
+opening any of their files.
+
+Directory listings (e.g. the analysis output directory) can be cached the same way.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("catalog")
+logger.debug("loading catalog module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def connect(db_file):
+    '''
+    Open a connection to the SQLite database file, creating its parent directory if needed
+    '''
+    parent_dir = os.path.dirname(os.path.abspath(db_file))
+    if not os.path.isdir(parent_dir):
+        os.makedirs(parent_dir)
+    connection = sqlite3.connect(db_file, timeout = 60, check_same_thread = False)
+    return(connection)
+
+def get_mtime(path):
+    '''
+    Get the modification time of a file or directory, or None if it does not exist
+    '''
+    try:
+        return(os.stat(path).st_mtime)
+    except OSError:
+        return(None)
+
+def get_signature(paths):
+    '''
+    Get the 'signature' of a list of paths; the list of their modification times
+    Adding or removing an entry in a directory updates its mtime, so the signature changes
+    whenever items are created in the watched directories
+    '''
+    return([get_mtime(path) for path in paths])
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class RunCatalog(object):
+    '''
+    SQLite backed catalog of run directories and their cached validation facts
+
+    catalog = RunCatalog(db_file = 'db/run_catalog.sqlite')
+    signature = get_signature([run_dir, basecalls_dir])
+    facts = catalog.lookup(id = run_id, signature = signature)
+    if facts is None:
+        # run is new or has changed; validate it and save the results
+        catalog.update(id = run_id, signature = signature, facts = {...})
+
+    signatures that were modified less than 'min_age' seconds ago are never trusted, since
+    the directory could still be changing within the filesystem's mtime resolution
+    '''
+    def __init__(self, db_file, min_age = 60):
+        self.db_file = db_file
+        self.min_age = min_age
+        self.lock = threading.Lock()
+        self.connection = connect(db_file)
+        self._init_tables()
+
+    def _init_tables(self):
+        '''
+        Create the database tables if they do not exist yet
+        '''
+        with self.lock:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, signature TEXT, facts TEXT, updated REAL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS listings (path TEXT PRIMARY KEY, signature TEXT, items TEXT, updated REAL)')
+            self.connection.commit()
+
+    def is_settled(self, signature):
+        '''
+        Check that a signature can be trusted; its first (parent) path exists and none of its
+        paths were modified within the last 'min_age' seconds
+        '''
+        if not signature or signature[0] is None:
+            return(False)
+        return(time.time() - max(mtime for mtime in signature if mtime is not None) > self.min_age)
+
+    def _get(self, table, key_name, value_name, key, signature):
+        '''
+        Get the JSON value saved for the key if the saved signature matches the current one
+        '''
+        if not self.is_settled(signature):
+            return(None)
+        query = 'SELECT signature, {0} FROM {1} WHERE {2} = ?'.format(value_name, table, key_name)
+        with self.lock:
+            row = self.connection.execute(query, (key, )).fetchone()
+        if row is None:
+            return(None)
+        saved_signature, value = row
+        if json.loads(saved_signature) != signature:
+            return(None)
+        return(json.loads(value))
+
+    def _set(self, table, key, signature, value):
+        '''
+        Save the JSON value and signature for the key
+        '''
+        query = 'INSERT OR REPLACE INTO {0} VALUES (?, ?, ?, ?)'.format(table)
+        with self.lock:
+            self.connection.execute(query, (key, json.dumps(signature), json.dumps(value), time.time()))
+            self.connection.commit()
+
+    def lookup(self, id, signature):
+        '''
+        Get the cached facts for a run; returns None if the run is not in the catalog or has changed
+        '''
+        facts = self._get(table = 'runs', key_name = 'id', value_name = 'facts', key = id, signature = signature)
+        if facts is not None:
+            logger.debug('Catalog hit for run {0}'.format(id))
+        return(facts)
+
+    def update(self, id, signature, facts):
+        '''
+        Save the facts gathered for a run
+        '''
+        self._set(table = 'runs', key = id, signature = signature, value = facts)
+
+    def get_listing(self, path):
+        '''
+        Get the cached directory listing for a path; returns None if the directory has changed
+        '''
+        return(self._get(table = 'listings', key_name = 'path', value_name = 'items', key = path, signature = get_signature([path])))
+
+    def update_listing(self, path, items, signature = None):
+        '''
+        Save the directory listing for a path
+        pass the signature that was taken before listing the directory, so that changes made
+        while it was being listed will invalidate the saved listing
+        '''
+        if signature is None:
+            signature = get_signature([path])
+        self._set(table = 'listings', key = path, signature = signature, value = items)
+
+    def close(self):
+        '''
+        Close the database connection
+        '''
+        with self.lock:
+            self.connection.close()
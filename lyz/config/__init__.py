@@ -3,6 +3,13 @@
 '''
 Configurations module
 
+Loads each .yml file listed in the schema, checks it against the schema, and makes it available
+as an attribute of this module, e.g. config.NextSeq['discovery_processes']. All of the configs are also
+available together in the 'sections' dict.
+
+The validated configs are cached in a pickle file, which is used until any of the .yml files change,
+so that the YAML only has to be parsed again after an edit.
+
 Developed and tested with Python 2.7
 '''
 # ~~~~~ LOGGING ~~~~~~ #
@@ -13,25 +20,84 @@ logger.debug("loading config module")
 # ~~~~~ SETUP ~~~~~~ #
 import yaml
 import os
+import pickle
+from .schema import schema, validate, ConfigError
 
 scriptdir = os.path.dirname(os.path.realpath(__file__))
+cache_file = os.path.join(scriptdir, '.config_cache.pickle')
 
-logger.debug("loading configurations...")
-with open(os.path.join(scriptdir, "misc.yml"), "r") as f:
-    misc = yaml.load(f)
+def get_source_files():
+    '''
+    Get the paths to the .yml files for all of the config sections
+    '''
+    return(dict((name, os.path.join(scriptdir, '{0}.yml'.format(name))) for name in schema.keys()))
 
-with open(os.path.join(scriptdir, "NextSeq.yml"), "r") as f:
-    NextSeq = yaml.load(f)
+def get_cache_key(source_files):
+    '''
+    Get the modification times and sizes of the .yml files, to check if the cache is still current
+    '''
+    key = {}
+    # the schema is part of the key, so new required keys are checked as soon as they are added
+    for name, path in list(source_files.items()) + [('schema', os.path.join(scriptdir, 'schema.py'))]:
+        stat = os.stat(path)
+        key[name] = (stat.st_mtime, stat.st_size)
+    return(key)
 
-with open(os.path.join(scriptdir, "NGS580_demultiplexing.yml"), "r") as f:
-    NGS580_demultiplexing = yaml.load(f)
+def load_cache(cache_key):
+    '''
+    Load the cached configs if they were made from the current .yml files; otherwise return None
+    '''
+    try:
+        with open(cache_file, "rb") as f:
+            cache = pickle.load(f)
+    except Exception:
+        return(None)
+    if cache.get('key') != cache_key:
+        return(None)
+    return(cache['sections'])
 
-with open(os.path.join(scriptdir, 'NGS580_analysis.yml'), "r") as f:
-    NGS580_analysis = yaml.load(f)
+def save_cache(cache_key, sections):
+    '''
+    Save the configs to the cache file; write to a temporary file first so the cache is never half written
+    '''
+    tmp_file = '{0}.{1}.tmp'.format(cache_file, os.getpid())
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump({'key': cache_key, 'sections': sections}, f, protocol = 2)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        logger.debug("could not save config cache file: {0}".format(cache_file))
 
-with open(os.path.join(scriptdir, 'IT50_analysis.yml'), "r") as f:
-    IT50_analysis = yaml.load(f)
+def load_sections():
+    '''
+    Load and validate all of the config files
+    '''
+    source_files = get_source_files()
+    try:
+        cache_key = get_cache_key(source_files)
+    except OSError as e:
+        raise ConfigError("config file could not be found: {0}".format(e.filename))
+    sections = load_cache(cache_key)
+    if sections is not None:
+        logger.debug("loaded configurations from cache")
+        return(sections)
+    sections = {}
+    for name, path in source_files.items():
+        with open(path, "r") as f:
+            sections[name] = yaml.safe_load(f)
+        validate(name = name, values = sections[name], section_schema = schema[name])
+    save_cache(cache_key, sections)
+    return(sections)
+
+logger.debug("loading configurations...")
+sections = load_sections()
 
+misc = sections['misc']
+NextSeq = sections['NextSeq']
+NGS580_demultiplexing = sections['NGS580_demultiplexing']
+NGS580_analysis = sections['NGS580_analysis']
+IT50_analysis = sections['IT50_analysis']
+monitor = sections['monitor']
 
 
 # logger.debug(misc)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Required keys and value types for each of the config files
+
+Each entry in 'schema' is the name of a .yml file in this directory, mapped to the keys it must contain.
+A nested dict describes the required keys of a nested section, and a list holding a dict describes
+a list of sections that each have those keys.
+Add the keys for new settings here when they are added to the .yml files.
+'''
+import logging
+logger = logging.getLogger("config")
+
+try:
+    string_type = basestring
+except NameError:
+    string_type = str
+
+number_type = (int, float)
+
+schema = {
+'misc': {
+    'email_recipients_file': string_type,
+    'nextseq_dir': string_type,
+    'run_monitor_log_dir': string_type,
+    'script_dir': string_type
+    },
+'NextSeq': {
+    'locations': [{
+        'name': string_type,
+        'path': string_type,
+        'layout': string_type,
+        'options': dict
+        }],
+    'discovery_processes': int,
+    'max_run_age_days': int,
+    'validation_threads': int,
+    'explain_validations': bool,
+    'launch_threads': int,
+    'launch_timeout': number_type,
+    'RTA_completion_window': number_type,
+    'copy_quiet_period': number_type
+    },
+'NGS580_demultiplexing': {
+    'samplesheet_source_dir': string_type,
+    'samplesheet_processed_dir': string_type,
+    'script': string_type,
+    'email_recipients': string_type,
+    'reply_to_servername': string_type,
+    'seqtype': string_type,
+    'seqtype_file': string_type,
+    'demultiplexing_started_file': string_type,
+    'barcode_mismatches': int,
+    'resources': {
+        'cpu_minutes_per_cycle_lane': number_type,
+        'cpu_minutes_per_sample': number_type,
+        'target_runtime_minutes': number_type,
+        'min_slots': int,
+        'max_slots': int,
+        'base_runtime_minutes': number_type,
+        'base_memory_gb': number_type,
+        'memory_gb_per_slot': number_type,
+        'memory_gb_per_sample': number_type,
+        'max_memory_gb': number_type,
+        'memory_headroom': number_type,
+        'runtime_headroom': number_type,
+        'calibration_runs': int,
+        'min_calibration_runs': int
+        },
+    'admission': {
+        'max_in_flight_runs': int,
+        'max_queue_depth': int,
+        'min_free_gb': number_type,
+        'retry_interval': number_type,
+        'priorities': dict
+        }
+    },
+'NGS580_analysis': {
+    'script': string_type,
+    'analysis_output_dir': string_type,
+    'email_recipients': string_type,
+    'reply_to_servername': string_type,
+    'seqtype_file': string_type,
+    'analysis_started_file': string_type,
+    'samples_pairs_sheet_pattern': string_type,
+    'samplesheet_source_dir': string_type,
+    'min_sample_reads': int,
+    'max_undetermined_fraction': number_type,
+    'admission': {
+        'max_in_flight_runs': int,
+        'max_queue_depth': int,
+        'min_free_gb': number_type,
+        'retry_interval': number_type,
+        'priorities': dict
+        }
+    },
+'IT50_analysis': {
+    'pipeline_dir': string_type,
+    'code_dir': string_type,
+    'email_recipients': string_type,
+    'reply_to_servername': string_type,
+    'samplesheet_script': string_type,
+    'run_script': string_type,
+    'mail_script': string_type
+    },
+'monitor': {
+    'tasks': list,
+    'daemon': {
+        'poll_interval': number_type,
+        'full_cycle_interval': number_type,
+        'settle_time': number_type
+        },
+    'log_retention': {
+        'archive_after_days': number_type,
+        'delete_after_days': number_type,
+        'max_archive_mb': number_type
+        },
+    'notifications': {
+        'outbox_dir': string_type,
+        'mutt': string_type,
+        'digest': bool,
+        'max_attempts': int,
+        'retry_interval': number_type,
+        'max_retry_interval': number_type,
+        'send_timeout': number_type
+        },
+    'sge_tracking': {
+        'qstat': string_type,
+        'qacct': string_type,
+        'accounting_days': int
+        },
+    'deadlines': {
+        'max_cron_wait': number_type
+        },
+    'metrics': {
+        'json_file': string_type,
+        'prometheus_file': string_type,
+        'count_filesystem_calls': bool
+        },
+    'lease': {
+        'path': string_type,
+        'ttl': number_type,
+        'heartbeat_interval': number_type
+        }
+    }
+}
+
+
+class ConfigError(Exception):
+    '''
+    Raised when a config file is missing a required key, or has a value of the wrong type
+    '''
+    pass
+
+
+def validate(name, values, section_schema, path = None):
+    '''
+    Check that the values loaded from a config file have all the keys in the schema, with the right types
+    raises ConfigError for the first problem found
+    '''
+    if path is None:
+        path = name + '.yml'
+    if not isinstance(values, dict):
+        raise ConfigError("{0}: expected a mapping of settings, found: {1}".format(path, repr(values)))
+    for key, value_type in sorted(section_schema.items()):
+        if key not in values:
+            raise ConfigError("{0}: missing required key '{1}'".format(path, key))
+        value = values[key]
+        if isinstance(value_type, dict):
+            validate(name = name, values = value, section_schema = value_type, path = '{0}: {1}'.format(path, key))
+        elif isinstance(value_type, list):
+            if not isinstance(value, list) or not value:
+                raise ConfigError("{0}: key '{1}' should be a list with at least one item: {2}".format(path, key, repr(value)))
+            for i, item in enumerate(value):
+                validate(name = name, values = item, section_schema = value_type[0], path = '{0}: {1}[{2}]'.format(path, key, i))
+        elif not isinstance(value, value_type):
+            raise ConfigError("{0}: key '{1}' has the wrong type of value: {2}".format(path, key, repr(value)))
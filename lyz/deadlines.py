@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Persistent queue of the times when waiting runs become ready to start
+
+A run is not started until a set time (the 'RTA completion window', 90 minutes by default) has passed
+since the time in its RTAComplete.txt file. Instead of waiting for the next monitor cycle, the time when
+each waiting run becomes ready is saved here with the task that should check it, and the monitor wakes
+up at the earliest of these deadlines to run that task again.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("deadlines")
+logger.debug("loading deadlines module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import time
+import threading
+from datetime import datetime
+from catalog import connect
+
+_queue = None
+_lock = threading.Lock()
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def completion_time_passed(RTAComplete_time, window, now = None):
+    '''
+    Check if more than 'window' seconds have passed since the RTAComplete time
+    '''
+    if now is None:
+        now = datetime.now()
+    td = now - RTAComplete_time
+    return(td.total_seconds() > window)
+
+def get_ready_time(RTAComplete_time, window):
+    '''
+    Get the time when a run will be ready to start, in seconds since the epoch
+    the RTAComplete time is in local time
+    '''
+    return(time.mktime(RTAComplete_time.timetuple()) + window)
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class DeadlineQueue(object):
+    '''
+    SQLite backed priority queue of the times when runs should be checked again by a task
+
+    queue = DeadlineQueue(db_file = 'db/deadlines.sqlite')
+    queue.schedule(task = 'NGS580_demultiplexing', run_id = run.id, due = get_ready_time(run.RTAComplete_time, 5400))
+    queue.next_deadline()
+    queue.pop_due()
+    '''
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.connection = connect(db_file)
+        self._init_tables()
+
+    def _init_tables(self):
+        '''
+        Create the deadlines table if it does not exist
+        '''
+        with self.lock:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS deadlines (task TEXT, run_id TEXT, due REAL, PRIMARY KEY (task, run_id))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS deadlines_due ON deadlines (due)')
+            self.connection.commit()
+
+    def close(self):
+        '''
+        Close the connection to the database
+        '''
+        self.connection.close()
+
+    def schedule(self, task, run_id, due):
+        '''
+        Save the time when a task should check a run again; replaces any earlier time for the run
+        '''
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO deadlines (task, run_id, due) VALUES (?, ?, ?)', (task, str(run_id), due))
+            self.connection.commit()
+        logger.debug("Run {0} will be checked by {1} at {2}".format(run_id, task, datetime.fromtimestamp(due)))
+
+    def next_deadline(self):
+        '''
+        Get the earliest deadline in the queue, or None if the queue is empty
+        '''
+        with self.lock:
+            return(self.connection.execute('SELECT MIN(due) FROM deadlines').fetchone()[0])
+
+    def pop_due(self, now = None):
+        '''
+        Remove all of the deadlines that have passed from the queue
+        return a dict of due_runs[task] = [run_id, ...]
+        '''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            rows = self.connection.execute('SELECT task, run_id FROM deadlines WHERE due <= ? ORDER BY due', (now,)).fetchall()
+            self.connection.execute('DELETE FROM deadlines WHERE due <= ?', (now,))
+            self.connection.commit()
+        due_runs = {}
+        for task, run_id in rows:
+            due_runs.setdefault(task, []).append(run_id)
+        return(due_runs)
+
+
+def get_queue():
+    '''
+    Get the deadline queue shared by all of the modules
+    '''
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = DeadlineQueue(db_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'db', 'deadlines.sqlite'))
+        return(_queue)
+
+def schedule_waiting_runs(runs, task):
+    '''
+    Save the ready times of the runs that only failed validation because their RTA completion window has not passed yet
+    each run's window is the 'RTA_completion_window' in its config, which can be changed by the run's sequencer location
+    '''
+    queue = get_queue()
+    # never schedule a run in the past, e.g. if its local RTAComplete time is off around a daylight saving time change
+    earliest = time.time() + 60
+    for run in runs:
+        if run.is_valid or not run.RTAComplete_time:
+            continue
+        failed = [name for name, passed in run.validations.items() if not passed]
+        if failed == ['RTA_completion_time_validation']:
+            due = get_ready_time(RTAComplete_time = run.RTAComplete_time, window = run.config['RTA_completion_window'])
+            # the run might be ready sooner, e.g. when its files finish copying
+            if getattr(run, 'next_check_time', None):
+                due = min(due, run.next_check_time)
+            queue.schedule(task = task, run_id = run.id, due = max(due, earliest))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Logging handler that holds records in memory until it is known whether they are needed
+
+Used for the per-run loggers; most runs found in each cycle are skipped, so their log records are
+only written out, and their log files only created, once the run takes an action such as starting
+a script or sending an email.
+
+The per-run loggers are shared by every object made for the same run ID, e.g. in each cycle of the daemon,
+so a DeferredHandler left on a logger by an earlier object is discarded when a new one is made, instead of
+being wrapped by it, and the log file handler of an opened DeferredHandler is closed once the run's email is queued.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("deferred_log")
+logger.debug("loading deferred_log module")
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class DeferredHandler(logging.Handler):
+    '''
+    Handler that holds all the records it receives until it is opened or discarded
+
+    When opened, the held records and all later records are sent to 'handlers', and to the handler
+    made by 'handler_factory' (e.g. a new log file handler)
+
+    handler = DeferredHandler(handlers = logger.handlers, handler_factory = lambda: log.email_log_filehandler(log_file = logfile))
+    ...
+    open_handler(logger = logger, handler = handler) # creates the log file and writes the records
+    '''
+    def __init__(self, handlers = None, handler_factory = None, name = None):
+        logging.Handler.__init__(self)
+        self.handlers = list(handlers or [])
+        self.handler_factory = handler_factory
+        self.records = []
+        self.targets = None
+        # the handler made by 'handler_factory' when the handler was opened
+        self.factory_handler = None
+        if name:
+            self.set_name(name)
+
+    def emit(self, record):
+        if self.targets is None:
+            self.records.append(record)
+        else:
+            self.send(record = record, targets = self.targets)
+
+    def send(self, record, targets):
+        '''
+        Pass a record to each target handler that it is at or above the level of
+        '''
+        for target in targets:
+            if record.levelno >= target.level:
+                target.handle(record)
+
+    def open(self):
+        '''
+        Create the factory handler, and send all of the held records to the target handlers
+        return the list of target handlers
+        '''
+        if self.targets is None:
+            targets = list(self.handlers)
+            if self.handler_factory:
+                self.factory_handler = self.handler_factory()
+                targets.append(self.factory_handler)
+            for record in self.records:
+                self.send(record = record, targets = targets)
+            self.records = []
+            self.targets = targets
+        return(self.targets)
+
+    def discard(self, handlers = None):
+        '''
+        Drop all of the held records; send them to 'handlers' first, if passed
+        '''
+        if handlers:
+            for record in self.records:
+                self.send(record = record, targets = handlers)
+        self.records = []
+
+    def export_records(self):
+        '''
+        Get the held records as picklable dicts with their messages already formatted, e.g. to send them back from a worker process
+        '''
+        exported = []
+        for record in self.records:
+            fields = dict(record.__dict__)
+            fields['msg'] = record.getMessage()
+            fields['args'] = None
+            if record.exc_info:
+                fields['exc_text'] = logging.Formatter().formatException(record.exc_info)
+            fields['exc_info'] = None
+            exported.append(fields)
+        return(exported)
+
+    def import_records(self, records):
+        '''
+        Handle the records from 'export_records' as if they had been logged here
+        '''
+        for fields in records:
+            self.handle(logging.makeLogRecord(fields))
+
+    def close_factory_handler(self):
+        '''
+        Close the handler made by 'handler_factory', and stop sending records to it
+        return the closed handler, or None if the handler was not opened
+        '''
+        factory_handler = self.factory_handler
+        if factory_handler is not None:
+            if self.targets and factory_handler in self.targets:
+                self.targets.remove(factory_handler)
+            factory_handler.close()
+            self.factory_handler = None
+        return(factory_handler)
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def defer_handlers(logger, handler_factory = None, name = 'deferred'):
+    '''
+    Move all of a logger's handlers behind a DeferredHandler
+    a DeferredHandler already on the logger is discarded, and its handlers are moved behind the new one
+    return the DeferredHandler
+    '''
+    handlers = []
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if isinstance(handler, DeferredHandler):
+            handler.discard()
+            handler.close_factory_handler()
+            inner_handlers = handler.handlers
+        else:
+            inner_handlers = [handler]
+        for inner_handler in inner_handlers:
+            if inner_handler not in handlers:
+                handlers.append(inner_handler)
+    deferred_handler = DeferredHandler(handlers = handlers, handler_factory = handler_factory, name = name)
+    logger.addHandler(deferred_handler)
+    return(deferred_handler)
+
+def open_handler(logger, handler):
+    '''
+    Open a DeferredHandler, and replace it in the logger with its target handlers
+    return the list of target handlers
+    '''
+    targets = handler.open()
+    if handler in logger.handlers:
+        logger.removeHandler(handler)
+        for target in targets:
+            logger.addHandler(target)
+    return(targets)
+
+def close_handler(logger, handler):
+    '''
+    Remove the handler made by an opened DeferredHandler's factory from the logger and close it, once the run's
+    log file is no longer needed; the logger keeps the other target handlers
+    '''
+    factory_handler = handler.close_factory_handler()
+    if factory_handler is not None and factory_handler in logger.handlers:
+        logger.removeHandler(factory_handler)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Demultiplexing statistics for NextSeq runs
+
+The number of reads for each sample, and the fraction of the reads that could not be assigned to
+any sample ('Undetermined'), are read from the 'Stats/Stats.json' file that bcl2fastq writes in the
+run's 'Unaligned' directory. If there is no Stats.json, the lane barcode table in the run's
+Demultiplex_Stats.htm report is used instead; the report is parsed a block at a time, and reading
+stops at the end of the table, so the rest of the report is never read.
+
+Stats.json:
+{
+  "ConversionResults": [
+    {
+      "LaneNumber": 1,
+      "DemuxResults": [{"SampleId": "SC-SERACARE", "NumberReads": 4000000, ...}, ...],
+      "Undetermined": {"NumberReads": 200000, ...}
+    }, ...
+
+Demultiplex_Stats.htm:
+<table>
+<tr><th>Lane</th><th>Project</th><th>Sample</th><th>Barcode sequence</th><th>PF Clusters</th>...
+<tr><td>1</td><td>NGS580</td><td>SC-SERACARE</td><td>ACGTACGT</td><td>4,000,000</td>...
+<tr><td>1</td><td>default</td><td>Undetermined</td><td>unknown</td><td>200,000</td>...
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("demux_stats")
+logger.debug("loading demux_stats module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+try:
+    from HTMLParser import HTMLParser
+except ImportError:
+    from html.parser import HTMLParser
+
+# column names used for the samples and their read counts in the different versions of the report
+sample_columns = ['Sample', 'Sample ID', 'SampleId']
+reads_columns = ['PF Clusters', '# Reads', 'Clusters', 'NumberReads']
+# sample names used for the reads that did not match any sample
+undetermined_names = ['Undetermined', 'unknown']
+
+# size of the blocks that the HTML report is read in
+read_size = 65536
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class LaneBarcodeTableParser(HTMLParser):
+    '''
+    Get the sample names and read counts from the first table in an HTML report that has both
+    a sample column and a read count column
+
+    parser = LaneBarcodeTableParser()
+    parser.feed(text)
+    parser.rows # [['SC-SERACARE', '4,000,000'], ...]
+    '''
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.rows = []
+        self.done = False
+        self.columns = None
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'tr':
+            self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            self._cell = []
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag in ('td', 'th') and self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self._end_row(self._row)
+            self._row = None
+        elif tag == 'table' and self.columns is not None:
+            # the rest of the report has other tables that are not needed
+            self.done = True
+
+    def _end_row(self, row):
+        if self.columns is None:
+            sample_column = [i for i, name in enumerate(row) if name in sample_columns]
+            reads_column = [i for i, name in enumerate(row) if name in reads_columns]
+            if sample_column and reads_column:
+                self.columns = (sample_column[0], reads_column[0])
+            return
+        sample_column, reads_column = self.columns
+        if len(row) > max(sample_column, reads_column):
+            self.rows.append([row[sample_column], row[reads_column]])
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def summarize(sample_reads, undetermined_reads, source):
+    '''
+    Make the summary of the demultiplexing stats from the number of reads for each sample
+
+    return a dict with the keys 'samples' (samples[sample] = reads), 'undetermined_reads', 'total_reads',
+    'undetermined_fraction', and 'source'
+    '''
+    total_reads = sum(sample_reads.values()) + undetermined_reads
+    undetermined_fraction = None
+    if total_reads:
+        undetermined_fraction = float(undetermined_reads) / total_reads
+    stats = {
+    'samples': sample_reads,
+    'undetermined_reads': undetermined_reads,
+    'total_reads': total_reads,
+    'undetermined_fraction': undetermined_fraction,
+    'source': source
+    }
+    return(stats)
+
+def parse_stats_json(path):
+    '''
+    Get the read counts for each sample, summed over all lanes, from a bcl2fastq Stats.json file
+    '''
+    with open(path) as f:
+        data = json.load(f)
+    sample_reads = {}
+    undetermined_reads = 0
+    for lane in data['ConversionResults']:
+        for result in lane.get('DemuxResults', []):
+            sample = result['SampleId']
+            sample_reads[sample] = sample_reads.get(sample, 0) + int(result['NumberReads'])
+        undetermined = lane.get('Undetermined') or {}
+        undetermined_reads += int(undetermined.get('NumberReads', 0))
+    return(summarize(sample_reads = sample_reads, undetermined_reads = undetermined_reads, source = path))
+
+def parse_stats_html(path):
+    '''
+    Get the read counts for each sample, summed over all lanes, from the lane barcode table in a Demultiplex_Stats.htm report
+    return None if the report does not have a lane barcode table
+    '''
+    parser = LaneBarcodeTableParser()
+    with open(path) as f:
+        while not parser.done:
+            text = f.read(read_size)
+            if not text:
+                break
+            parser.feed(text)
+    if parser.columns is None:
+        return(None)
+    sample_reads = {}
+    undetermined_reads = 0
+    for sample, reads in parser.rows:
+        reads = int(reads.replace(',', '') or 0)
+        if sample in undetermined_names:
+            undetermined_reads += reads
+        else:
+            sample_reads[sample] = sample_reads.get(sample, 0) + reads
+    return(summarize(sample_reads = sample_reads, undetermined_reads = undetermined_reads, source = path))
+
+def get_demux_stats(unaligned_dir, html_file = None):
+    '''
+    Get the demultiplexing stats for a run from its Stats.json file, or from its HTML report if there is no Stats.json
+    return None if neither file could be read
+    '''
+    stats_json = os.path.join(unaligned_dir, 'Stats', 'Stats.json')
+    if html_file is None:
+        html_file = os.path.join(unaligned_dir, 'Demultiplex_Stats.htm')
+    for path, parser in [(stats_json, parse_stats_json), (html_file, parse_stats_html)]:
+        if not os.path.isfile(path):
+            continue
+        try:
+            stats = parser(path)
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            logger.debug("Could not parse demultiplexing stats file {0}: {1}".format(path, e))
+            continue
+        if stats:
+            return(stats)
+    return(None)
+
+def check_thresholds(stats, min_sample_reads = 0, max_undetermined_fraction = 1.0):
+    '''
+    Check the demultiplexing stats against the thresholds for starting the analysis
+
+    return a list of the problems found; empty if all of the thresholds were met
+    '''
+    problems = []
+    if not stats['samples']:
+        problems.append('no samples were demultiplexed')
+    for sample, reads in sorted(stats['samples'].items()):
+        if reads < min_sample_reads:
+            problems.append('sample {0} has {1} reads; the minimum is {2}'.format(sample, reads, min_sample_reads))
+    if stats['undetermined_fraction'] is not None and stats['undetermined_fraction'] > max_undetermined_fraction:
+        problems.append('{0:.1%} of the reads were undetermined; the maximum is {1:.1%}'.format(stats['undetermined_fraction'], max_undetermined_fraction))
+    return(problems)
+
+def describe(stats):
+    '''
+    Get a summary of the demultiplexing stats for the logs and the notification email
+    '''
+    lines = ['Demultiplexing stats ({0}):'.format(os.path.basename(stats['source']))]
+    for sample, reads in sorted(stats['samples'].items()):
+        lines.append('    {0}: {1:,} reads'.format(sample, reads))
+    lines.append('    Undetermined: {0:,} reads'.format(stats['undetermined_reads']))
+    lines.append('    Total: {0:,} reads'.format(stats['total_reads']))
+    if stats['undetermined_fraction'] is not None:
+        lines.append('    Undetermined fraction: {0:.1%}'.format(stats['undetermined_fraction']))
+    return('\n'.join(lines))
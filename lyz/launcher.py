@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Run shell commands for the runs, with a time limit
+
+The output of each command is logged to the run's logger line by line while the command runs,
+and the result of the command is returned as a CommandResult for the caller to check.
+Commands that run longer than their timeout are killed, along with any processes they started.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("launcher")
+logger.debug("loading launcher module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import time
+import signal
+import threading
+import subprocess as sp
+from collections import deque
+import parallel
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class CommandResult(object):
+    '''
+    The result of running a command
+
+    'output' is the combined stdout and stderr of the command; if the output was longer than the
+    limit passed to run_command, only the end of it is kept and 'truncated' is True
+    '''
+    def __init__(self, command, returncode, duration, output, truncated = False, timed_out = False):
+        self.command = command
+        self.returncode = returncode
+        self.duration = duration
+        self.output = output
+        self.truncated = truncated
+        self.timed_out = timed_out
+
+    def __repr__(self):
+        return('CommandResult(returncode = {0}, duration = {1:.1f}, timed_out = {2})'.format(self.returncode, self.duration, self.timed_out))
+
+    @property
+    def succeeded(self):
+        '''
+        Whether the command finished on its own with an exit code of 0
+        '''
+        return(self.returncode == 0 and not self.timed_out)
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def kill_process_group(process):
+    '''
+    Kill a process and all of the processes it started
+    '''
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def run_command(command, logger = logger, timeout = None, max_output = 10000):
+    '''
+    Run a shell command, logging each line of its output to the logger at DEBUG level
+    The command is killed if it has not finished after 'timeout' seconds
+
+    return a CommandResult
+    '''
+    logger.debug('Running command: {0}'.format(command))
+    start_time = time.time()
+    # start the command in its own process group, so that a timeout kills everything it started
+    process = sp.Popen(command, shell = True, stdout = sp.PIPE, stderr = sp.STDOUT, universal_newlines = True, preexec_fn = os.setsid)
+    timed_out = threading.Event()
+    def on_timeout():
+        timed_out.set()
+        kill_process_group(process)
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, on_timeout)
+        timer.daemon = True
+        timer.start()
+
+    lines = deque()
+    output_size = 0
+    truncated = False
+    try:
+        for line in iter(process.stdout.readline, ''):
+            logger.debug(line.rstrip('\n'))
+            lines.append(line)
+            output_size += len(line)
+            while output_size > max_output and len(lines) > 1:
+                output_size -= len(lines.popleft())
+                truncated = True
+        process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        process.stdout.close()
+
+    result = CommandResult(command = command,
+    returncode = process.returncode,
+    duration = time.time() - start_time,
+    output = ''.join(lines),
+    truncated = truncated,
+    timed_out = timed_out.is_set())
+    if result.timed_out:
+        logger.error('Command was killed after {0}s: {1}'.format(timeout, command))
+    logger.debug(result)
+    return(result)
+
+def map_runs(func, runs, threads = 1):
+    '''
+    Call the function for each run in a pool of threads, so that no more than 'threads' runs are started at once
+    return the results in the same order as the runs
+    '''
+    runs = list(runs)
+    if len(runs) > 1 and threads > 1:
+        logger.debug("Starting {0} runs with {1} threads".format(len(runs), threads))
+    return(parallel.map_threads(func = func, items = runs, threads = threads))
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Single-instance lease for the monitor, and claim markers for the runs
+
+Only one monitor should run at a time, even if a cycle runs longer than the time between cron jobs,
+and even if the monitor is started on more than one host. The monitor holds a 'lease' file on the
+shared filesystem while it runs, and renews it from a background thread every 'heartbeat_interval'
+seconds. A lease that has not been renewed for 'ttl' seconds is stale, e.g. because the monitor
+holding it crashed or its host went down, and the next monitor takes it over.
+
+Before a run's script is started, a claim marker for the run and the task is created in the run's
+directory. A run is never started by a task that cannot create the claim, so a run is never started
+twice, even by two monitors that overlap.
+
+Files are created atomically by writing a temporary file, then hard linking it to the final name;
+the link fails if the file already exists, also on NFS.
+
+Lease file:
+{"owner": "<uuid>", "host": "phoenix2", "pid": 1234, "acquired": 1502409600.0, "renewed": 1502409660.0, "ttl": 300}
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("lease")
+logger.debug("loading lease module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+import time
+import uuid
+import errno
+import socket
+import threading
+
+# identifies the current process in the lease and claim files
+process_owner = uuid.uuid4().hex
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_owner_info(owner = None):
+    '''
+    Get the details saved in lease and claim files about the process that made them
+    '''
+    info = {}
+    info['owner'] = owner or process_owner
+    info['host'] = socket.gethostname()
+    info['pid'] = os.getpid()
+    return(info)
+
+def write_temp_file(path, data):
+    '''
+    Write the data as JSON to a temporary file next to the path
+    return the path to the temporary file
+    '''
+    tmp_file = '{0}.{1}.{2}.tmp'.format(path, socket.gethostname(), uuid.uuid4().hex)
+    with open(tmp_file, 'w') as f:
+        f.write(json.dumps(data))
+    return(tmp_file)
+
+def create_exclusive(path, data):
+    '''
+    Create a file with the data as JSON, only if it does not exist yet
+    return True if the file was created
+    '''
+    tmp_file = write_temp_file(path = path, data = data)
+    try:
+        os.link(tmp_file, path)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            return(False)
+        raise
+    finally:
+        os.remove(tmp_file)
+    return(True)
+
+def replace_file(path, data):
+    '''
+    Replace the contents of a file with the data as JSON, so that readers never see a partly written file
+    '''
+    tmp_file = write_temp_file(path = path, data = data)
+    os.rename(tmp_file, path)
+
+def read_json(path):
+    '''
+    Read a JSON file; None if it does not exist or cannot be read
+    '''
+    try:
+        with open(path) as f:
+            return(json.load(f))
+    except (IOError, ValueError):
+        return(None)
+
+def get_claim_name(task):
+    '''
+    Get the file name of the claim marker for a task
+    '''
+    return('.{0}.claim'.format(task))
+
+def get_claim_file(run_dir, task):
+    '''
+    Get the path to the claim marker for a task in a run's directory
+    '''
+    return(os.path.join(run_dir, get_claim_name(task)))
+
+def claim_run(run_dir, task, owner = None):
+    '''
+    Claim a run for a task, before starting anything for it
+    return True if the claim was made, or False if the run had already been claimed
+    '''
+    data = get_owner_info(owner = owner)
+    data['task'] = task
+    data['claimed'] = time.time()
+    return(create_exclusive(path = get_claim_file(run_dir = run_dir, task = task), data = data))
+
+def release_claim(run_dir, task):
+    '''
+    Remove the claim marker for a run and a task, e.g. when its script could not be started, so that the run is tried again
+    return True if a claim was removed
+    '''
+    try:
+        os.remove(get_claim_file(run_dir = run_dir, task = task))
+    except OSError:
+        return(False)
+    return(True)
+
+def get_claim(run_dir, task):
+    '''
+    Get the claim marker for a run and a task; None if the run has not been claimed
+    '''
+    return(read_json(get_claim_file(run_dir = run_dir, task = task)))
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class LeaseLost(Exception):
+    '''
+    Raised when a lease that was held has been taken over by another process
+    '''
+    pass
+
+class Lease(object):
+    '''
+    Lease on a file, renewed by a heartbeat thread while it is held
+
+    monitor_lease = Lease(path = 'db/monitor.lease', ttl = 300, heartbeat_interval = 60)
+    if monitor_lease.acquire():
+        monitor_lease.start_heartbeat()
+        try:
+            ...
+        finally:
+            monitor_lease.release()
+    '''
+    def __init__(self, path, ttl = 300, heartbeat_interval = 60, owner = None):
+        self.path = path
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.owner = owner or process_owner
+        self.data = None
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def is_stale(self, data, now = None):
+        '''
+        Check if the lease in a lease file has not been renewed within its ttl
+        '''
+        if now is None:
+            now = time.time()
+        return(now - data['renewed'] > data.get('ttl', self.ttl))
+
+    def get_holder(self):
+        '''
+        Get the contents of the lease file; None if no one holds the lease
+        '''
+        return(read_json(self.path))
+
+    def acquire(self, now = None):
+        '''
+        Try to get the lease; a stale lease is taken over
+        return True if the lease is now held
+        '''
+        if now is None:
+            now = time.time()
+        data = get_owner_info(owner = self.owner)
+        data['acquired'] = now
+        data['renewed'] = now
+        data['ttl'] = self.ttl
+        if create_exclusive(path = self.path, data = data):
+            self.data = data
+            self.lost.clear()
+            logger.debug("Acquired lease: {0}".format(self.path))
+            return(True)
+        holder = self.get_holder()
+        if holder is None or not self.is_stale(data = holder, now = now):
+            return(False)
+        if not self._remove_stale(holder = holder):
+            return(False)
+        logger.warning("Took over stale lease from {0} (pid {1}), last renewed {2:.0f}s ago".format(holder.get('host'), holder.get('pid'), now - holder['renewed']))
+        if create_exclusive(path = self.path, data = data):
+            self.data = data
+            self.lost.clear()
+            return(True)
+        return(False)
+
+    def _remove_stale(self, holder):
+        '''
+        Move a stale lease file out of the way
+        Another monitor could take over the same stale lease at the same time; the file is renamed first,
+        and put back if it turns out to be a new lease made after the stale one was read
+        return True if the stale lease was removed
+        '''
+        moved_file = '{0}.stale.{1}'.format(self.path, uuid.uuid4().hex)
+        try:
+            os.rename(self.path, moved_file)
+        except OSError:
+            # another monitor moved it first
+            return(False)
+        moved = read_json(moved_file)
+        if moved is not None and moved != holder:
+            try:
+                os.link(moved_file, self.path)
+            except OSError:
+                pass
+            os.remove(moved_file)
+            return(False)
+        os.remove(moved_file)
+        return(True)
+
+    def renew(self, now = None):
+        '''
+        Update the time in the lease file, if the lease is still held
+        return True if the lease was renewed, or False if it has been lost
+        '''
+        if now is None:
+            now = time.time()
+        holder = self.get_holder()
+        if holder is None or holder.get('owner') != self.owner:
+            if not self.lost.is_set():
+                logger.error("Lost lease: {0}; now held by {1}".format(self.path, holder and holder.get('host')))
+            self.lost.set()
+            return(False)
+        self.data = dict(holder, renewed = now)
+        replace_file(path = self.path, data = self.data)
+        return(True)
+
+    @property
+    def held(self):
+        '''
+        Whether the lease was acquired, and has not been lost or released
+        '''
+        return(self.data is not None and not self.lost.is_set())
+
+    def start_heartbeat(self):
+        '''
+        Renew the lease every 'heartbeat_interval' seconds in a background thread
+        '''
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target = self._run_heartbeat, name = 'LeaseHeartbeat')
+        self._heartbeat.daemon = True
+        self._heartbeat.start()
+
+    def _run_heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                if not self.renew():
+                    return
+            except (IOError, OSError):
+                logger.exception("Could not renew lease: {0}".format(self.path))
+
+    def release(self):
+        '''
+        Stop the heartbeat, and remove the lease file if the lease is still held
+        '''
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        holder = self.get_holder()
+        if holder is not None and holder.get('owner') == self.owner:
+            os.remove(self.path)
+            logger.debug("Released lease: {0}".format(self.path))
+        self.data = None
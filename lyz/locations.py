@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Sequencer output locations, and the layouts of the run directories in them
+
+Each location in the 'locations' list in config/NextSeq.yml has a layout, which says where the
+run directories are in the location:
+- flat: the run directories are directly in the location, e.g. /ifs/data/molecpathlab/quicksilver/<run>
+- by_instrument: the run directories are in a directory for each instrument, e.g. /data/nextseq/NB501073/<run>
+
+A location's 'options' are run settings that are different for the runs in that location, e.g. a longer
+'RTA_completion_window' for a storage volume that the runs are copied to more slowly.
+
+The runs found in the locations are split into shards by location and instrument, so that each shard
+can be checked in its own process; see parallel.map_processes
+
+locations = get_locations(config.NextSeq['locations'])
+shards = make_shards([(location, run_id) for location in locations for run_id in location.list_runs()])
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("locations")
+logger.debug("loading locations module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+from collections import OrderedDict
+from snapshot import scan_dir
+from run_ids import get_instrument
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class FlatLayout(object):
+    '''
+    Layout for locations with the run directories directly in the location
+    '''
+    # depth of the run directories below the location, as used by watcher.DirectoryWatcher
+    depth = 1
+
+    def list_runs(self, path):
+        '''
+        List the run directories in the location
+        return an OrderedDict of runs[run ID] = path to the directory that holds the run
+        '''
+        entries = scan_dir(path) or {}
+        return(OrderedDict((name, path) for name, is_dir in sorted(entries.items()) if is_dir))
+
+    def get_run_parent(self, path, run_id):
+        '''
+        Get the directory that would hold a run in the location
+        '''
+        return(path)
+
+class InstrumentLayout(FlatLayout):
+    '''
+    Layout for locations with a directory for each instrument, that holds the instrument's run directories
+    '''
+    depth = 2
+
+    def list_runs(self, path):
+        runs = OrderedDict()
+        for instrument, is_dir in sorted((scan_dir(path) or {}).items()):
+            if is_dir:
+                runs.update(FlatLayout.list_runs(self, os.path.join(path, instrument)))
+        return(runs)
+
+    def get_run_parent(self, path, run_id):
+        return(os.path.join(path, get_instrument(run_id) or ''))
+
+# layouts that can be used in the 'layout' setting of a location
+layouts = {
+'flat': FlatLayout,
+'by_instrument': InstrumentLayout
+}
+
+class Location(object):
+    '''
+    A directory that sequencers write their runs to
+
+    location = Location(name = 'quicksilver', path = '/ifs/data/molecpathlab/quicksilver', layout = 'flat')
+    location.list_runs() # OrderedDict([('170809_NB501073_0019_AH5FFYBGX3', '/ifs/data/molecpathlab/quicksilver'), ...])
+    '''
+    def __init__(self, name, path, layout = 'flat', options = None):
+        if layout not in layouts:
+            raise ValueError("Unknown layout for sequencer location {0}: {1}; expected one of: {2}".format(name, layout, ', '.join(sorted(layouts))))
+        self.name = name
+        self.path = path
+        self.layout_name = layout
+        self.layout = layouts[layout]()
+        self.options = dict(options or {})
+
+    def __repr__(self):
+        return('Location({0}, {1}, {2})'.format(self.name, self.path, self.layout_name))
+
+    def list_runs(self):
+        '''
+        List the run directories in the location
+        return an OrderedDict of runs[run ID] = path to the directory that holds the run
+        '''
+        return(self.layout.list_runs(self.path))
+
+    def get_sequencer_dir(self, run_id):
+        '''
+        Get the directory that holds a run in the location; used as the 'sequencer_dir' of the run
+        '''
+        return(self.layout.get_run_parent(self.path, run_id))
+
+    def has_run(self, run_id):
+        '''
+        Check if a run's directory is in the location
+        '''
+        return(os.path.isdir(os.path.join(self.get_sequencer_dir(run_id), run_id)))
+
+    def get_run_config(self, config, run_id):
+        '''
+        Get the configs for a run in the location; the location's options replace the values in 'config'
+        '''
+        run_config = dict(config)
+        run_config.update(self.options)
+        run_config['sequencer_dir'] = self.get_sequencer_dir(run_id)
+        run_config['location'] = self.name
+        return(run_config)
+
+    def get_watch(self):
+        '''
+        Get the (path, depth) to watch for new runs, as used by watcher.DirectoryWatcher
+        '''
+        return((self.path, self.layout.depth))
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_locations(settings):
+    '''
+    Create the locations from the 'locations' list in config/NextSeq.yml
+    '''
+    return([Location(name = item['name'], path = item['path'], layout = item['layout'], options = item.get('options')) for item in settings])
+
+def find_run_location(locations, run_id):
+    '''
+    Find the location that has a run's directory; the first location if none of them have it yet
+    '''
+    for location in locations:
+        if location.has_run(run_id):
+            return(location)
+    return(locations[0])
+
+def make_shards(items):
+    '''
+    Split items into shards by location and by the instrument in their run ID
+    items is a list of (location, run ID, item), or of (location, run ID) when the item is the run ID itself
+    return a list of (location, instrument, [item, ...]), largest first, so that a pool of workers starts the
+    longest shards first and finishes close to the time taken by the largest shard
+    '''
+    shards = OrderedDict()
+    for entry in items:
+        location, run_id = entry[:2]
+        item = entry[2] if len(entry) > 2 else run_id
+        key = (location.name, get_instrument(run_id))
+        if key not in shards:
+            shards[key] = (location, key[1], [])
+        shards[key][2].append(item)
+    return(sorted(shards.values(), key = lambda shard: len(shard[2]), reverse = True))
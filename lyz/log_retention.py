@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Retention and archiving for the monitor's log directory
+
+Each monitor cycle creates a new timestamped log directory, and each module and run adds more
+timestamped log files. Cycle directories and log files are moved into one compressed archive per day,
+'archive/<YYYY-MM-DD>.tar.gz', and deleted from the log directory, once the whole day is more than 'archive_after_days' old;
+each day's archive is written once, instead of being rewritten as each cycle's directory passes the cutoff.
+Archives older than 'delete_after_days' are deleted, along with the oldest archives if the total
+size of the archives is more than 'max_archive_mb'.
+
+Every archived file is recorded in an SQLite index, so the archived logs for a run can be found
+without opening the archives.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("log_retention")
+logger.debug("loading log_retention module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import re
+import time
+import shutil
+import tarfile
+import datetime
+import threading
+from catalog import connect
+from snapshot import scan_dir
+
+# NextSeq run IDs in log filenames; 170809_NB501073_0019_AH5FFYBGX3.2017-08-10-12-00-00.log
+run_id_pattern = re.compile(r'[0-9]{6}_[A-Za-z0-9]+_[0-9]+_[A-Za-z0-9]+')
+day_format = '%Y-%m-%d'
+archive_suffix = '.tar.gz'
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_run_id(member):
+    '''
+    Get the run ID from the name of an archived log file, or None if it is not a run's log
+    '''
+    match = run_id_pattern.search(os.path.basename(member))
+    if match:
+        return(match.group(0))
+    return(None)
+
+def get_newest_mtime(path):
+    '''
+    Get the newest modification time of a file, or of a directory and everything in it
+    Log files are appended to without changing their directory's mtime, so the contents have to be checked
+    '''
+    newest = os.stat(path).st_mtime
+    if os.path.isdir(path):
+        for parent, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    newest = max(newest, os.stat(os.path.join(parent, name)).st_mtime)
+                except OSError:
+                    pass
+    return(newest)
+
+def get_day(timestamp):
+    '''
+    Get the day of a timestamp, as used in the archive filenames
+    '''
+    return(datetime.datetime.fromtimestamp(timestamp).strftime(day_format))
+
+def remove_item(path):
+    '''
+    Delete a file or directory
+    '''
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class LogArchiver(object):
+    '''
+    Archives old items in a log directory into per-day compressed archives, and keeps an index of the archived files
+
+    archiver = LogArchiver(logdir = 'logs', index_file = 'db/log_archive.sqlite', archive_after_days = 7)
+    archiver.archive_old_items(exclude = ['logs/2017-08-10-12-00-00'])
+    archiver.prune_archives()
+    archiver.find_run_logs(run_id = '170809_NB501073_0019_AH5FFYBGX3')
+    '''
+    def __init__(self, logdir, index_file, archive_dir = None, archive_after_days = 7, delete_after_days = 365, max_archive_mb = 2048):
+        self.logdir = logdir
+        self.archive_dir = archive_dir or os.path.join(logdir, 'archive')
+        self.index_file = index_file
+        self.archive_after_days = archive_after_days
+        self.delete_after_days = delete_after_days
+        self.max_archive_mb = max_archive_mb
+        self.lock = threading.Lock()
+        self.connection = connect(index_file)
+        self._init_tables()
+
+    def _init_tables(self):
+        '''
+        Create the index table if it does not exist
+        '''
+        with self.lock:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS members (member TEXT, archive TEXT, run_id TEXT, day TEXT, size INTEGER, PRIMARY KEY (archive, member))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS members_run_id ON members (run_id)')
+            self.connection.commit()
+
+    def close(self):
+        '''
+        Close the connection to the index
+        '''
+        self.connection.close()
+
+    def find_old_items(self, now = None, exclude = None):
+        '''
+        Find the items in the log directory that were last modified on a day that ended more than 'archive_after_days' ago
+
+        return a dict of old_items[day] = [path, ...]
+        '''
+        if now is None:
+            now = time.time()
+        cutoff_day = get_day(now - self.archive_after_days * 86400)
+        exclude = [os.path.realpath(path) for path in (exclude or [])]
+        exclude.append(os.path.realpath(self.archive_dir))
+        old_items = {}
+        entries = scan_dir(self.logdir) or {}
+        for name in sorted(entries.keys()):
+            # keep the placeholder file that keeps the directory in the repo
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.logdir, name)
+            if os.path.realpath(path) in exclude:
+                continue
+            try:
+                mtime = get_newest_mtime(path)
+            except OSError:
+                continue
+            day = get_day(mtime)
+            if day < cutoff_day:
+                old_items.setdefault(day, []).append(path)
+        return(old_items)
+
+    def archive_day(self, day, items):
+        '''
+        Add the items to the archive for the day, then delete them from the log directory
+        Any existing archive for the day, e.g. for items that were excluded when the day was archived, is rewritten with
+        the new items added, so that there is one archive per day; items already in the archive are replaced
+        '''
+        if not os.path.isdir(self.archive_dir):
+            os.makedirs(self.archive_dir)
+        archive_file = os.path.join(self.archive_dir, day + archive_suffix)
+        tmp_file = '{0}.{1}.tmp'.format(archive_file, os.getpid())
+        members = []
+        names = [os.path.basename(item) for item in items]
+        with tarfile.open(tmp_file, 'w:gz') as tar:
+            if os.path.exists(archive_file):
+                with tarfile.open(archive_file, 'r:gz') as old_tar:
+                    for member in old_tar:
+                        if any(member.name == name or member.name.startswith(name + '/') for name in names):
+                            continue
+                        tar.addfile(member, old_tar.extractfile(member) if member.isfile() else None)
+            for item in items:
+                tar.add(item, arcname = os.path.basename(item))
+            for member in tar.getmembers():
+                if member.isfile():
+                    members.append((member.name, member.size))
+        os.rename(tmp_file, archive_file)
+
+        archive_name = os.path.basename(archive_file)
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO members (member, archive, run_id, day, size) VALUES (?, ?, ?, ?, ?)',
+            [(member, archive_name, get_run_id(member), day, size) for member, size in members])
+            self.connection.commit()
+
+        # only delete the items once they are safely in the archive
+        for item in items:
+            remove_item(item)
+        logger.info("Archived {0} log items to {1}".format(len(items), archive_file))
+        return(archive_file)
+
+    def archive_old_items(self, now = None, exclude = None):
+        '''
+        Archive all the old items in the log directory
+        return the list of archives that were written
+        '''
+        archive_files = []
+        for day, items in sorted(self.find_old_items(now = now, exclude = exclude).items()):
+            archive_files.append(self.archive_day(day = day, items = items))
+        return(archive_files)
+
+    def get_archives(self):
+        '''
+        Get the archives in the archive directory, oldest first
+
+        return a list of tuples of (day, path, size)
+        '''
+        archives = []
+        entries = scan_dir(self.archive_dir) or {}
+        for name, is_dir in entries.items():
+            if is_dir or not name.endswith(archive_suffix):
+                continue
+            path = os.path.join(self.archive_dir, name)
+            archives.append((name[:-len(archive_suffix)], path, os.path.getsize(path)))
+        return(sorted(archives))
+
+    def delete_archive(self, path):
+        '''
+        Delete an archive and remove its files from the index
+        '''
+        os.remove(path)
+        with self.lock:
+            self.connection.execute('DELETE FROM members WHERE archive = ?', (os.path.basename(path),))
+            self.connection.commit()
+        logger.info("Deleted log archive: {0}".format(path))
+
+    def prune_archives(self, now = None):
+        '''
+        Delete the archives older than 'delete_after_days', then the oldest archives until
+        the archives take up no more than 'max_archive_mb'
+        return the list of archives that were deleted
+        '''
+        if now is None:
+            now = time.time()
+        oldest_day = get_day(now - self.delete_after_days * 86400)
+        max_bytes = self.max_archive_mb * 1024 * 1024
+        archives = self.get_archives()
+        total_bytes = sum(size for day, path, size in archives)
+        deleted = []
+        for day, path, size in archives:
+            if day >= oldest_day and total_bytes <= max_bytes:
+                break
+            self.delete_archive(path = path)
+            total_bytes -= size
+            deleted.append(path)
+        return(deleted)
+
+    def find_run_logs(self, run_id):
+        '''
+        Find the archived log files for a run
+
+        return a list of tuples of (archive path, member name)
+        '''
+        with self.lock:
+            rows = self.connection.execute('SELECT archive, member FROM members WHERE run_id = ? ORDER BY day, member', (str(run_id),)).fetchall()
+        return([(os.path.join(self.archive_dir, archive), member) for archive, member in rows])
+
+
+def run(logdir, index_file, settings, exclude = None):
+    '''
+    Archive the old logs and prune the old archives, using the 'log_retention' settings from the monitor config
+    '''
+    archiver = LogArchiver(logdir = logdir,
+    index_file = index_file,
+    archive_after_days = settings['archive_after_days'],
+    delete_after_days = settings['delete_after_days'],
+    max_archive_mb = settings['max_archive_mb'])
+    try:
+        archiver.archive_old_items(exclude = exclude)
+        archiver.prune_archives()
+    finally:
+        archiver.close()
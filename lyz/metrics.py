@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Timing spans and counters for each monitor cycle
+
+The modules time the phases of their work (discovery, validation, submission, notification) with
+'span', and count what they did (runs scanned, runs skipped, emails sent) with 'increment'.
+At the end of each cycle the monitor writes everything out as one line of JSON, and as a file for
+the Prometheus node exporter's textfile collector, then starts a new cycle.
+
+with metrics.span('validation', task = 'NGS580_demultiplexing'):
+    parallel.validate_runs(runs = runs)
+metrics.increment('runs_skipped', value = 3, task = 'NGS580_demultiplexing')
+
+Prometheus textfile:
+lyz_span_seconds{span="validation",task="NGS580_demultiplexing"} 1.234
+lyz_span_calls{span="validation",task="NGS580_demultiplexing"} 1
+lyz_runs_skipped{task="NGS580_demultiplexing"} 3
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("metrics")
+logger.debug("loading metrics module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import re
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# prefix for the names of the Prometheus metrics
+prefix = 'lyz'
+# names of the counted functions in the 'os' module
+counted_os_functions = ['stat', 'lstat', 'listdir']
+
+_metrics = None
+_lock = threading.Lock()
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class Metrics(object):
+    '''
+    Timing spans and counters for one cycle
+
+    cycle_metrics = Metrics()
+    with cycle_metrics.span('discovery', task = 'NGS580_analysis'):
+        ...
+    cycle_metrics.increment('runs_scanned', value = 120, task = 'NGS580_analysis')
+    cycle_metrics.write(json_file = 'db/metrics.jsonl', prometheus_file = 'db/lyz.prom')
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        # spans[(name, labels)] = [calls, seconds]
+        self.spans = OrderedDict()
+        # counters[(name, labels)] = value
+        self.counters = OrderedDict()
+
+    @contextmanager
+    def span(self, name, **labels):
+        '''
+        Time the code run inside the 'with' block; time spent in the same span more than once is added up
+        '''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start, **labels)
+
+    def add_time(self, name, seconds, **labels):
+        '''
+        Add the time for one call to a span
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            span = self.spans.setdefault(key, [0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+
+    def increment(self, name, value = 1, **labels):
+        '''
+        Add to a counter
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def merge(self, record):
+        '''
+        Add the spans and counters from another cycle's 'to_dict', e.g. from a worker process
+        '''
+        for span in record['spans']:
+            key = (span['name'], tuple(sorted(span['labels'].items())))
+            with self.lock:
+                totals = self.spans.setdefault(key, [0, 0.0])
+                totals[0] += span['calls']
+                totals[1] += span['seconds']
+        for counter in record['counters']:
+            self.increment(counter['name'], counter['value'], **counter['labels'])
+
+    def to_dict(self):
+        '''
+        Get all of the spans and counters for the cycle
+        '''
+        with self.lock:
+            spans = [OrderedDict([('name', name), ('labels', dict(labels)), ('calls', calls), ('seconds', round(seconds, 4))]) for (name, labels), (calls, seconds) in self.spans.items()]
+            counters = [OrderedDict([('name', name), ('labels', dict(labels)), ('value', value)]) for (name, labels), value in self.counters.items()]
+        record = OrderedDict()
+        record['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start_time))
+        record['start_time'] = self.start_time
+        record['duration'] = round(time.time() - self.start_time, 4)
+        record['spans'] = spans
+        record['counters'] = counters
+        return(record)
+
+    def to_prometheus(self):
+        '''
+        Get the spans and counters in the Prometheus text format
+        '''
+        record = self.to_dict()
+        lines = []
+        def add_metric(name, help_text, samples):
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} gauge'.format(name))
+            for labels, value in samples:
+                lines.append('{0}{1} {2}'.format(name, format_labels(labels), value))
+        add_metric('{0}_cycle_start_time_seconds'.format(prefix), 'Time the last monitor cycle started, in seconds since the epoch', [({}, record['start_time'])])
+        add_metric('{0}_cycle_duration_seconds'.format(prefix), 'Duration of the last monitor cycle', [({}, record['duration'])])
+        add_metric('{0}_span_seconds'.format(prefix), 'Seconds spent in each phase of the last monitor cycle',
+        [(dict(span['labels'], span = span['name']), span['seconds']) for span in record['spans']])
+        add_metric('{0}_span_calls'.format(prefix), 'Number of times each phase was run in the last monitor cycle',
+        [(dict(span['labels'], span = span['name']), span['calls']) for span in record['spans']])
+        counters = OrderedDict()
+        for counter in record['counters']:
+            counters.setdefault(metric_name(counter['name']), []).append((counter['labels'], counter['value']))
+        for name, samples in counters.items():
+            add_metric(name, 'Count of {0} in the last monitor cycle'.format(name[len(prefix) + 1:]), samples)
+        return('\n'.join(lines) + '\n')
+
+    def write(self, json_file = None, prometheus_file = None):
+        '''
+        Append the cycle's metrics to the JSON lines file, and replace the Prometheus textfile
+        the Prometheus file is written to a temporary file first, so the collector never reads a partly written file
+        '''
+        if json_file:
+            make_parent_dir(json_file)
+            with open(json_file, 'a') as f:
+                f.write(json.dumps(self.to_dict()) + '\n')
+        if prometheus_file:
+            make_parent_dir(prometheus_file)
+            tmp_file = '{0}.{1}.tmp'.format(prometheus_file, os.getpid())
+            with open(tmp_file, 'w') as f:
+                f.write(self.to_prometheus())
+            os.rename(tmp_file, prometheus_file)
+
+
+class CallCounter(object):
+    '''
+    Count the calls to the filesystem functions while the counter is active
+
+    with CallCounter() as counter:
+        find_samplesheets()
+    counter.counts # {'stat': 10, 'lstat': 0, 'listdir': 0, 'scandir': 2, 'open': 0}
+
+    Modules that imported one of the functions by name (e.g. 'from os import scandir') are patched too.
+    Only calls made through Python are counted; calls made by other programs or by C extensions are not.
+    With enabled = False nothing is patched, and the counts stay at zero.
+    '''
+    def __init__(self, enabled = True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counts = OrderedDict((name, 0) for name in counted_os_functions + ['scandir', 'open'])
+        self.patches = []
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            with self.lock:
+                self.counts[name] += 1
+            return(func(*args, **kwargs))
+        return(wrapper)
+
+    def __enter__(self):
+        if not self.enabled:
+            return(self)
+        originals = dict((name, getattr(os, name)) for name in counted_os_functions)
+        originals['open'] = builtins.open
+        if scandir is not None:
+            originals['scandir'] = scandir
+        wrappers = dict((name, self._wrap(name, func)) for name, func in originals.items())
+        # patch every module attribute that refers to one of the functions, including 'os' and 'builtins'
+        for module in list(sys.modules.values()):
+            if module is None:
+                continue
+            for name, func in originals.items():
+                if getattr(module, name, None) is func:
+                    self.patches.append((module, name, func))
+                    setattr(module, name, wrappers[name])
+        return(self)
+
+    def __exit__(self, *args):
+        for module, attr, func in reversed(self.patches):
+            setattr(module, attr, func)
+        self.patches = []
+
+    @property
+    def total(self):
+        return(sum(self.counts.values()))
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def make_parent_dir(path):
+    '''
+    Create the directory for a file if it does not exist
+    '''
+    parent = os.path.dirname(path)
+    if parent and not os.path.isdir(parent):
+        os.makedirs(parent)
+
+def metric_name(name):
+    '''
+    Get the Prometheus metric name for a counter; only letters, digits and underscores are allowed
+    '''
+    return('{0}_{1}'.format(prefix, re.sub('[^a-zA-Z0-9_]', '_', name)))
+
+def format_labels(labels):
+    '''
+    Format a dict of labels for the Prometheus text format, e.g. {span="validation",task="NGS580_analysis"}
+    '''
+    if not labels:
+        return('')
+    items = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        items.append('{0}="{1}"'.format(key, value))
+    return('{' + ','.join(items) + '}')
+
+def get_metrics():
+    '''
+    Get the metrics for the current cycle, shared by all of the modules
+    '''
+    global _metrics
+    with _lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return(_metrics)
+
+def start_cycle():
+    '''
+    Start a new cycle; the spans and counters start again from zero
+    return the metrics for the finished cycle
+    '''
+    global _metrics
+    with _lock:
+        finished = _metrics
+        _metrics = Metrics()
+    return(finished)
+
+def span(name, **labels):
+    '''
+    Time a phase of the current cycle
+    '''
+    return(get_metrics().span(name, **labels))
+
+def increment(name, value = 1, **labels):
+    '''
+    Add to a counter for the current cycle
+    '''
+    get_metrics().increment(name, value, **labels)
@@ -16,7 +16,8 @@ script_timestamp = log.timestamp()
 scriptdir = os.path.dirname(os.path.realpath(__file__))
 scriptname = os.path.basename(__file__)
 # logdir = os.path.join(scriptdir, 'logs')
-logdir = t.mkdirs(path = os.path.join(scriptdir, 'logs', script_timestamp), return_path = True)
+# the log directory is made by 'setup_logging' once the monitor holds its lease
+logdir = os.path.join(scriptdir, 'logs', script_timestamp)
 # set a timestamped log file for debug log
 logfile = os.path.join(logdir, '{0}.{1}.log'.format(scriptname, script_timestamp))
 
@@ -38,23 +39,68 @@ def logpath(scriptname = "monitor"):
 #     return(logpath(scriptname = 'NGS580_demultiplexing'))
 
 config_yaml = os.path.join(scriptdir, 'logging.yml')
-logger = log.log_setup(config_yaml = config_yaml, logger_name = "monitor")
+logger = logging.getLogger("monitor")
 
-# make the 'main' file handler global for use elsewhere
-main_filehandler = log.get_logger_handler(logger = logger, handler_name = 'main')
-console_handler = log.get_logger_handler(logger = logger, handler_name = "console", handler_type = 'StreamHandler')
+# the 'main' file handler, global for use elsewhere; set by 'setup_logging'
+main_filehandler = None
+console_handler = None
 
-logger.debug("The monitor is starting...")
-logger.debug("Path to the monitor's log file: {0}".format(log.logger_filepath(logger = logger, handler_name = "main")))
+def setup_logging():
+    '''
+    Make the log directory for this run of the monitor, and set up the log handlers from the logging.yml
+    called once the monitor holds its lease, so that a monitor that exits because another one is running
+    does not leave an empty log directory behind every time cron starts it
+    '''
+    global logger
+    global main_filehandler
+    global console_handler
+    t.mkdirs(path = logdir)
+    logger = log.log_setup(config_yaml = config_yaml, logger_name = "monitor")
+    main_filehandler = log.get_logger_handler(logger = logger, handler_name = 'main')
+    console_handler = log.get_logger_handler(logger = logger, handler_name = "console", handler_type = 'StreamHandler')
+    logger.debug("The monitor is starting...")
+    logger.debug("Path to the monitor's log file: {0}".format(log.logger_filepath(logger = logger, handler_name = "main")))
 
 # ~~~~ PROGRAM LIBRARIES ~~~~~~ #
 import config
 # from util import tools as t
 from util import find
 from util import qsub
-import NGS580_demultiplexing
-import NGS580_analysis
-import IT50_analysis
+import registry
+import samplesheet_index
+import watcher
+import log_retention
+import outbox
+import sge_tracker
+import resources
+import deadlines
+import metrics
+import lease
+import locations
+import time
+import cProfile
+import argparse
+from contextlib import contextmanager
+
+# tasks to run in each cycle of the monitor; modules are imported when the tasks are first run
+tasks = registry.get_enabled_tasks(task_configs = config.monitor['tasks'])
+
+# directories to watch in daemon mode for each task; (path, depth) as used by watcher.DirectoryWatcher
+sequencer_watches = [location.get_watch() for location in locations.get_locations(config.NextSeq['locations'])]
+task_watches = {
+'NGS580_demultiplexing': [(config.NGS580_demultiplexing['samplesheet_source_dir'], 0)] + sequencer_watches,
+'NGS580_analysis': sequencer_watches + [(config.NGS580_analysis['analysis_output_dir'], 0)]
+}
+
+# index of the log files that have been archived by the log retention
+log_archive_index_file = os.path.join(scriptdir, 'db', 'log_archive.sqlite')
+
+# lease held while the monitor runs, so that only one monitor runs at a time
+lease_settings = config.monitor['lease']
+lease_file = lease_settings['path']
+if not os.path.isabs(lease_file):
+    lease_file = os.path.join(scriptdir, lease_file)
+monitor_lease = lease.Lease(path = lease_file, ttl = lease_settings['ttl'], heartbeat_interval = lease_settings['heartbeat_interval'])
 
 # ~~~~ FUNCTIONS ~~~~~~ #
 def demo():
@@ -72,17 +118,220 @@ def main():
     Main control function for the program
     '''
     logger.debug("Running the monitor")
-    NGS580_demultiplexing.main(extra_handlers = [main_filehandler])
-    # NGS580_analysis.main(extra_handlers = [main_filehandler])
-    IT50_analysis.main(extra_handlers = [main_filehandler])
+    with cycle():
+        samplesheet_index.reset()
+        # all of the tasks are run, so the runs that are already due are checked now
+        deadlines.get_queue().pop_due()
+        for task in tasks:
+            with metrics.span('task', task = task.name):
+                task.run(extra_handlers = [main_filehandler])
+        check_jobs()
+        outbox.send_all()
+        clean_logs()
+    wait_for_deadlines(max_wait = config.monitor['deadlines']['max_cron_wait'])
+
+def wait_for_deadlines(max_wait):
+    '''
+    Keep running to check the runs that become ready in the next 'max_wait' seconds, instead of leaving them for the next cron job
+    '''
+    end_time = time.time() + max_wait
+    while True:
+        next_deadline = deadlines.get_queue().next_deadline()
+        if next_deadline is None or next_deadline > end_time:
+            return
+        logger.info("Waiting {0:.0f}s for runs to become ready".format(max(0, next_deadline - time.time())))
+        # wake just after the deadline, so that the window has fully passed
+        time.sleep(max(0, next_deadline + 1 - time.time()))
+        with cycle():
+            samplesheet_index.reset()
+            for task in get_due_tasks():
+                run_task(task = task)
+            check_jobs()
+            outbox.send_all()
+
+@contextmanager
+def cycle():
+    '''
+    Collect the timings and counts for one cycle of the monitor, and save them at the end of the cycle
+    '''
+    if monitor_lease.lost.is_set():
+        raise lease.LeaseLost("The monitor's lease was taken over by another monitor: {0}".format(monitor_lease.get_holder()))
+    settings = config.monitor['metrics']
+    metrics.start_cycle()
+    with metrics.CallCounter(enabled = settings['count_filesystem_calls']) as counter:
+        yield
+    if counter.enabled:
+        for name, value in counter.counts.items():
+            metrics.increment('filesystem_calls', value = value, call = name)
+    save_metrics(settings = settings)
+
+def save_metrics(settings):
+    '''
+    Save the timings and counts for the current cycle; errors are logged so that the monitor keeps running
+    '''
+    paths = {}
+    for key in ['json_file', 'prometheus_file']:
+        path = settings[key]
+        if path and not os.path.isabs(path):
+            path = os.path.join(scriptdir, path)
+        paths[key] = path
+    try:
+        metrics.get_metrics().write(json_file = paths['json_file'], prometheus_file = paths['prometheus_file'])
+    except Exception:
+        logger.exception("Could not save the cycle metrics")
+
+def get_due_tasks():
+    '''
+    Get the tasks that have runs whose deadlines have passed, and remove those deadlines from the queue
+    '''
+    due_runs = deadlines.get_queue().pop_due()
+    for name, run_ids in sorted(due_runs.items()):
+        logger.info("Runs ready for {0}: {1}".format(name, ', '.join(run_ids)))
+    return([task for task in tasks if task.name in due_runs])
+
+def check_jobs():
+    '''
+    Check the states of the cluster jobs started for the runs; errors are logged so that the monitor keeps running
+    '''
+    try:
+        with metrics.span('jobs'):
+            sge_tracker.report()
+            resources.record_actuals()
+    except Exception:
+        logger.exception("Could not check the cluster jobs")
+
+def clean_logs():
+    '''
+    Archive the old log files and delete the old archives; errors are logged so that the monitor keeps running
+    '''
+    try:
+        with metrics.span('log_retention'):
+            log_retention.run(logdir = os.path.join(scriptdir, 'logs'), index_file = log_archive_index_file, settings = config.monitor['log_retention'], exclude = [logdir])
+    except Exception:
+        logger.exception("Log retention failed")
 
+def run_task(task):
+    '''
+    Run a single task outside of the main cycle; errors are logged so that the monitor keeps running
+    '''
+    logger.info("Running task: {0}".format(task.name))
+    try:
+        with metrics.span('task', task = task.name):
+            task.run(extra_handlers = [main_filehandler])
+    except Exception:
+        logger.exception("Task {0} failed".format(task.name))
+
+def send_notifications(sender):
+    '''
+    Merge the notifications from the cycle into digests, and wake the background sender
+    '''
+    try:
+        sender.outbox.flush_digest()
+    except Exception:
+        logger.exception("Could not merge notifications")
+    sender.wake()
+
+def get_changed_tasks(changed_paths):
+    '''
+    Get the tasks that watch any of the changed directories
+    '''
+    changed_paths = [os.path.realpath(path) for path in changed_paths]
+    changed_tasks = []
+    for task in tasks:
+        watched_paths = [os.path.realpath(path) for path, depth in task_watches.get(task.name, [])]
+        if any(path in watched_paths for path in changed_paths):
+            changed_tasks.append(task)
+    return(changed_tasks)
+
+def daemon():
+    '''
+    Run the monitor as a long-running process
+    Tasks are run when the directories they watch change, or when one of their waiting runs becomes ready,
+    and all tasks are run every 'full_cycle_interval' seconds
+    '''
+    daemon_config = config.monitor['daemon']
+    watches = []
+    for task in tasks:
+        for watch in task_watches.get(task.name, []):
+            if watch not in watches:
+                watches.append(watch)
+    dir_watcher = watcher.DirectoryWatcher(watches = watches, poll_interval = daemon_config['poll_interval'])
+    # notifications are sent in the background, so a slow mail server does not hold up the tasks
+    sender = outbox.OutboxSender(outbox = outbox.get_outbox(), interval = config.monitor['notifications']['retry_interval'])
+    sender.start()
+    logger.info("Starting the monitor in daemon mode")
+    while True:
+        logger.debug("Running all tasks")
+        with cycle():
+            samplesheet_index.reset()
+            deadlines.get_queue().pop_due()
+            for task in tasks:
+                run_task(task = task)
+            check_jobs()
+            send_notifications(sender = sender)
+            clean_logs()
+        last_full_cycle = time.time()
+        while time.time() - last_full_cycle < daemon_config['full_cycle_interval']:
+            timeout = daemon_config['full_cycle_interval'] - (time.time() - last_full_cycle)
+            # wake up just after the earliest run becomes ready
+            next_deadline = deadlines.get_queue().next_deadline()
+            if next_deadline is not None:
+                timeout = max(0, min(timeout, next_deadline + 1 - time.time()))
+            changed_paths = dir_watcher.wait(timeout = timeout)
+            due_tasks = get_due_tasks()
+            if not changed_paths and not due_tasks:
+                continue
+            if changed_paths:
+                # wait for more changes to come in before starting the tasks
+                time.sleep(daemon_config['settle_time'])
+                changed_paths.update(dir_watcher.wait(timeout = 0))
+                logger.debug("Changed directories: {0}".format(changed_paths))
+            changed_tasks = get_changed_tasks(changed_paths = changed_paths)
+            with cycle():
+                samplesheet_index.reset()
+                for task in tasks:
+                    if task in changed_tasks or task in due_tasks:
+                        run_task(task = task)
+                check_jobs()
+                send_notifications(sender = sender)
+
+def profile(func):
+    '''
+    Run the monitor with cProfile, and save the stats to the monitor's log directory
+    view the stats with 'python -m pstats <file>'
+    '''
+    profile_file = os.path.join(logdir, '{0}.{1}.prof'.format(scriptname, script_timestamp))
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(func)
+    finally:
+        profiler.dump_stats(profile_file)
+        logger.info("Profile saved to: {0}".format(profile_file))
 
 def run():
     '''
     Run the monitoring program
     arg parsing goes here, if program was run as a script
     '''
-    main()
+    parser = argparse.ArgumentParser(description = 'Monitoring program for lab equipment and data analysis')
+    parser.add_argument("--daemon", default = False, action = 'store_true', dest = 'daemon', help = "Keep running, and run tasks when their watched directories change")
+    parser.add_argument("--profile", default = False, action = 'store_true', dest = 'profile', help = "Profile the monitor with cProfile, and save the stats file to the log directory")
+    args = parser.parse_args()
+    func = main
+    if args.daemon:
+        func = daemon
+    if not monitor_lease.acquire():
+        # nothing is logged, since the log handlers are not set up until the lease is held
+        return
+    setup_logging()
+    monitor_lease.start_heartbeat()
+    try:
+        if args.profile:
+            profile(func)
+        else:
+            func()
+    finally:
+        monitor_lease.release()
 
 
 # ~~~~~ RUN ~~~~~ #
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+On-disk queue of email notifications
+
+Notifications are saved as JSON files in the outbox directory instead of being sent when they are made,
+so a slow mail relay does not hold up the monitor cycle. The queue is drained with 'mutt' at the end
+of the cycle, or by a background OutboxSender thread in daemon mode. Notifications that fail to send
+are retried later with an increasing delay, and are moved to the 'failed' subdirectory after too many attempts.
+A mutt command that has not finished after 'send_timeout' seconds is killed and counts as a failed attempt, so a
+hung mail relay can not stop the monitor cycle from finishing.
+
+With 'digest' enabled, the notifications made during a cycle are held until the end of the cycle,
+then merged into a single email for each set of recipients.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("outbox")
+logger.debug("loading outbox module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+import time
+import itertools
+import threading
+import subprocess as sp
+import metrics
+from launcher import kill_process_group
+
+_outbox = None
+_lock = threading.Lock()
+_counter = itertools.count()
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class Outbox(object):
+    '''
+    Queue of notifications saved in a directory
+
+    outbox = Outbox(outbox_dir = 'db/outbox')
+    outbox.put(recipients = 'foo@bar.edu', subject = '[NGS580] Run started', message_file = 'logs/run.log')
+    outbox.flush_digest()
+    outbox.drain()
+    '''
+    def __init__(self, outbox_dir, mutt = 'mutt', digest = False, max_attempts = 8, retry_interval = 60, max_retry_interval = 3600, send_timeout = 60):
+        self.outbox_dir = outbox_dir
+        self.failed_dir = os.path.join(outbox_dir, 'failed')
+        self.mutt = mutt
+        self.send_timeout = send_timeout
+        self.digest = digest
+        self.max_attempts = max_attempts
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        # only one thread drains or merges the queue at a time
+        self.lock = threading.Lock()
+        for path in [self.outbox_dir, self.failed_dir]:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def write(self, notification, path = None):
+        '''
+        Save a notification to the outbox; write to a temporary file first so that a half written notification is never sent
+        '''
+        if path is None:
+            path = os.path.join(self.outbox_dir, '{0:.6f}.{1}.{2}.json'.format(time.time(), os.getpid(), next(_counter)))
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(notification, f)
+        os.rename(tmp_file, path)
+        return(path)
+
+    def read(self, path):
+        '''
+        Load a notification from the outbox, or None if it could not be read
+        '''
+        try:
+            with open(path) as f:
+                return(json.load(f))
+        except (IOError, OSError, ValueError):
+            logger.error("Could not read notification file: {0}".format(path))
+            return(None)
+
+    def put(self, recipients, subject, body = None, message_file = None, reply_to = None):
+        '''
+        Add a notification to the outbox
+        The contents of 'message_file' are used as the body of the message, if it is passed
+        '''
+        if message_file:
+            with open(message_file) as f:
+                body = f.read()
+        notification = {
+        'recipients': recipients,
+        'reply_to': reply_to,
+        'subject': subject,
+        'body': body or '',
+        'created': time.time(),
+        'attempts': 0,
+        'next_attempt': 0,
+        'held': self.digest
+        }
+        path = self.write(notification = notification)
+        logger.debug("Added notification to outbox: {0}".format(path))
+        return(path)
+
+    def get_pending(self):
+        '''
+        Get the paths to the notifications in the outbox, oldest first
+        '''
+        return(sorted(os.path.join(self.outbox_dir, name) for name in os.listdir(self.outbox_dir) if name.endswith('.json')))
+
+    def flush_digest(self):
+        '''
+        Merge the held notifications into one notification for each set of recipients
+        Call this at the end of each monitor cycle
+        '''
+        with self.lock:
+            self._flush_digest()
+
+    def _flush_digest(self):
+        groups = {}
+        for path in self.get_pending():
+            notification = self.read(path)
+            if notification is None or not notification.get('held'):
+                continue
+            key = (notification['recipients'], notification['reply_to'])
+            groups.setdefault(key, []).append((path, notification))
+        for (recipients, reply_to), items in sorted(groups.items()):
+            subjects = [notification['subject'] for path, notification in items]
+            if len(items) == 1:
+                subject = subjects[0]
+                body = items[0][1]['body']
+            else:
+                subject = 'Run monitor digest: {0} notifications'.format(len(items))
+                sections = ['{0}\n{1}\n\n{2}'.format(notification['subject'], '=' * len(notification['subject']), notification['body']) for path, notification in items]
+                body = '\n\n'.join(['\n'.join(subjects)] + sections)
+            digest = dict(items[0][1], subject = subject, body = body, held = False)
+            self.write(notification = digest)
+            for path, notification in items:
+                os.remove(path)
+            logger.debug("Merged {0} notifications for {1}".format(len(items), recipients))
+
+    def get_command(self, notification):
+        '''
+        Get the mutt command to send a notification; the body is passed to the command on stdin
+        '''
+        command = [self.mutt, '-s', notification['subject']]
+        if notification.get('reply_to'):
+            command.extend(['-e', 'my_hdr Reply-To:{0}'.format(notification['reply_to'])])
+        command.append('--')
+        command.extend(notification['recipients'].replace(',', ' ').split())
+        return(command)
+
+    def send(self, notification):
+        '''
+        Send a notification with mutt; mutt is killed if it has not finished after 'send_timeout' seconds
+        return True if it was sent
+        '''
+        command = self.get_command(notification)
+        body = notification['body']
+        # Python 2 loads the JSON strings as unicode
+        if not isinstance(body, str):
+            body = body.encode('utf-8')
+        logger.debug('Email command is: {0}'.format(command))
+        try:
+            # start mutt in its own process group, so that a timeout kills everything it started
+            process = sp.Popen(command, stdin = sp.PIPE, stdout = sp.PIPE, stderr = sp.STDOUT, universal_newlines = True, preexec_fn = os.setsid)
+        except OSError as e:
+            logger.error("Could not run mail command {0}: {1}".format(self.mutt, e))
+            return(False)
+        timed_out = threading.Event()
+        def on_timeout():
+            timed_out.set()
+            kill_process_group(process)
+        timer = None
+        if self.send_timeout:
+            timer = threading.Timer(self.send_timeout, on_timeout)
+            timer.daemon = True
+            timer.start()
+        try:
+            output = process.communicate(input = body)[0]
+        except (OSError, IOError) as e:
+            # mutt was killed before it read the message
+            output = str(e)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if timed_out.is_set():
+            logger.error("Mail command did not finish within {0}s and was stopped: {1}".format(self.send_timeout, notification['subject']))
+            return(False)
+        if process.returncode != 0:
+            logger.error("Mail command returned {0}: {1}".format(process.returncode, output))
+            return(False)
+        return(True)
+
+    def retry_later(self, path, notification, now):
+        '''
+        Save a failed notification to be sent again later, or move it to the 'failed' directory after too many attempts
+        '''
+        notification['attempts'] += 1
+        if notification['attempts'] >= self.max_attempts:
+            os.rename(path, os.path.join(self.failed_dir, os.path.basename(path)))
+            logger.error("Notification could not be sent after {0} attempts: {1}".format(notification['attempts'], notification['subject']))
+            return
+        delay = min(self.retry_interval * 2 ** (notification['attempts'] - 1), self.max_retry_interval)
+        notification['next_attempt'] = now + delay
+        self.write(notification = notification, path = path)
+        logger.warning("Notification could not be sent, will try again in {0}s: {1}".format(delay, notification['subject']))
+
+    def drain(self, now = None):
+        '''
+        Send all of the notifications that are due
+        return the number of notifications sent
+        '''
+        if now is None:
+            now = time.time()
+        num_sent = 0
+        with self.lock:
+            for path in self.get_pending():
+                notification = self.read(path)
+                if notification is None or notification.get('held') or notification['next_attempt'] > now:
+                    continue
+                with metrics.span('notification'):
+                    sent = self.send(notification)
+                if sent:
+                    os.remove(path)
+                    num_sent += 1
+                    metrics.increment('notifications_sent')
+                    logger.info("Sent notification: {0}".format(notification['subject']))
+                else:
+                    metrics.increment('notifications_failed')
+                    self.retry_later(path = path, notification = notification, now = now)
+        return(num_sent)
+
+
+class OutboxSender(threading.Thread):
+    '''
+    Background thread that drains an outbox every 'interval' seconds, or when woken
+
+    sender = OutboxSender(outbox = outbox)
+    sender.start()
+    sender.wake()
+    '''
+    def __init__(self, outbox, interval = 60):
+        threading.Thread.__init__(self, name = 'OutboxSender')
+        self.daemon = True
+        self.outbox = outbox
+        self.interval = interval
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+
+    def wake(self):
+        '''
+        Drain the outbox now
+        '''
+        self.wake_event.set()
+
+    def stop(self):
+        '''
+        Stop the thread after its current drain
+        '''
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.outbox.drain()
+            except Exception:
+                logger.exception("Error while sending notifications")
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_outbox():
+    '''
+    Get the outbox shared by all of the modules, made from the 'notifications' settings in the monitor config
+    '''
+    global _outbox
+    with _lock:
+        if _outbox is None:
+            import config
+            settings = config.monitor['notifications']
+            outbox_dir = settings['outbox_dir']
+            if not os.path.isabs(outbox_dir):
+                outbox_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), outbox_dir)
+            _outbox = Outbox(outbox_dir = outbox_dir,
+            mutt = settings['mutt'],
+            digest = settings['digest'],
+            max_attempts = settings['max_attempts'],
+            retry_interval = settings['retry_interval'],
+            max_retry_interval = settings['max_retry_interval'],
+            send_timeout = settings['send_timeout'])
+        return(_outbox)
+
+def send_all():
+    '''
+    Merge the held notifications and send everything that is due; for the end of a cycle when not running as a daemon
+    '''
+    outbox = get_outbox()
+    outbox.flush_digest()
+    try:
+        outbox.drain()
+    except Exception:
+        logger.exception("Error while sending notifications")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Functions for checking many runs at once in a pool of threads or processes
+
+Most of the time spent validating a run is spent waiting on filesystem calls, so the runs
+can be checked in parallel with threads even though Python only runs one thread at a time.
+
+Larger batches of runs, e.g. the runs of each sequencer location and instrument, can be checked
+in a pool of processes with 'map_processes', so that the Python work is spread over more than one CPU.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("parallel")
+logger.debug("loading parallel module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import metrics
+# datetime.strptime is not thread-safe on its first use in Python 2; import its module up front
+import _strptime
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class LogBuffer(logging.Handler):
+    '''
+    Logging handler that holds on to all of the records it receives
+    '''
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class BufferedLogger(object):
+    '''
+    Context manager that holds all the log records for a logger, instead of sending them to its handlers
+
+    with BufferedLogger(logger = run.logger) as buffer:
+        run.validate()
+    buffer.replay()
+    '''
+    def __init__(self, logger):
+        self.logger = logger
+        self.buffer = LogBuffer()
+
+    def __enter__(self):
+        self.handlers = self.logger.handlers
+        self.propagate = self.logger.propagate
+        self.logger.handlers = [self.buffer]
+        self.logger.propagate = False
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.logger.handlers = self.handlers
+        self.logger.propagate = self.propagate
+
+    def replay(self):
+        '''
+        Send the held records to the logger's handlers
+        '''
+        for record in self.buffer.records:
+            self.logger.handle(record)
+        self.buffer.records = []
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def map_threads(func, items, threads = 1):
+    '''
+    Apply the function to each item with a pool of threads
+    results are returned in the same order as the items
+    '''
+    items = list(items)
+    if threads <= 1 or len(items) <= 1:
+        return([func(item) for item in items])
+    pool = ThreadPool(processes = min(threads, len(items)))
+    try:
+        results = pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+    return(results)
+
+def _validate_buffered(run, method = 'validate'):
+    '''
+    Validate a run while holding its log records
+    '''
+    with BufferedLogger(logger = run.logger) as buffer:
+        is_valid = getattr(run, method)()
+    return(is_valid, buffer)
+
+def validate_runs(runs, threads = 1, method = 'validate'):
+    '''
+    Run the 'validate' method of each run, or the named 'method', and save the result in the run's 'is_valid' attribute
+    With more than one thread, each run's log messages are held until all the runs are done, then
+    logged one run at a time in the original order, so the logs read the same as a serial validation
+
+    return a list of the validation results, in the same order as the runs
+    '''
+    runs = list(runs)
+    if threads <= 1 or len(runs) <= 1:
+        results = [getattr(run, method)() for run in runs]
+    else:
+        logger.debug("Validating {0} runs with {1} threads".format(len(runs), threads))
+        results = []
+        for is_valid, buffer in map_threads(func = lambda run: _validate_buffered(run, method = method), items = runs, threads = threads):
+            buffer.replay()
+            results.append(is_valid)
+    for run, is_valid in zip(runs, results):
+        run.is_valid = is_valid
+    return(results)
+
+def get_process_context():
+    '''
+    Get the multiprocessing context to start the worker processes with
+    the workers are forked, so that they have the same configs and log handlers as the monitor
+    '''
+    if hasattr(multiprocessing, 'get_context'):
+        return(multiprocessing.get_context('fork'))
+    return(multiprocessing)
+
+def _init_worker():
+    '''
+    Give a worker process its own connections to the shared databases; an sqlite connection must not be used
+    by more than one process
+    '''
+    import quiescence
+    import deadlines
+    if quiescence._store is not None:
+        quiescence._store = quiescence.ManifestStore(db_file = quiescence._store.db_file)
+    if deadlines._queue is not None:
+        deadlines._queue = deadlines.DeadlineQueue(db_file = deadlines._queue.db_file)
+
+def _call_worker(args):
+    '''
+    Apply the function to an item in a worker process
+    return the result, and the timings and counts recorded by the worker so they can be added to the monitor's cycle
+    '''
+    func, item = args
+    metrics.start_cycle()
+    result = func(item)
+    return(result, metrics.get_metrics().to_dict())
+
+def map_processes(func, items, processes = 1):
+    '''
+    Apply the function to each item with a pool of processes
+    func must be a module level function, and the items and results must be picklable
+    items are sent to the workers one at a time, so a large item does not hold up the items behind it
+    the timings and counts recorded in the workers are added to the monitor's current cycle
+    results are returned in the same order as the items
+    '''
+    items = list(items)
+    if processes <= 1 or len(items) <= 1:
+        return([func(item) for item in items])
+    logger.debug("Running {0} items in {1} processes".format(len(items), min(processes, len(items))))
+    pool = get_process_context().Pool(processes = min(processes, len(items)), initializer = _init_worker)
+    try:
+        outputs = pool.map(_call_worker, [(func, item) for item in items], chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+    results = []
+    for result, record in outputs:
+        metrics.get_metrics().merge(record)
+        results.append(result)
+    return(results)
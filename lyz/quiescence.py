@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Detection of when a run's files have finished copying to the storage location
+
+A manifest of each run's BaseCalls directory (the number of files, their total size, and the newest
+modification time) is saved between polls. When the manifest has not changed for a set 'quiet period',
+the copy from the sequencer is taken to be finished, and the run can be started without waiting for
+the full RTA completion window.
+
+The manifest is updated incrementally: directories whose mtime has not changed are not listed again,
+and only their files that were modified recently are checked again, since they could still be growing.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("quiescence")
+logger.debug("loading quiescence module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+import time
+import threading
+from catalog import connect
+from snapshot import scan_dir
+
+_store = None
+_lock = threading.Lock()
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def scan_manifest(path, previous_dirs = None, recent_cutoff = None):
+    '''
+    Get the files in a directory and all of its subdirectories, reusing the entries from a previous scan where possible
+    files modified after 'recent_cutoff' are always checked again
+
+    return a dict of dirs[relative path] = [dir mtime, {file name: [size, mtime]}, [subdir names]]
+    '''
+    previous_dirs = previous_dirs or {}
+    dirs = {}
+    _scan_dir(path = path, rel_path = '.', previous_dirs = previous_dirs, recent_cutoff = recent_cutoff, dirs = dirs)
+    return(dirs)
+
+def _scan_dir(path, rel_path, previous_dirs, recent_cutoff, dirs):
+    try:
+        dir_mtime = os.stat(path).st_mtime
+    except OSError:
+        return
+    previous = previous_dirs.get(rel_path)
+    old_files = {}
+    if previous and previous[0] == dir_mtime:
+        # no items were added or removed; reuse the previous listing
+        old_files = previous[1]
+        file_names = list(old_files.keys())
+        subdir_names = previous[2]
+    else:
+        entries = scan_dir(path) or {}
+        file_names = [name for name, is_dir in entries.items() if not is_dir]
+        subdir_names = sorted(name for name, is_dir in entries.items() if is_dir)
+    files = {}
+    for name in file_names:
+        old = old_files.get(name)
+        if old and recent_cutoff is not None and old[1] < recent_cutoff:
+            files[name] = old
+            continue
+        try:
+            stat = os.stat(os.path.join(path, name))
+        except OSError:
+            continue
+        files[name] = [stat.st_size, stat.st_mtime]
+    dirs[rel_path] = [dir_mtime, files, subdir_names]
+    for name in subdir_names:
+        _scan_dir(path = os.path.join(path, name), rel_path = os.path.join(rel_path, name), previous_dirs = previous_dirs, recent_cutoff = recent_cutoff, dirs = dirs)
+
+def summarize(dirs):
+    '''
+    Get the number of files, total size, and newest modification time in a manifest
+    '''
+    file_count = 0
+    total_bytes = 0
+    newest_mtime = None
+    for dir_mtime, files, subdir_names in dirs.values():
+        newest_mtime = max(newest_mtime, dir_mtime) if newest_mtime is not None else dir_mtime
+        for size, mtime in files.values():
+            file_count += 1
+            total_bytes += size
+            newest_mtime = max(newest_mtime, mtime)
+    return([file_count, total_bytes, newest_mtime])
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class ManifestStore(object):
+    '''
+    SQLite backed store of the manifests of the runs' BaseCalls directories
+
+    store = ManifestStore(db_file = 'db/manifests.sqlite')
+    quiet_seconds = store.update(id = run.id, path = run.basecalls_dir, recent_seconds = 600)
+    '''
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.connection = connect(db_file)
+        self._init_tables()
+
+    def _init_tables(self):
+        '''
+        Create the manifests table if it does not exist
+        '''
+        with self.lock:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS manifests (id TEXT PRIMARY KEY, summary TEXT, dirs TEXT, changed REAL, updated REAL)')
+            self.connection.commit()
+
+    def close(self):
+        '''
+        Close the connection to the database
+        '''
+        self.connection.close()
+
+    def get(self, id):
+        '''
+        Get the saved summary, directories, and time of the last change for a run, or None
+        '''
+        with self.lock:
+            row = self.connection.execute('SELECT summary, dirs, changed FROM manifests WHERE id = ?', (str(id),)).fetchone()
+        if row is None:
+            return(None)
+        return(json.loads(row[0]), json.loads(row[1]), row[2])
+
+    def update(self, id, path, recent_seconds = 600, now = None):
+        '''
+        Scan the directory for a run, and save its manifest
+        files modified in the last 'recent_seconds' are checked again even if their directory has not changed;
+        use the quiet period, so that any file that could have changed within the quiet period is checked
+
+        return the number of seconds since the manifest last changed
+        '''
+        if now is None:
+            now = time.time()
+        saved = self.get(id)
+        previous_dirs = {}
+        changed = now
+        if saved:
+            previous_summary, previous_dirs, changed = saved
+        dirs = scan_manifest(path = path, previous_dirs = previous_dirs, recent_cutoff = now - recent_seconds)
+        summary = summarize(dirs)
+        if not saved or summary != previous_summary:
+            changed = now
+            logger.debug("Manifest changed for {0}: {1} files, {2} bytes".format(id, summary[0], summary[1]))
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO manifests (id, summary, dirs, changed, updated) VALUES (?, ?, ?, ?, ?)',
+            (str(id), json.dumps(summary), json.dumps(dirs), changed, now))
+            self.connection.commit()
+        return(now - changed)
+
+    def remove(self, id):
+        '''
+        Delete the manifest for a run, once it is no longer needed
+        '''
+        with self.lock:
+            self.connection.execute('DELETE FROM manifests WHERE id = ?', (str(id),))
+            self.connection.commit()
+
+
+def get_store():
+    '''
+    Get the manifest store shared by all of the modules
+    '''
+    global _store
+    with _lock:
+        if _store is None:
+            _store = ManifestStore(db_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'db', 'manifests.sqlite'))
+        return(_store)
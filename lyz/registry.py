@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Registry of the tasks run by the monitor
+
+Tasks are declared by name in the 'tasks' section of config/monitor.yml. A task's module is only
+imported the first time the task is run, so disabled tasks never set up their loggers, log files,
+or configs.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("registry")
+logger.debug("loading registry module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import importlib
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class Task(object):
+    '''
+    A task run by the monitor; a Python module with a 'main' function
+
+    task = Task(name = 'NGS580_demultiplexing', module = 'NGS580_demultiplexing')
+    task.run(extra_handlers = [main_filehandler])
+    '''
+    def __init__(self, name, module = None, enabled = True):
+        self.name = name
+        # the task's module has the same name as the task, unless set otherwise
+        self.module_name = module or name
+        self.enabled = enabled
+        self._module = None
+
+    def __repr__(self):
+        return('Task({0})'.format(self.name))
+
+    @property
+    def module(self):
+        '''
+        The task's module; imported on first use
+        '''
+        if self._module is None:
+            logger.debug("Importing module for task {0}: {1}".format(self.name, self.module_name))
+            self._module = importlib.import_module(self.module_name)
+        return(self._module)
+
+    def run(self, extra_handlers = None):
+        '''
+        Run the 'main' function of the task's module
+        '''
+        return(self.module.main(extra_handlers = extra_handlers))
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def load_tasks(task_configs):
+    '''
+    Create the Task objects for a list of task configs, as read from config/monitor.yml
+    ex:
+    [{'name': 'NGS580_demultiplexing', 'enabled': True}, {'name': 'IT50_analysis', 'enabled': False}]
+
+    return a list of all the tasks, in the same order as the configs
+    '''
+    tasks = []
+    for task_config in task_configs:
+        task = Task(name = task_config['name'], module = task_config.get('module'), enabled = task_config.get('enabled', True))
+        tasks.append(task)
+    return(tasks)
+
+def get_enabled_tasks(task_configs):
+    '''
+    Get the tasks that are enabled in the task configs
+    '''
+    tasks = [task for task in load_tasks(task_configs) if task.enabled]
+    logger.debug("Enabled tasks: {0}".format(tasks))
+    return(tasks)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Estimates of the cluster resources needed to demultiplex a run
+
+The CPU slots, memory and runtime for a run's demultiplexing job are estimated from the number of samples
+in its samplesheet, and the number of cycles and lanes in its RunInfo.xml, with the 'resources' settings:
+- work: cpu_minutes_per_cycle_lane * cycles * lanes + cpu_minutes_per_sample * samples, in CPU minutes
+- slots: enough to do the work in about 'target_runtime_minutes', between 'min_slots' and 'max_slots'
+- runtime: base_runtime_minutes + work / slots
+- memory: base_memory_gb + memory_gb_per_slot * slots + memory_gb_per_sample * samples
+
+The estimates are passed to the demultiplexing script in the LYZ_SLOTS, LYZ_MEMORY_GB and LYZ_RUNTIME_MINUTES
+environment variables, so that small runs do not wait in the queue for a large node.
+
+Each estimate is saved in an SQLite database, and once the run's cluster jobs are done their wallclock time
+and peak memory from 'qacct' (see sge_tracker.py) are saved with it. Later estimates are scaled by the median ratio
+of actual to estimated use over the last 'calibration_runs' finished runs, then padded with the 'headroom' settings.
+
+estimate = estimate_resources(samples = 24, cycles = 310, lanes = 4, settings = configs['resources'], calibration = get_history().get_calibration(task = 'NGS580_demultiplexing'))
+command = format_command(command = 'demultiplex-NGS580-WES.sh 170809_NB501073_0019_AH5FFYBGX3', estimate = estimate)
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("resources")
+logger.debug("loading resources module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from catalog import connect
+import sge_tracker
+
+# environment variables for the estimates that are passed to the script
+env_vars = OrderedDict([
+('slots', 'LYZ_SLOTS'),
+('memory_gb', 'LYZ_MEMORY_GB'),
+('runtime_minutes', 'LYZ_RUNTIME_MINUTES')
+])
+# calibration factors are kept within these bounds, so that a few unusual runs can not make the estimates unusable
+min_calibration_factor = 0.25
+max_calibration_factor = 4.0
+# estimates for runs whose jobs were never tracked are no longer waited on after this many days
+max_pending_days = 30
+
+_history = None
+_lock = threading.Lock()
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def median(values):
+    '''
+    Get the median of a list of numbers
+    '''
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return(values[middle])
+    return((values[middle - 1] + values[middle]) / 2.0)
+
+def estimate_resources(samples, cycles, lanes, settings, calibration = None):
+    '''
+    Estimate the resources for demultiplexing a run
+    calibration is a dict of factors for the 'runtime' and 'memory' from ResourceHistory.get_calibration
+
+    return a dict with the 'slots', 'memory_gb' and 'runtime_minutes' to request, the inputs, and the
+    'model_memory_gb' and 'model_runtime_minutes' before calibration and headroom, which are compared to the actual use
+    '''
+    calibration = calibration or {}
+    cpu_minutes = settings['cpu_minutes_per_cycle_lane'] * cycles * lanes + settings['cpu_minutes_per_sample'] * samples
+    slots = int(math.ceil(cpu_minutes / float(settings['target_runtime_minutes'])))
+    slots = min(max(slots, settings['min_slots']), settings['max_slots'])
+    model_runtime = settings['base_runtime_minutes'] + cpu_minutes / float(slots)
+    model_memory = settings['base_memory_gb'] + settings['memory_gb_per_slot'] * slots + settings['memory_gb_per_sample'] * samples
+    runtime = model_runtime * calibration.get('runtime', 1.0) * settings['runtime_headroom']
+    memory = min(model_memory * calibration.get('memory', 1.0) * settings['memory_headroom'], settings['max_memory_gb'])
+    return({
+    'samples': samples,
+    'cycles': cycles,
+    'lanes': lanes,
+    'slots': slots,
+    'memory_gb': int(math.ceil(memory)),
+    'runtime_minutes': int(math.ceil(runtime)),
+    'model_memory_gb': model_memory,
+    'model_runtime_minutes': model_runtime
+    })
+
+def describe_estimate(estimate):
+    '''
+    Get a short description of an estimate for the logs
+    '''
+    return('{0} slots, {1} GB, {2} minutes for {3} samples, {4} cycles, {5} lanes'.format(estimate['slots'], estimate['memory_gb'],
+    estimate['runtime_minutes'], estimate['samples'], estimate['cycles'], estimate['lanes']))
+
+def format_command(command, estimate):
+    '''
+    Add the environment variables for an estimate to the start of a shell command
+    '''
+    return(' '.join(['{0}={1}'.format(name, estimate[key]) for key, name in env_vars.items()] + [command]))
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class ResourceHistory(object):
+    '''
+    SQLite backed record of the estimated and actual resources for each run
+
+    history = ResourceHistory(db_file = 'db/resources.sqlite')
+    history.add_estimate(run_id = run.id, task = 'NGS580_demultiplexing', estimate = estimate)
+    history.add_actual(run_id = run.id, task = 'NGS580_demultiplexing', usage = tracker.get_run_usage(run_id = run.id, task = 'NGS580_demultiplexing'))
+    history.get_calibration(task = 'NGS580_demultiplexing', runs = 20, min_runs = 3)
+    '''
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.connection = connect(db_file)
+        self._init_tables()
+
+    def _init_tables(self):
+        '''
+        Create the estimates table if it does not exist
+        '''
+        with self.lock:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS estimates (run_id TEXT, task TEXT, samples INTEGER, cycles INTEGER, lanes INTEGER,
+            slots INTEGER, memory_gb REAL, runtime_minutes REAL, model_memory_gb REAL, model_runtime_minutes REAL, estimated REAL,
+            state TEXT, actual_memory_gb REAL, actual_runtime_minutes REAL, completed REAL, PRIMARY KEY (run_id, task))''')
+            self.connection.commit()
+
+    def close(self):
+        '''
+        Close the connection to the database
+        '''
+        self.connection.close()
+
+    def add_estimate(self, run_id, task, estimate, now = None):
+        '''
+        Save the estimate for a run that was started; replaces any earlier estimate for the run
+        '''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            self.connection.execute('''INSERT OR REPLACE INTO estimates (run_id, task, samples, cycles, lanes, slots, memory_gb, runtime_minutes,
+            model_memory_gb, model_runtime_minutes, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (str(run_id), task, estimate['samples'], estimate['cycles'], estimate['lanes'], estimate['slots'], estimate['memory_gb'],
+            estimate['runtime_minutes'], estimate['model_memory_gb'], estimate['model_runtime_minutes'], now))
+            self.connection.commit()
+
+    def get_pending(self, now = None):
+        '''
+        Get the runs whose actual resource use has not been saved yet
+        return a list of (run_id, task)
+        '''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            rows = self.connection.execute('SELECT run_id, task FROM estimates WHERE completed IS NULL AND estimated > ? ORDER BY estimated',
+            (now - max_pending_days * 86400,)).fetchall()
+        return([(run_id, task) for run_id, task in rows])
+
+    def add_actual(self, run_id, task, usage, now = None):
+        '''
+        Save the resources used by a run's jobs, from sge_tracker.JobTracker.get_run_usage
+        '''
+        if now is None:
+            now = time.time()
+        runtime = usage['wallclock'] / 60.0 if usage['wallclock'] is not None else None
+        with self.lock:
+            self.connection.execute('UPDATE estimates SET state = ?, actual_memory_gb = ?, actual_runtime_minutes = ?, completed = ? WHERE run_id = ? AND task = ?',
+            (usage['state'], usage['maxvmem_gb'], runtime, now, str(run_id), task))
+            self.connection.commit()
+
+    def get_estimate(self, run_id, task):
+        '''
+        Get the saved estimate and actual use for a run as a dict, or None
+        '''
+        with self.lock:
+            cursor = self.connection.execute('SELECT * FROM estimates WHERE run_id = ? AND task = ?', (str(run_id), task))
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        if row is None:
+            return(None)
+        return(dict(zip(columns, row)))
+
+    def get_calibration(self, task, runs = 20, min_runs = 3):
+        '''
+        Get the median ratio of the actual to the estimated runtime and memory, over the last 'runs' runs whose jobs finished
+        factors are 1.0 until at least 'min_runs' runs have finished
+
+        return a dict of factors for the 'runtime' and 'memory'
+        '''
+        with self.lock:
+            rows = self.connection.execute('''SELECT model_runtime_minutes, actual_runtime_minutes, model_memory_gb, actual_memory_gb FROM estimates
+            WHERE task = ? AND state = ? ORDER BY completed DESC LIMIT ?''', (task, sge_tracker.JOB_FINISHED, runs)).fetchall()
+        calibration = {}
+        for key, index in [('runtime', 0), ('memory', 2)]:
+            ratios = [row[index + 1] / row[index] for row in rows if row[index] and row[index + 1] is not None]
+            factor = median(ratios) if len(ratios) >= max(min_runs, 1) else 1.0
+            calibration[key] = min(max(factor, min_calibration_factor), max_calibration_factor)
+        return(calibration)
+
+
+def get_history():
+    '''
+    Get the resource history shared by all of the modules
+    '''
+    global _history
+    with _lock:
+        if _history is None:
+            _history = ResourceHistory(db_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'db', 'resources.sqlite'))
+        return(_history)
+
+def estimate_run(samples, cycles, lanes, task, settings):
+    '''
+    Estimate the resources for demultiplexing a run, calibrated by the runs for the task that have finished
+    '''
+    calibration = get_history().get_calibration(task = task, runs = settings['calibration_runs'], min_runs = settings['min_calibration_runs'])
+    return(estimate_resources(samples = samples, cycles = cycles, lanes = lanes, settings = settings, calibration = calibration))
+
+def record_actuals():
+    '''
+    Save the resources used by the runs whose cluster jobs are done, and log them against their estimates
+    '''
+    history = get_history()
+    tracker = sge_tracker.get_tracker()
+    for run_id, task in history.get_pending():
+        usage = tracker.get_run_usage(run_id = run_id, task = task)
+        if usage is None:
+            continue
+        history.add_actual(run_id = run_id, task = task, usage = usage)
+        estimate = history.get_estimate(run_id = run_id, task = task)
+        logger.info("Run {0} ({1}) jobs {2}; used {3} minutes and {4} GB, estimated {5} minutes and {6} GB".format(run_id, task, usage['state'],
+        '{0:.0f}'.format(estimate['actual_runtime_minutes']) if estimate['actual_runtime_minutes'] is not None else 'unknown',
+        '{0:.1f}'.format(estimate['actual_memory_gb']) if estimate['actual_memory_gb'] is not None else 'unknown',
+        estimate['runtime_minutes'], estimate['memory_gb']))
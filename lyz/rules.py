@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Named validation rules, evaluated in order of their estimated cost
+
+A RuleSet checks its rules from the cheapest to the most expensive, and stops at the first rule
+that fails, so that cheap in-memory checks can reject most items before any files are read.
+In 'explain' mode every rule is evaluated, so the full set of results can be logged for debugging.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("rules")
+logger.debug("loading rules module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+from collections import OrderedDict
+
+# estimated costs for rules; checks of values already in memory, a stat or a directory listing,
+# a listing of a subdirectory, and reading the contents of a file
+COST_MEMORY = 0
+COST_STAT = 1
+COST_SUBDIR = 2
+COST_READ = 3
+# checks that depend on the current time, e.g. whether a waiting period has passed; these are checked after all
+# of the other rules, so that an item that fails them has passed everything else and can be scheduled for later
+COST_TIME = 4
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class Rule(object):
+    '''
+    A named check with an estimated cost
+
+    Rule(name = 'run_dir_validation', cost = COST_STAT, func = lambda run: run.snapshot.run_dir_exists)
+    '''
+    def __init__(self, name, func, cost = COST_MEMORY):
+        self.name = name
+        self.func = func
+        self.cost = cost
+
+    def __repr__(self):
+        return('Rule({0}, cost = {1})'.format(self.name, self.cost))
+
+    def check(self, subject):
+        '''
+        Check the rule for the subject
+        '''
+        return(bool(self.func(subject)))
+
+class RuleSet(object):
+    '''
+    A set of rules that are evaluated from cheapest to most expensive
+    rules with the same cost are evaluated in the order they were given
+
+    rule_set = RuleSet(rules = [...])
+    is_valid, results = rule_set.evaluate(subject = run)
+    '''
+    def __init__(self, rules):
+        # sorted() is stable, so equal cost rules keep their order
+        self.rules = sorted(rules, key = lambda rule: rule.cost)
+
+    def evaluate(self, subject, explain = False):
+        '''
+        Check the rules for the subject
+        Stops at the first rule that fails, unless 'explain' is True
+
+        return a tuple of whether all the rules passed, and an OrderedDict of the results
+        for the rules that were evaluated
+        '''
+        results = OrderedDict()
+        for rule in self.rules:
+            results[rule.name] = rule.check(subject)
+            if not results[rule.name] and not explain:
+                break
+        is_valid = len(results) == len(self.rules) and all(results.values())
+        return(is_valid, results)
+
+    def select(self, names):
+        '''
+        Get a RuleSet with only the named rules
+        '''
+        return(RuleSet(rules = [rule for rule in self.rules if rule.name in names]))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Parse NextSeq run IDs into compact records
+
+A run ID is made by the sequencer from the date, the instrument ID, the run number, and the flowcell,
+e.g. 170809_NB501073_0019_AH5FFYBGX3; copies of runs often have a suffix, e.g. 170809_NB501073_0019_AH5FFYBGX3_test
+
+Directory names that are not run IDs, and runs older than a cutoff, can be dropped from a directory
+listing without any more filesystem calls
+
+run = parse('170809_NB501073_0019_AH5FFYBGX3_test')
+run.instrument # 'NB501073'
+run.suffix # 'test'
+run.is_recent(max_age_days = 90)
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("run_ids")
+logger.debug("loading run_ids module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import re
+from datetime import date
+
+# <YYMMDD>_<instrument>_<run number>_<flowcell side><flowcell>[_<suffix>]
+run_id_pattern = re.compile(r'^(\d{2})(\d{2})(\d{2})_([A-Za-z0-9]+)_(\d+)_([A-Za-z0-9]+)(?:_(.+))?$')
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class RunID(object):
+    '''
+    The parts of a NextSeq run ID
+    uses __slots__, so that records for thousands of runs in a sequencer location stay small
+    '''
+    __slots__ = ('name', 'date', 'instrument', 'run_number', 'flowcell', 'suffix')
+
+    def __init__(self, name, date, instrument, run_number, flowcell, suffix = None):
+        self.name = name
+        self.date = date
+        self.instrument = instrument
+        self.run_number = run_number
+        self.flowcell = flowcell
+        self.suffix = suffix
+
+    def __repr__(self):
+        return('RunID({0})'.format(self.name))
+
+    def __eq__(self, other):
+        return(isinstance(other, RunID) and self.name == other.name)
+
+    def __ne__(self, other):
+        return(not self == other)
+
+    def __hash__(self):
+        return(hash(self.name))
+
+    def age_days(self, today = None):
+        '''
+        Get the number of days since the run's date
+        '''
+        if today is None:
+            today = date.today()
+        return((today - self.date).days)
+
+    def is_recent(self, max_age_days, today = None):
+        '''
+        Check if the run is no more than 'max_age_days' days old; all runs are recent if 'max_age_days' is 0 or None
+        '''
+        if not max_age_days:
+            return(True)
+        return(self.age_days(today = today) <= max_age_days)
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def parse(name):
+    '''
+    Parse a run ID
+    return a RunID, or None if the name is not a run ID
+    '''
+    match = run_id_pattern.match(name)
+    if not match:
+        return(None)
+    year, month, day, instrument, run_number, flowcell, suffix = match.groups()
+    try:
+        run_date = date(2000 + int(year), int(month), int(day))
+    except ValueError:
+        return(None)
+    return(RunID(name = name, date = run_date, instrument = instrument, run_number = int(run_number), flowcell = flowcell, suffix = suffix))
+
+def get_instrument(name):
+    '''
+    Get the instrument ID from a run ID, e.g. 'NB501073' from '170809_NB501073_0019_AH5FFYBGX3'
+    return None if the name is not a run ID
+    '''
+    run = parse(name)
+    if run is None:
+        return(None)
+    return(run.instrument)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Metadata for NextSeq runs from their RunInfo.xml and RunCompletionStatus.xml files
+
+The files are parsed with 'iterparse', and parsing stops as soon as the needed elements have been read,
+so only the start of each file is read. The results are cached by the path, modification time and size
+of each file, so a file is only parsed again after it changes.
+
+RunInfo.xml:
+<RunInfo Version="2">
+  <Run Id="170809_NB501073_0019_AH5FFYBGX3" Number="19">
+    <Flowcell>H5FFYBGX3</Flowcell>
+    <Instrument>NB501073</Instrument>
+    <Date>8/9/2017</Date>
+    <Reads>
+      <Read Number="1" NumCycles="151" IsIndexedRead="N" />
+      ...
+    </Reads>
+    <FlowcellLayout LaneCount="4" SurfaceCount="2" SwathCount="3" TileCount="12" />
+
+RunCompletionStatus.xml:
+<RunCompletionStatus>
+  <CompletionStatus>CompletedAsPlanned</CompletionStatus>
+  <RunId>170809_NB501073_0019_AH5FFYBGX3</RunId>
+  <ErrorDescription>None</ErrorDescription>
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("run_metadata")
+logger.debug("loading run_metadata module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+# RunCompletionStatus values for runs that finished sequencing normally
+completed_statuses = ['CompletedAsPlanned']
+
+# _cache[path] = ((mtime, size), metadata)
+_cache = {}
+_lock = threading.Lock()
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def strip_namespace(tag):
+    '''
+    Remove the '{namespace}' prefix from an element tag
+    '''
+    return(tag.rsplit('}', 1)[-1])
+
+def parse_run_info(path):
+    '''
+    Get the run ID, flowcell, instrument, reads, and lane count from a RunInfo.xml file
+    Stops reading the file after the FlowcellLayout element
+    '''
+    metadata = {'run_id': None, 'run_number': None, 'flowcell': None, 'instrument': None, 'date': None, 'reads': [], 'lane_count': None}
+    for event, element in ET.iterparse(path, events = ('start', 'end')):
+        tag = strip_namespace(element.tag)
+        if event == 'start':
+            if tag == 'Run':
+                metadata['run_id'] = element.get('Id')
+                metadata['run_number'] = element.get('Number')
+            continue
+        if tag == 'Flowcell':
+            metadata['flowcell'] = (element.text or '').strip()
+        elif tag == 'Instrument':
+            metadata['instrument'] = (element.text or '').strip()
+        elif tag == 'Date':
+            metadata['date'] = (element.text or '').strip()
+        elif tag == 'Read':
+            metadata['reads'].append({
+            'number': int(element.get('Number')),
+            'cycles': int(element.get('NumCycles')),
+            'is_index': element.get('IsIndexedRead') == 'Y'
+            })
+        elif tag == 'FlowcellLayout':
+            metadata['lane_count'] = int(element.get('LaneCount'))
+            break
+        elif tag == 'Run':
+            break
+    return(metadata)
+
+def parse_completion_status(path):
+    '''
+    Get the completion status, run ID, and error description from a RunCompletionStatus.xml file
+    Stops reading the file once all of them have been found
+    '''
+    fields = {'CompletionStatus': 'status', 'RunId': 'run_id', 'ErrorDescription': 'error_description'}
+    metadata = dict((key, None) for key in fields.values())
+    found = 0
+    for event, element in ET.iterparse(path, events = ('end',)):
+        key = fields.get(strip_namespace(element.tag))
+        if key:
+            metadata[key] = (element.text or '').strip()
+            found += 1
+            if found == len(fields):
+                break
+    return(metadata)
+
+def get_cached(path, parser):
+    '''
+    Parse a file, or get the results of parsing it from the cache if it has not changed since
+    return None if the file could not be read or parsed, e.g. because it is still being written
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return(None)
+    key = (stat.st_mtime, stat.st_size)
+    with _lock:
+        cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return(cached[1])
+    try:
+        metadata = parser(path)
+    except (ET.ParseError, IOError, ValueError, TypeError) as e:
+        logger.debug("Could not parse file {0}: {1}".format(path, e))
+        metadata = None
+    with _lock:
+        _cache[path] = (key, metadata)
+    return(metadata)
+
+def get_run_info(path):
+    '''
+    Get the metadata from a RunInfo.xml file
+    '''
+    return(get_cached(path = path, parser = parse_run_info))
+
+def get_completion_status(path):
+    '''
+    Get the metadata from a RunCompletionStatus.xml file
+    '''
+    return(get_cached(path = path, parser = parse_completion_status))
+
+def is_completed(completion_status):
+    '''
+    Check if the metadata from a RunCompletionStatus.xml file shows that the run finished sequencing normally
+    '''
+    return(bool(completion_status) and completion_status.get('status') in completed_statuses)
+
+def describe_run_info(run_info):
+    '''
+    Get a short description of a run's RunInfo.xml metadata for the logs
+    '''
+    reads = ', '.join('{0}{1}'.format(read['cycles'], ' (index)' if read['is_index'] else '') for read in run_info['reads'])
+    return('flowcell: {0}, instrument: {1}, lanes: {2}, reads: {3}'.format(run_info['flowcell'], run_info['instrument'], run_info['lane_count'], reads))
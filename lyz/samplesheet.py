@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Parse Illumina SampleSheet.csv files, and check them before a run is demultiplexed
+
+The [Header], [Reads], [Settings] and [Data] sections of the samplesheet are read in one pass.
+The samples in the [Data] section are checked for:
+- duplicate Sample_ID's in the same lane
+- indexes, or index pairs for dual-indexed runs, that bcl2fastq could not tell apart with the allowed
+number of barcode mismatches
+
+bcl2fastq assigns a read to a sample if its index is within 'barcode_mismatches' of the sample's index,
+so the indexes of two samples in a lane collide if they are within twice that distance of each other.
+Instead of comparing every pair of samples, each sample's index is expanded into the set of sequences within
+'barcode_mismatches' of it, and two samples collide if their sets share a sequence.
+
+[Data]
+Sample_ID,Sample_Name,Sample_Plate,Sample_Well,I7_Index_ID,index,Sample_Project,Description
+SC-SERACARE,SC-SERACARE,,A01,N701,ACGTACGT,NS17-16,
+
+problems = check_samplesheet(path = '170809_NB501073_0019_AH5FFYBGX3-SampleSheet.csv', mismatches = 1)
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("samplesheet")
+logger.debug("loading samplesheet module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import csv
+import itertools
+from collections import OrderedDict
+
+# characters that can be used in an index
+index_bases = 'ACGTN'
+# the sections of the samplesheet that hold a key,value on each line
+key_value_sections = ['Header', 'Settings']
+# UTF-8 byte order mark that some spreadsheet programs write at the start of the file
+byte_order_mark = '\xef\xbb\xbf' if bytes is str else '\ufeff'
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class Sample(object):
+    '''
+    A sample from the [Data] section of a samplesheet
+    '''
+    __slots__ = ('sample_id', 'lane', 'index', 'index2', 'line', 'fields')
+
+    def __init__(self, sample_id, lane, index, index2, line, fields):
+        self.sample_id = sample_id
+        self.lane = lane
+        self.index = index
+        self.index2 = index2
+        # line number of the sample in the samplesheet
+        self.line = line
+        # all of the values for the sample, by column name
+        self.fields = fields
+
+    def __repr__(self):
+        return('Sample({0}, line {1})'.format(self.sample_id, self.line))
+
+    def describe(self):
+        '''
+        Get a short description of the sample for reports
+        '''
+        index = self.index + ('+' + self.index2 if self.index2 else '')
+        return("'{0}' (line {1}, index {2})".format(self.sample_id, self.line, index or 'none'))
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def parse_samplesheet(path):
+    '''
+    Parse a samplesheet file
+    return a dict with the 'header' and 'settings' as OrderedDicts, the 'reads' as a list of cycles, the [Data]
+    'columns', and the 'samples' as a list of Sample objects
+    raise ValueError if the file does not have a [Data] section with a Sample_ID column
+    '''
+    samplesheet = {'header': OrderedDict(), 'settings': OrderedDict(), 'reads': [], 'columns': None, 'samples': []}
+    section = None
+    with open(path) as f:
+        for line_number, row in enumerate(csv.reader(f), 1):
+            # remove the empty cells that spreadsheet programs pad the rows with
+            while row and not row[-1].strip():
+                row.pop()
+            if not row:
+                continue
+            if line_number == 1:
+                row[0] = row[0].lstrip(byte_order_mark)
+            first = row[0].strip()
+            if first.startswith('[') and first.endswith(']'):
+                section = first[1:-1]
+                continue
+            if section in key_value_sections:
+                samplesheet[section.lower()][first] = row[1].strip() if len(row) > 1 else ''
+            elif section == 'Reads':
+                samplesheet['reads'].append(int(first))
+            elif section == 'Data':
+                if samplesheet['columns'] is None:
+                    samplesheet['columns'] = [column.strip() for column in row]
+                    if 'Sample_ID' not in samplesheet['columns']:
+                        raise ValueError('[Data] section has no Sample_ID column (line {0})'.format(line_number))
+                    continue
+                fields = OrderedDict(zip(samplesheet['columns'], [value.strip() for value in row]))
+                samplesheet['samples'].append(Sample(sample_id = fields.get('Sample_ID', ''), lane = fields.get('Lane') or None,
+                index = fields.get('index', '').upper(), index2 = fields.get('index2', '').upper(), line = line_number, fields = fields))
+    if samplesheet['columns'] is None:
+        raise ValueError('No [Data] section found')
+    return(samplesheet)
+
+def hamming_distance(a, b):
+    '''
+    Count the positions where two sequences of the same length differ
+    '''
+    return(sum(1 for x, y in zip(a, b) if x != y))
+
+def get_neighbors(index, mismatches):
+    '''
+    Get the set of all sequences within 'mismatches' substitutions of an index, including the index itself
+    substituting a base with itself is included, so the sequences with fewer substitutions are in the set too
+    '''
+    neighbors = set([index])
+    for positions in itertools.combinations(range(len(index)), mismatches):
+        for bases in itertools.product('ACGT', repeat = mismatches):
+            neighbor = list(index)
+            for position, base in zip(positions, bases):
+                neighbor[position] = base
+            neighbors.add(''.join(neighbor))
+    return(neighbors)
+
+def group_by_lane(samples):
+    '''
+    Group the samples by their lane; samples without a lane are all in one group
+    '''
+    lanes = OrderedDict()
+    for sample in samples:
+        lanes.setdefault(sample.lane, []).append(sample)
+    return(lanes)
+
+def describe_lane(lane):
+    '''
+    Get the lane for reports; samplesheets without a Lane column do not mention it
+    '''
+    return(' in lane {0}'.format(lane) if lane else '')
+
+def find_duplicate_samples(samples):
+    '''
+    Find the Sample_ID's used more than once in the same lane
+    return a list of problems
+    '''
+    problems = []
+    for lane, lane_samples in group_by_lane(samples).items():
+        lines = OrderedDict()
+        for sample in lane_samples:
+            lines.setdefault(sample.sample_id, []).append(sample.line)
+        for sample_id, sample_lines in lines.items():
+            if not sample_id:
+                problems.append('Missing Sample_ID{0} on line(s) {1}'.format(describe_lane(lane), ', '.join(str(line) for line in sample_lines)))
+            elif len(sample_lines) > 1:
+                problems.append("Duplicate Sample_ID '{0}'{1} on lines {2}".format(sample_id, describe_lane(lane), ', '.join(str(line) for line in sample_lines)))
+    return(problems)
+
+def check_index_bases(samples):
+    '''
+    Find the indexes with characters that are not bases
+    return a list of problems
+    '''
+    problems = []
+    for sample in samples:
+        for column, index in (('index', sample.index), ('index2', sample.index2)):
+            if set(index) - set(index_bases):
+                problems.append("Sample {0}: {1} '{2}' has characters other than {3}".format(sample.describe(), column, index, index_bases))
+        if sample.index2 and not sample.index:
+            problems.append('Sample {0}: has an index2 but no index'.format(sample.describe()))
+    return(problems)
+
+def find_index_collisions(samples, mismatches = 1):
+    '''
+    Find the samples in the same lane whose indexes, or index pairs, are within 2 * 'mismatches' of each other
+    indexes of different lengths in a lane are compared over the length of the shortest one, as bcl2fastq would
+    need to trim them to that length
+    return a list of problems
+    '''
+    problems = []
+    for lane, lane_samples in group_by_lane(samples).items():
+        if len(lane_samples) < 2:
+            continue
+        no_index = [sample for sample in lane_samples if not sample.index]
+        if no_index:
+            problems.append('Samples without an index{0} can not be told apart from the other samples: {1}'.format(describe_lane(lane),
+            ', '.join(sample.describe() for sample in no_index)))
+            continue
+        has_index2 = [sample for sample in lane_samples if sample.index2]
+        if has_index2 and len(has_index2) != len(lane_samples):
+            problems.append('Some samples{0} have an index2 and some do not: {1}'.format(describe_lane(lane),
+            ', '.join(sample.describe() for sample in lane_samples if not sample.index2)))
+            continue
+        length = min(len(sample.index) for sample in lane_samples)
+        length2 = min(len(sample.index2) for sample in lane_samples)
+        # seen[neighbor sequence] = the samples that have it in their neighbor sets
+        seen = {}
+        collisions = OrderedDict()
+        for sample in lane_samples:
+            neighbors = get_neighbors(sample.index[:length], mismatches)
+            if length2:
+                neighbors = itertools.product(neighbors, get_neighbors(sample.index2[:length2], mismatches))
+            for neighbor in neighbors:
+                others = seen.setdefault(neighbor, [])
+                for other in others:
+                    # samples with the same Sample_ID are reported as duplicates
+                    if other.sample_id != sample.sample_id:
+                        collisions[(other.line, sample.line)] = (other, sample)
+                others.append(sample)
+        for other, sample in collisions.values():
+            # a pair of samples collides when each of its index reads is within 2 * 'mismatches' of the other sample's,
+            # so the distances are reported for each read
+            distance = '{0} position(s)'.format(hamming_distance(other.index[:length], sample.index[:length]))
+            needed = '{0} are needed'.format(2 * mismatches + 1)
+            if length2:
+                distance = '{0} in index and {1} in index2'.format(distance, hamming_distance(other.index2[:length2], sample.index2[:length2]))
+                needed = '{0} are needed in index or in index2'.format(2 * mismatches + 1)
+            problems.append('Index collision{0}: samples {1} and {2} differ at {3}; at least {4} with {5} barcode mismatch(es)'.format(
+            describe_lane(lane), other.describe(), sample.describe(), distance, needed, mismatches))
+    return(problems)
+
+def check_samples(samples, mismatches = 1):
+    '''
+    Check the samples from a samplesheet for problems that would make demultiplexing fail or mix up samples
+    return a list of the problems found; an empty list if the samples are OK
+    '''
+    if not samples:
+        return(['No samples in the [Data] section of the samplesheet'])
+    problems = find_duplicate_samples(samples) + check_index_bases(samples)
+    if not problems:
+        problems = find_index_collisions(samples, mismatches = mismatches)
+    return(problems)
+
+def read_samplesheet(path, mismatches = 1):
+    '''
+    Parse and check a samplesheet
+    return the parsed samplesheet, or None if it could not be parsed, and a list of the problems found
+    '''
+    try:
+        samplesheet = parse_samplesheet(path)
+    except (IOError, OSError, ValueError, csv.Error) as e:
+        return(None, ['Could not parse samplesheet {0}: {1}'.format(path, e)])
+    return(samplesheet, check_samples(samplesheet['samples'], mismatches = mismatches))
+
+def check_samplesheet(path, mismatches = 1):
+    '''
+    Check a samplesheet for problems that would make demultiplexing fail or mix up samples
+    return a list of the problems found; an empty list if the samplesheet is OK
+    '''
+    return(read_samplesheet(path, mismatches = mismatches)[1])
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Index of the samplesheet files in a samplesheet source directory
+
+The directory is listed once per monitor cycle, and each file is indexed by the run ID at the
+start of its filename (the part before the first '-'), so finding the samplesheets for a run
+does not need another directory search
+ex:
+170809_NB501073_0019_AH5FFYBGX3-SampleSheet.csv
+170809_NB501073_0019_AH5FFYBGX3-samples.pairs.csv
+
+The indexes are shared by all of the modules during a cycle; call reset() at the start of each cycle
+so that new files are seen.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("samplesheet_index")
+logger.debug("loading samplesheet_index module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import fnmatch
+import threading
+from snapshot import scan_dir
+
+# indexes made during the current cycle; _indexes[search_dir] = SamplesheetIndex
+_indexes = {}
+_lock = threading.Lock()
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_runID(filename):
+    '''
+    Get the run ID from a samplesheet filename
+    '''
+    return(os.path.basename(filename).split('-')[0])
+
+def get_index(search_dir):
+    '''
+    Get the index for a directory, listing the directory if it has not been indexed yet in this cycle
+    '''
+    with _lock:
+        if search_dir not in _indexes:
+            _indexes[search_dir] = SamplesheetIndex(search_dir = search_dir)
+        return(_indexes[search_dir])
+
+def reset():
+    '''
+    Clear all of the indexes, so that directories will be listed again
+    '''
+    with _lock:
+        _indexes.clear()
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class SamplesheetIndex(object):
+    '''
+    Listing of the files in a directory, and in its subdirectories up to 'max_depth' levels down
+
+    index = SamplesheetIndex(search_dir = '/ifs/data/molecpathlab/quicksilver/to_be_demultiplexed/NGS580')
+    index.find_files(pattern = '*-SampleSheet.csv')
+    index.find_run_files(id = '170809_NB501073_0019_AH5FFYBGX3', pattern = '*-samples.pairs.csv')
+    '''
+    def __init__(self, search_dir, max_depth = 1):
+        self.search_dir = search_dir
+        self.max_depth = max_depth
+        # runs[run_ID] = [(path, depth), ...]
+        self.runs = {}
+        self.files = []
+        self._scan(path = search_dir, depth = 0)
+        logger.debug("Indexed {0} files in {1}".format(len(self.files), search_dir))
+
+    def _scan(self, path, depth):
+        '''
+        Add the files in a directory to the index
+        '''
+        entries = scan_dir(path)
+        if entries is None:
+            logger.debug("Directory could not be listed: {0}".format(path))
+            return
+        for name, is_dir in sorted(entries.items()):
+            item = os.path.join(path, name)
+            if is_dir:
+                if depth < self.max_depth:
+                    self._scan(path = item, depth = depth + 1)
+                continue
+            self.files.append((item, depth))
+            self.runs.setdefault(get_runID(name), []).append((item, depth))
+
+    def find_files(self, pattern, max_depth = None):
+        '''
+        Get the paths to all the files with names matching the pattern
+        '''
+        if max_depth is None:
+            max_depth = self.max_depth
+        return([path for path, depth in self.files if depth <= max_depth and fnmatch.fnmatch(os.path.basename(path), pattern)])
+
+    def find_run_files(self, id, pattern, max_depth = 0):
+        '''
+        Get the paths to the files for a run ID with names matching the pattern
+        '''
+        return([path for path, depth in self.runs.get(str(id), []) if depth <= max_depth and fnmatch.fnmatch(os.path.basename(path), pattern)])
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Tracking of the SGE cluster jobs submitted for each run
+
+The job IDs printed by 'qsub' ("Your job 2495634 ("name") has been submitted") in the output of
+the demultiplexing and analysis scripts are saved in an SQLite database with the run they belong to.
+Once per monitor cycle, the states of all the unfinished jobs are checked with a single 'qstat' call;
+when jobs have just left the queue, they are looked up with a single 'qacct' call for the monitor user's jobs
+to see whether they finished or failed. Cycles where no job left the queue do not run 'qacct'.
+The wallclock time and peak memory of the finished jobs are saved from the same 'qacct' output, so that they
+can be compared with the resources that were estimated for the run; see resources.py
+
+Job states:
+- queued: waiting in the queue ('qw', 'hqw')
+- running: running on a node ('r', 't')
+- failed: in an error state ('Eqw'), or finished with a non-zero exit status
+- finished: finished with an exit status of 0
+- unknown: not in the queue, and not found in the accounting records yet; looked up again for 'accounting_retry_minutes'
+after leaving the queue
+- expired: still unknown 'accounting_days' after leaving the queue, when it can no longer be in the records searched
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("sge_tracker")
+logger.debug("loading sge_tracker module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import re
+import getpass
+import time
+import threading
+import subprocess as sp
+from catalog import connect
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FAILED = 'failed'
+JOB_FINISHED = 'finished'
+JOB_UNKNOWN = 'unknown'
+JOB_EXPIRED = 'expired'
+# jobs in these states are not checked again
+done_states = [JOB_FAILED, JOB_FINISHED, JOB_EXPIRED]
+# order used to summarize the state of a run from the states of its jobs
+run_state_order = [JOB_FAILED, JOB_RUNNING, JOB_QUEUED, JOB_UNKNOWN, JOB_EXPIRED, JOB_FINISHED]
+# jobs that left the queue but are not in the accounting records yet are looked up again for this many minutes
+accounting_retry_minutes = 10
+
+job_id_pattern = re.compile(r'Your job(?:-array)? ([0-9]+)')
+
+_tracker = None
+_lock = threading.Lock()
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def parse_job_ids(text):
+    '''
+    Get the IDs of the jobs submitted with qsub from the output of a script
+    '''
+    return(job_id_pattern.findall(text or ''))
+
+def parse_qstat(text):
+    '''
+    Get the state of each job from the output of 'qstat'
+
+    return a dict of states[job_id] = qstat state, e.g. 'r', 'qw', 'Eqw'
+    '''
+    states = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) < 5 or not parts[0].isdigit():
+            continue
+        # array jobs have one line per task; keep the first
+        states.setdefault(parts[0], parts[4])
+    return(states)
+
+def parse_qacct_records(text):
+    '''
+    Get the accounting fields of each job from the output of 'qacct -j'
+
+    return a dict of records[job_id] = {field: value}
+    '''
+    records = {}
+    fields = {}
+    for line in text.splitlines() + ['=']:
+        if line.startswith('='):
+            if 'jobnumber' in fields:
+                records[fields['jobnumber']] = fields
+            fields = {}
+            continue
+        parts = line.split(None, 1)
+        if len(parts) == 2:
+            fields[parts[0]] = parts[1].strip()
+    return(records)
+
+def get_qacct_result(fields):
+    '''
+    Get the (failed, exit_status) values from the accounting fields of a job
+    '''
+    return((fields.get('failed', '0').split()[0], fields.get('exit_status', '0').split()[0]))
+
+def parse_qacct(text):
+    '''
+    Get the exit status of each job from the output of 'qacct -j'
+
+    return a dict of results[job_id] = (failed, exit_status)
+    '''
+    return(dict((job_id, get_qacct_result(fields)) for job_id, fields in parse_qacct_records(text).items()))
+
+def parse_memory_gb(value):
+    '''
+    Convert a qacct memory value such as '6.010G' or '512.000M' to GB; None if it cannot be read
+    '''
+    units = {'K': 1.0 / 1024 ** 2, 'M': 1.0 / 1024, 'G': 1.0, 'T': 1024.0}
+    value = value.strip().upper()
+    multiplier = 1.0 / 1024 ** 3
+    if value[-1:] in units:
+        multiplier = units[value[-1]]
+        value = value[:-1]
+    try:
+        return(float(value) * multiplier)
+    except ValueError:
+        return(None)
+
+def get_job_usage(fields):
+    '''
+    Get the (wallclock seconds, peak memory in GB) of a job from its accounting fields; either can be None
+    '''
+    wallclock = None
+    try:
+        wallclock = float(fields.get('ru_wallclock', '').rstrip('s'))
+    except ValueError:
+        pass
+    maxvmem_gb = parse_memory_gb(fields['maxvmem']) if 'maxvmem' in fields else None
+    return(wallclock, maxvmem_gb)
+
+def get_job_state(qstat_state = None, qacct_result = None):
+    '''
+    Get the tracker state of a job from its qstat state, or from its qacct failed and exit status values
+    '''
+    if qstat_state is not None:
+        if 'E' in qstat_state:
+            return(JOB_FAILED)
+        if 'r' in qstat_state or 't' in qstat_state or 'R' in qstat_state:
+            return(JOB_RUNNING)
+        return(JOB_QUEUED)
+    if qacct_result is not None:
+        failed, exit_status = qacct_result
+        if failed != '0' or exit_status != '0':
+            return(JOB_FAILED)
+        return(JOB_FINISHED)
+    return(JOB_UNKNOWN)
+
+def summarize_states(states):
+    '''
+    Get the overall state of a run from the states of its jobs
+    '''
+    for state in run_state_order:
+        if state in states:
+            return(state)
+    return(JOB_UNKNOWN)
+
+def run_query(command):
+    '''
+    Run a qstat or qacct command
+    return its stdout, or None if it could not be run
+    '''
+    try:
+        process = sp.Popen(command, stdout = sp.PIPE, stderr = sp.PIPE, universal_newlines = True)
+        stdout, stderr = process.communicate()
+    except OSError as e:
+        logger.error("Could not run command {0}: {1}".format(command, e))
+        return(None)
+    if process.returncode != 0:
+        # qacct returns an error when none of the jobs are in the accounting file yet
+        logger.debug("Command {0} returned {1}: {2}".format(command, process.returncode, stderr.strip()))
+    return(stdout)
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class JobTracker(object):
+    '''
+    SQLite backed record of the cluster jobs started for each run
+
+    tracker = JobTracker(db_file = 'db/sge_jobs.sqlite')
+    tracker.add_jobs(run_id = run.id, task = 'NGS580_demultiplexing', job_ids = parse_job_ids(result.output))
+    tracker.poll()
+    tracker.get_run_states()
+    '''
+    def __init__(self, db_file, qstat = 'qstat', qacct = 'qacct', accounting_days = 7, owner = None):
+        self.db_file = db_file
+        self.qstat = qstat
+        self.qacct = qacct
+        self.accounting_days = accounting_days
+        # only the accounting records for the jobs submitted by this user are searched
+        self.owner = owner or getpass.getuser()
+        self.lock = threading.Lock()
+        self.connection = connect(db_file)
+        self._init_tables()
+
+    def _init_tables(self):
+        '''
+        Create the jobs table if it does not exist; the usage columns are added to tables made before they were used
+        '''
+        with self.lock:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, run_id TEXT, task TEXT, state TEXT, sge_state TEXT, submitted REAL, updated REAL, wallclock REAL, maxvmem_gb REAL, left_queue REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_run_id ON jobs (run_id)')
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(jobs)').fetchall()]
+            for column in ['wallclock', 'maxvmem_gb', 'left_queue']:
+                if column not in columns:
+                    self.connection.execute('ALTER TABLE jobs ADD COLUMN {0} REAL'.format(column))
+            self.connection.commit()
+
+    def close(self):
+        '''
+        Close the connection to the database
+        '''
+        self.connection.close()
+
+    def add_jobs(self, run_id, task, job_ids):
+        '''
+        Start tracking the jobs submitted for a run
+        '''
+        now = time.time()
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO jobs (job_id, run_id, task, state, sge_state, submitted, updated) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(str(job_id), str(run_id), task, JOB_QUEUED, None, now, now) for job_id in job_ids])
+            self.connection.commit()
+        if job_ids:
+            logger.info("Tracking jobs for run {0}: {1}".format(run_id, ', '.join(job_ids)))
+
+    def get_active_jobs(self):
+        '''
+        Get the jobs that have not finished or failed yet
+        return a dict of jobs[job_id] = (run_id, task, state, time the job was first seen out of the queue or None)
+        '''
+        with self.lock:
+            rows = self.connection.execute('SELECT job_id, run_id, task, state, left_queue FROM jobs WHERE state NOT IN ({0})'.format(', '.join('?' for state in done_states)), done_states).fetchall()
+        return(dict((job_id, (run_id, task, state, left_queue)) for job_id, run_id, task, state, left_queue in rows))
+
+    def poll(self, now = None):
+        '''
+        Update the states of all the active jobs with one qstat call, and one qacct call when jobs have just left the queue
+
+        return a list of the jobs whose state changed; (job_id, run_id, task, old state, new state)
+        '''
+        jobs = self.get_active_jobs()
+        if not jobs:
+            return([])
+        qstat_output = run_query([self.qstat])
+        if qstat_output is None:
+            return([])
+        qstat_states = parse_qstat(qstat_output)
+        if now is None:
+            now = time.time()
+        # jobs that were in the queue in the last cycle, or that left it recently and were not in the accounting records yet
+        left_queue = [job_id for job_id, (run_id, task, state, left) in jobs.items() if job_id not in qstat_states and
+        (state != JOB_UNKNOWN or left is None or now - left < accounting_retry_minutes * 60)]
+        qacct_records = {}
+        if left_queue:
+            qacct_records = parse_qacct_records(run_query([self.qacct, '-o', self.owner, '-j', '*', '-d', str(self.accounting_days)]) or '')
+
+        changes = []
+        updates = []
+        usage_updates = []
+        for job_id, (run_id, task, old_state, left) in sorted(jobs.items()):
+            sge_state = qstat_states.get(job_id)
+            fields = qacct_records.get(job_id) if sge_state is None else None
+            state = get_job_state(qstat_state = sge_state, qacct_result = get_qacct_result(fields) if fields else None)
+            if sge_state is not None:
+                left = None
+            elif left is None:
+                left = now
+            if state == JOB_UNKNOWN and now - left >= self.accounting_days * 86400:
+                state = JOB_EXPIRED
+            updates.append((state, sge_state, now, left, job_id))
+            if fields:
+                usage_updates.append(get_job_usage(fields) + (job_id,))
+            if state != old_state:
+                changes.append((job_id, run_id, task, old_state, state))
+        with self.lock:
+            self.connection.executemany('UPDATE jobs SET state = ?, sge_state = ?, updated = ?, left_queue = ? WHERE job_id = ?', updates)
+            self.connection.executemany('UPDATE jobs SET wallclock = ?, maxvmem_gb = ? WHERE job_id = ?', usage_updates)
+            self.connection.commit()
+        return(changes)
+
+    def get_queue_depth(self):
+        '''
+        Get the number of jobs in the cluster queue for all users, from one qstat call; None if qstat could not be run
+        '''
+        qstat_output = run_query([self.qstat, '-u', '*'])
+        if qstat_output is None:
+            return(None)
+        return(len(parse_qstat(qstat_output)))
+
+    def get_run_usage(self, run_id, task):
+        '''
+        Get the resources used by the jobs for a run, once all of them are done
+        return a dict with the overall 'state', the longest 'wallclock' in seconds and the highest 'maxvmem_gb' of the jobs,
+        or None if the run has no jobs or some of them have not finished yet
+        '''
+        with self.lock:
+            rows = self.connection.execute('SELECT state, wallclock, maxvmem_gb FROM jobs WHERE run_id = ? AND task = ?', (str(run_id), task)).fetchall()
+        if not rows or any(state not in done_states for state, wallclock, maxvmem_gb in rows):
+            return(None)
+        wallclocks = [wallclock for state, wallclock, maxvmem_gb in rows if wallclock is not None]
+        memory = [maxvmem_gb for state, wallclock, maxvmem_gb in rows if maxvmem_gb is not None]
+        return({
+        'state': summarize_states([state for state, wallclock, maxvmem_gb in rows]),
+        'wallclock': max(wallclocks) if wallclocks else None,
+        'maxvmem_gb': max(memory) if memory else None
+        })
+
+    def get_in_flight_runs(self, task, now = None):
+        '''
+        Get the runs for a task that are still using the cluster; runs with jobs that are queued or running, or that left the queue
+        less than 'accounting_retry_minutes' ago and are not in the accounting records yet
+        jobs that stay unknown after that are not counted, so that a missing or slow qacct does not hold up new runs
+
+        return a set of run IDs
+        '''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            rows = self.connection.execute('SELECT run_id, state, left_queue FROM jobs WHERE task = ? AND state IN (?, ?, ?)',
+            (task, JOB_QUEUED, JOB_RUNNING, JOB_UNKNOWN)).fetchall()
+        return(set(run_id for run_id, state, left_queue in rows
+        if state != JOB_UNKNOWN or left_queue is None or now - left_queue < accounting_retry_minutes * 60))
+
+    def get_run_states(self, active_only = True):
+        '''
+        Get the overall state of the jobs for each run
+
+        return a dict of run_states[(run_id, task)] = state
+        '''
+        with self.lock:
+            rows = self.connection.execute('SELECT run_id, task, state FROM jobs').fetchall()
+        job_states = {}
+        for run_id, task, state in rows:
+            job_states.setdefault((run_id, task), []).append(state)
+        run_states = {}
+        for key, states in job_states.items():
+            if active_only and all(state in done_states for state in states):
+                continue
+            run_states[key] = summarize_states(states)
+        return(run_states)
+
+
+def get_tracker():
+    '''
+    Get the job tracker shared by all of the modules, made from the 'sge_tracking' settings in the monitor config
+    '''
+    global _tracker
+    with _lock:
+        if _tracker is None:
+            import config
+            settings = config.monitor['sge_tracking']
+            _tracker = JobTracker(db_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'db', 'sge_jobs.sqlite'),
+            qstat = settings['qstat'],
+            qacct = settings['qacct'],
+            accounting_days = settings['accounting_days'])
+        return(_tracker)
+
+def track_jobs(run_id, task, output):
+    '''
+    Start tracking the jobs that a run's script submitted, from the script's output
+    '''
+    job_ids = parse_job_ids(output)
+    if job_ids:
+        get_tracker().add_jobs(run_id = run_id, task = task, job_ids = job_ids)
+    return(job_ids)
+
+def report():
+    '''
+    Check the states of the tracked jobs, and log the runs whose jobs changed state and the runs with unfinished jobs
+    '''
+    tracker = get_tracker()
+    changed_runs = set()
+    for job_id, run_id, task, old_state, state in tracker.poll():
+        logger.debug("Job {0} for run {1} ({2}): {3} -> {4}".format(job_id, run_id, task, old_state, state))
+        changed_runs.add((run_id, task))
+    run_states = tracker.get_run_states(active_only = False)
+    for run_id, task in sorted(changed_runs):
+        state = run_states[(run_id, task)]
+        if state == JOB_FAILED:
+            logger.error("Cluster jobs failed for run {0} ({1})".format(run_id, task))
+        elif state == JOB_EXPIRED:
+            logger.warning("Cluster jobs for run {0} ({1}) left the queue but were not found in the accounting records; no longer checking them".format(run_id, task))
+        else:
+            logger.info("Cluster jobs for run {0} ({1}) are {2}".format(run_id, task, state))
+    for (run_id, task), state in sorted(tracker.get_run_states().items()):
+        logger.debug("Run {0} ({1}) jobs: {2}".format(run_id, task, state))
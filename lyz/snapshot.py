@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Snapshot of the files in a NextSeq run directory, used for validating runs
+
+All of the facts needed to validate a run are collected with one scan of the run's parent directory
+and one scan of its 'Data/Intensities/BaseCalls' directory, instead of checking each path separately.
+Each scan is done the first time one of its facts is needed.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("snapshot")
+logger.debug("loading snapshot module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+from datetime import datetime
+import run_metadata
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def scan_dir(path):
+    '''
+    List a directory in a single pass
+    return a dict of entries[name] = True if the entry is a directory, or None if the path cannot be listed
+    '''
+    entries = {}
+    try:
+        if scandir is not None:
+            for entry in scandir(path):
+                entries[entry.name] = entry.is_dir()
+        else:
+            for name in os.listdir(path):
+                entries[name] = os.path.isdir(os.path.join(path, name))
+    except OSError:
+        return(None)
+    return(entries)
+
+def read_first_line(path):
+    '''
+    Get the first line of a file, without whitespace; None if the file cannot be read or is empty
+    '''
+    try:
+        with open(path) as f:
+            for line in f:
+                return(line.strip())
+    except IOError:
+        logger.debug('File could not be read: {0}'.format(path))
+    return(None)
+
+def parse_RTAComplete_time(RTA_string):
+    '''
+    Get the time listed in the contents of the RTAComplete file
+    ex:
+    RTA 2.4.11 completed on 5/20/2017 9:47:13 PM
+    return None if there is no valid time in the string
+    '''
+    if not RTA_string:
+        return(None)
+    RTA_time = RTA_string.split("on ")[-1]
+    try:
+        return(datetime.strptime(RTA_time, '%m/%d/%Y %I:%M:%S %p'))
+    except ValueError:
+        logger.debug('Could not parse RTAComplete time: {0}'.format(RTA_string))
+        return(None)
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class RunSnapshot(object):
+    '''
+    Facts about the files in a NextSeq run directory
+
+    snapshot = RunSnapshot(run_dir = '/ifs/data/molecpathlab/quicksilver/170809_NB501073_0019_AH5FFYBGX3')
+    snapshot.run_dir_exists
+    snapshot.RTAComplete_time
+    snapshot.unaligned_dir_exists
+    '''
+    def __init__(self, run_dir, seqtype_file = 'seqtype.txt'):
+        self.run_dir = run_dir
+        self.basecalls_dir = os.path.join(run_dir, "Data", "Intensities", "BaseCalls")
+        self.seqtype_file = seqtype_file
+        self._run_entries = None
+        self._basecalls_entries = None
+        self._files = {}
+
+    @property
+    def run_entries(self):
+        '''
+        The items in the run's parent directory
+        '''
+        if self._run_entries is None:
+            self._run_entries = scan_dir(self.run_dir)
+            if self._run_entries is None:
+                self._run_entries = False
+        return(self._run_entries)
+
+    @property
+    def basecalls_entries(self):
+        '''
+        The items in the run's BaseCalls directory
+        '''
+        if self._basecalls_entries is None:
+            self._basecalls_entries = False
+            if self.run_entries and self.run_entries.get('Data'):
+                # an empty BaseCalls dir still exists
+                entries = scan_dir(self.basecalls_dir)
+                if entries is not None:
+                    self._basecalls_entries = entries
+        return(self._basecalls_entries)
+
+    def has_file(self, name):
+        '''
+        Check if the run's parent directory has a file with the given name
+        '''
+        return(bool(self.run_entries) and self.run_entries.get(name) is False)
+
+    def read_file(self, name):
+        '''
+        Get the first line of a file in the run's parent directory
+        '''
+        if name not in self._files:
+            self._files[name] = None
+            if self.has_file(name):
+                self._files[name] = read_first_line(os.path.join(self.run_dir, name))
+        return(self._files[name])
+
+    @property
+    def run_dir_exists(self):
+        return(self.run_entries is not False)
+
+    @property
+    def basecalls_dir_exists(self):
+        return(self.basecalls_entries is not False)
+
+    @property
+    def unaligned_dir_exists(self):
+        return(bool(self.basecalls_entries) and self.basecalls_entries.get('Unaligned') is True)
+
+    @property
+    def RTAComplete_file_exists(self):
+        return(self.has_file('RTAComplete.txt'))
+
+    @property
+    def RunInfo_file_exists(self):
+        return(self.has_file('RunInfo.xml'))
+
+    @property
+    def RunCompletionStatus_file_exists(self):
+        return(self.has_file('RunCompletionStatus.xml'))
+
+    @property
+    def RTAComplete_string(self):
+        return(self.read_file('RTAComplete.txt'))
+
+    @property
+    def RTAComplete_time(self):
+        return(parse_RTAComplete_time(self.RTAComplete_string))
+
+    @property
+    def seqtype(self):
+        return(self.read_file(self.seqtype_file))
+
+    @property
+    def run_info(self):
+        '''
+        The metadata from the RunInfo.xml file, or None if it could not be read
+        '''
+        if not self.RunInfo_file_exists:
+            return(None)
+        return(run_metadata.get_run_info(os.path.join(self.run_dir, 'RunInfo.xml')))
+
+    @property
+    def completion_status(self):
+        '''
+        The metadata from the RunCompletionStatus.xml file, or None if it could not be read
+        '''
+        if not self.RunCompletionStatus_file_exists:
+            return(None)
+        return(run_metadata.get_completion_status(os.path.join(self.run_dir, 'RunCompletionStatus.xml')))
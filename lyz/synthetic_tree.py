@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Generator for synthetic sequencer directory trees, for benchmarking the run monitors
+
+Builds a copy of the 'quicksilver' layout with any number of NextSeq runs in a mix of states,
+with the samplesheets for the runs that are waiting to be demultiplexed, and the output dirs
+for the runs that have already been analyzed:
+
+<root>/
+    quicksilver/                                 sequencer dir
+        <run_id>/                                one dir per run
+        to_be_demultiplexed/NGS580/              samplesheet dir
+            <run_id>-SampleSheet.csv
+            <run_id>-samples.pairs.csv
+        to_be_demultiplexed/processed/
+    NGS580_WES/                                  analysis output dir
+        <run_id>/
+        targets/
+
+Run states:
+- in_progress: still sequencing; no RTAComplete.txt
+- complete: finished sequencing long ago, with a samplesheet; ready to be demultiplexed
+- recent: finished sequencing within the RTA completion window, with a samplesheet
+- broken: finished sequencing, but missing its RunInfo.xml
+- test: a '_test' run, which should be excluded
+- demultiplexing: demultiplexing started; has an 'Unaligned' dir but no stats yet
+- demultiplexed: demultiplexing finished; ready for analysis
+- analyzed: analysis already started and has an output dir
+
+The tree is made the same way every time for the same number of runs, mix, and seed.
+
+Usage:
+python synthetic_tree.py /tmp/quicksilver_tree --runs 5000
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("synthetic_tree")
+logger.debug("loading synthetic_tree module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from samplesheet import hamming_distance
+
+# fraction of the runs in each state; a long running sequencer dir is mostly old, analyzed runs
+default_mix = [
+('analyzed', 0.70),
+('test', 0.08),
+('demultiplexed', 0.05),
+('broken', 0.05),
+('demultiplexing', 0.03),
+('complete', 0.03),
+('recent', 0.03),
+('in_progress', 0.03)
+]
+instruments = ['NB501073', 'NB500905', 'NB551089']
+lane_count = 4
+# used for the newest runs, so that 'recent' runs are always inside the RTA completion window
+recent_minutes = 30
+
+RunInfo_template = '''<?xml version="1.0"?>
+<RunInfo xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" Version="2">
+  <Run Id="{run_id}" Number="{number}">
+    <Flowcell>{flowcell}</Flowcell>
+    <Instrument>{instrument}</Instrument>
+    <Date>{date}</Date>
+    <Reads>
+      <Read Number="1" NumCycles="151" IsIndexedRead="N" />
+      <Read Number="2" NumCycles="8" IsIndexedRead="Y" />
+      <Read Number="3" NumCycles="151" IsIndexedRead="N" />
+    </Reads>
+    <FlowcellLayout LaneCount="{lane_count}" SurfaceCount="2" SwathCount="3" TileCount="12" />
+  </Run>
+</RunInfo>
+'''
+
+RunCompletionStatus_template = '''<?xml version="1.0"?>
+<RunCompletionStatus xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <CompletionStatus>CompletedAsPlanned</CompletionStatus>
+  <RunId>{run_id}</RunId>
+  <ErrorDescription>None</ErrorDescription>
+  <CalculatedTotalCycles>310</CalculatedTotalCycles>
+  <ActualTotalCycles>310</ActualTotalCycles>
+</RunCompletionStatus>
+'''
+
+SampleSheet_template = '''[Header]
+IEMFileVersion,4
+Experiment Name,{run_id}
+Date,{date}
+Workflow,GenerateFASTQ
+Application,NextSeq FASTQ Only
+Assay,TruSeq HT
+Chemistry,Default
+
+[Reads]
+151
+151
+
+[Data]
+Sample_ID,Sample_Name,Sample_Plate,Sample_Well,I7_Index_ID,index,Sample_Project,Description
+{samples}
+'''
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_layout(root):
+    '''
+    Get the paths of the directories in a synthetic tree
+    '''
+    layout = {}
+    layout['root'] = root
+    layout['sequencer_dir'] = os.path.join(root, 'quicksilver')
+    layout['samplesheet_source_dir'] = os.path.join(layout['sequencer_dir'], 'to_be_demultiplexed', 'NGS580')
+    layout['samplesheet_processed_dir'] = os.path.join(layout['sequencer_dir'], 'to_be_demultiplexed', 'processed')
+    layout['analysis_output_dir'] = os.path.join(root, 'NGS580_WES')
+    return(layout)
+
+def choose_states(n_runs, mix, rng):
+    '''
+    Get the state of each run, in the proportions of the mix
+    '''
+    names = [name for name, fraction in mix]
+    weights = [fraction for name, fraction in mix]
+    total = float(sum(weights))
+    states = []
+    cumulative = 0.0
+    for name, weight in zip(names, weights):
+        cumulative += weight
+        # the number of runs for each state, rounded so that the counts add up to n_runs
+        count = int(round(cumulative / total * n_runs)) - len(states)
+        states.extend([name] * count)
+    rng.shuffle(states)
+    return(states)
+
+def make_run_id(index, date, rng):
+    '''
+    Make a NextSeq run ID, e.g. 170809_NB501073_0019_AH5FFYBGX3
+    '''
+    instrument = instruments[index % len(instruments)]
+    flowcell = 'H' + ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789') for i in range(4)) + 'BGX' + str(rng.randint(2, 9))
+    run_id = '{0}_{1}_{2:04d}_A{3}'.format(date.strftime('%y%m%d'), instrument, index % 10000, flowcell)
+    return(run_id, instrument, flowcell)
+
+def write_file(path, contents = ''):
+    '''
+    Write a file, creating its parent directories
+    '''
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    with open(path, 'w') as f:
+        f.write(contents)
+
+def format_RTAComplete(complete_time):
+    '''
+    Make the contents of an RTAComplete.txt file
+    '''
+    hour = complete_time.hour % 12 or 12
+    return('RTA 2.4.11 completed on {0}/{1}/{2} {3}:{4:02d}:{5:02d} {6}\n'.format(complete_time.month, complete_time.day, complete_time.year,
+    hour, complete_time.minute, complete_time.second, 'PM' if complete_time.hour >= 12 else 'AM'))
+
+def make_indexes(count, rng, length = 8, min_distance = 3):
+    '''
+    Make random indexes for the samples of a run, at least 'min_distance' apart so that the samplesheets
+    pass the index collision check with 1 barcode mismatch
+    '''
+    indexes = []
+    while len(indexes) < count:
+        index = ''.join(rng.choice('ACGT') for i in range(length))
+        if all(hamming_distance(index, other) >= min_distance for other in indexes):
+            indexes.append(index)
+    return(indexes)
+
+def make_stats_json(run_id, flowcell, samples, rng):
+    '''
+    Make the contents of a bcl2fastq Stats.json file for the samples
+    '''
+    results = []
+    for lane in range(1, lane_count + 1):
+        demux_results = [{'SampleId': sample, 'SampleName': sample, 'NumberReads': rng.randint(500000, 5000000)} for sample in samples]
+        results.append({'LaneNumber': lane, 'DemuxResults': demux_results, 'Undetermined': {'NumberReads': rng.randint(10000, 200000)}})
+    return(json.dumps({'Flowcell': flowcell, 'RunId': run_id, 'ConversionResults': results}, indent = 2))
+
+def make_run(layout, index, state, date, now, rng, cycles = 2):
+    '''
+    Make the directory and files for one run in the given state; 'date' is when the run finished sequencing
+    return the run ID
+    '''
+    if state == 'recent':
+        complete_time = now - timedelta(minutes = rng.randint(1, recent_minutes))
+    else:
+        complete_time = date
+    # a NextSeq run takes about 30 hours
+    run_date = complete_time - timedelta(hours = 30)
+    run_id, instrument, flowcell = make_run_id(index = index, date = run_date, rng = rng)
+    if state == 'test':
+        run_id = run_id + '_test'
+    run_dir = os.path.join(layout['sequencer_dir'], run_id)
+    basecalls_dir = os.path.join(run_dir, 'Data', 'Intensities', 'BaseCalls')
+    samples = ['{0}-{1}'.format(flowcell, i) for i in range(1, rng.randint(4, 24))]
+
+    write_file(os.path.join(run_dir, 'RunParameters.xml'), '<?xml version="1.0"?>\n<RunParameters />\n')
+    if state != 'broken':
+        write_file(os.path.join(run_dir, 'RunInfo.xml'), RunInfo_template.format(run_id = run_id, number = index % 10000, flowcell = flowcell,
+        instrument = instrument, date = '{0}/{1}/{2}'.format(run_date.month, run_date.day, run_date.year), lane_count = lane_count))
+    # a few cycles of basecalls for each lane
+    for lane in range(1, lane_count + 1):
+        for cycle in range(1, cycles + 1):
+            write_file(os.path.join(basecalls_dir, 'L{0:03d}'.format(lane), '{0:04d}.bcl.bgzf'.format(cycle)))
+    if state == 'in_progress':
+        return(run_id)
+
+    write_file(os.path.join(run_dir, 'RTAComplete.txt'), format_RTAComplete(complete_time))
+    write_file(os.path.join(run_dir, 'RunCompletionStatus.xml'), RunCompletionStatus_template.format(run_id = run_id))
+    if state in ('complete', 'recent', 'broken'):
+        sheet_samples = '\n'.join('{0},{0},,,,{1},NGS580,'.format(sample, index) for sample, index in zip(samples, make_indexes(count = len(samples), rng = rng)))
+        write_file(os.path.join(layout['samplesheet_source_dir'], '{0}-SampleSheet.csv'.format(run_id)),
+        SampleSheet_template.format(run_id = run_id, date = run_date.strftime('%m/%d/%Y'), samples = sheet_samples))
+        return(run_id)
+    if state == 'test':
+        return(run_id)
+
+    # demultiplexing has started
+    unaligned_dir = os.path.join(basecalls_dir, 'Unaligned')
+    write_file(os.path.join(run_dir, 'seqtype.txt'), 'NGS580\n')
+    write_file(os.path.join(run_dir, 'demultiplexing_started.txt'), complete_time.strftime('%Y-%m-%d-%H-%M-%S'))
+    write_file(os.path.join(unaligned_dir, 'bcl2fastq_env.txt'))
+    if state == 'demultiplexing':
+        return(run_id)
+
+    write_file(os.path.join(unaligned_dir, 'Stats', 'Stats.json'), make_stats_json(run_id = run_id, flowcell = flowcell, samples = samples, rng = rng))
+    write_file(os.path.join(unaligned_dir, 'Demultiplex_Stats.htm'))
+    for sample in samples:
+        write_file(os.path.join(unaligned_dir, 'NGS580', '{0}_S1_R1_001.fastq.gz'.format(sample)))
+    if state == 'demultiplexed':
+        write_file(os.path.join(layout['samplesheet_source_dir'], '{0}-samples.pairs.csv'.format(run_id)), '#SAMPLE-T,#SAMPLE-N\n')
+    if state == 'analyzed':
+        write_file(os.path.join(run_dir, 'NGS580_analysis_started.txt'), complete_time.strftime('%Y-%m-%d-%H-%M-%S'))
+        write_file(os.path.join(layout['analysis_output_dir'], run_id, 'samples.fastq-raw.csv'))
+    return(run_id)
+
+def set_times(path, timestamp):
+    '''
+    Set the modification time of a directory and everything in it, so the tree looks like it was written when the run finished
+    '''
+    for parent, dirs, files in os.walk(path, topdown = False):
+        for name in files:
+            os.utime(os.path.join(parent, name), (timestamp, timestamp))
+        os.utime(parent, (timestamp, timestamp))
+
+def make_tree(root, n_runs = 1000, mix = None, seed = 0, cycles = 2, now = None):
+    '''
+    Make a synthetic sequencer tree with 'n_runs' runs
+
+    return a dict with the 'layout' of the tree, and the 'runs' in each state; runs[state] = [run_id, ...]
+    '''
+    if mix is None:
+        mix = default_mix
+    if now is None:
+        now = datetime.now()
+    rng = random.Random(seed)
+    layout = get_layout(root)
+    for key in ['sequencer_dir', 'samplesheet_source_dir', 'samplesheet_processed_dir']:
+        if not os.path.isdir(layout[key]):
+            os.makedirs(layout[key])
+    os.makedirs(os.path.join(layout['analysis_output_dir'], 'targets'))
+
+    states = choose_states(n_runs = n_runs, mix = mix, rng = rng)
+    # the runs finished sequencing over the past few years, oldest first, one run every 8 hours
+    start_date = now - timedelta(hours = 8 * n_runs)
+    runs = {}
+    for index, state in enumerate(states):
+        date = start_date + timedelta(hours = 8 * index)
+        run_id = make_run(layout = layout, index = index, state = state, date = date, now = now, rng = rng, cycles = cycles)
+        if state != 'recent':
+            set_times(path = os.path.join(layout['sequencer_dir'], run_id), timestamp = time.mktime(date.timetuple()))
+        runs.setdefault(state, []).append(run_id)
+    logger.info("Made {0} runs in {1}: {2}".format(n_runs, root, ', '.join('{0} {1}'.format(len(ids), state) for state, ids in sorted(runs.items()))))
+    return({'layout': layout, 'runs': runs})
+
+def parse_mix(text):
+    '''
+    Parse a mix of run states from the command line, e.g. 'analyzed=0.5,complete=0.5'
+    '''
+    mix = []
+    for item in text.split(','):
+        name, fraction = item.split('=')
+        mix.append((name.strip(), float(fraction)))
+    return(mix)
+
+def run():
+    '''
+    Make a tree from the command line arguments
+    '''
+    parser = argparse.ArgumentParser(description = 'Make a synthetic sequencer directory tree for benchmarking')
+    parser.add_argument("root", help = "Directory to make the tree in; must not exist yet")
+    parser.add_argument("--runs", default = 1000, type = int, dest = 'n_runs', help = "Number of runs to make")
+    parser.add_argument("--seed", default = 0, type = int, dest = 'seed', help = "Random seed")
+    parser.add_argument("--cycles", default = 2, type = int, dest = 'cycles', help = "Number of basecall cycles to make for each lane")
+    parser.add_argument("--mix", default = None, type = parse_mix, dest = 'mix', help = "Fraction of runs in each state, e.g. 'analyzed=0.5,complete=0.5'")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.INFO)
+    if os.path.exists(args.root):
+        parser.error('directory already exists: {0}'.format(args.root))
+    make_tree(root = args.root, n_runs = args.n_runs, mix = args.mix, seed = args.seed, cycles = args.cycles)
+
+if __name__ == "__main__":
+    run()
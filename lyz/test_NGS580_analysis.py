@@ -6,7 +6,15 @@ unit tests for the find module
 '''
 import unittest
 import os
+import shutil
+import tempfile
+import locations
+import deadlines
+import metrics
+import rules
+import NGS580_analysis
 from NGS580_analysis import NextSeqRun
+from NGS580_analysis import run_rules
 from util import log
 
 scriptdir = os.path.dirname(os.path.realpath(__file__))
@@ -25,10 +33,14 @@ configs['script_timestamp'] = log.timestamp()
 
 configs['timestamp'] = log.timestamp()
 configs['seqtype_file'] = 'seqtype.txt'
+configs['RTA_completion_window'] = 5400
 configs['seqtype'] = 'seqtype'
 configs['analysis_started_file'] = 'NGS580_analysis_started.txt'
 configs['samplesheet_source_dir'] = '/ifs/data/molecpathlab/quicksilver/to_be_demultiplexed/NGS580'
 configs['samples_pairs_sheet_pattern'] = '*-samples.pairs.csv'
+configs['min_sample_reads'] = 100000
+configs['max_undetermined_fraction'] = 0.5
+configs['max_run_age_days'] = 0
 
 
 class TestNextSeqRun(unittest.TestCase):
@@ -49,6 +61,20 @@ class TestNextSeqRun(unittest.TestCase):
         x.logger = log.remove_all_handlers(logger = x.logger)
         self.assertTrue(x.validate(), 'Valid run did not pass validations')
 
+    def test_location_RTA_completion_window(self):
+        '''
+        A location's 'RTA_completion_window' option is used for its runs, and for their facts saved in the run catalog
+        '''
+        run_id = '170809_NB501073_0019_AH5FFYBGX3'
+        window = 100 * 365 * 86400
+        location = locations.Location(name = 'slow', path = sequencer_dir, options = {'RTA_completion_window': window})
+        x = NextSeqRun(id = run_id, config = location.get_run_config(config = configs, run_id = run_id))
+        x.logger = log.remove_all_handlers(logger = x.logger)
+        self.assertFalse(x.validate())
+        self.assertEqual([name for name, passed in x.validations.items() if not passed], ['RTA_completion_time_validation'])
+        self.assertFalse(NGS580_analysis.facts_are_valid(x.get_facts(), window = window))
+        self.assertTrue(NGS580_analysis.facts_are_valid(x.get_facts(), window = configs['RTA_completion_window']))
+
     def test_invalid_NextSeq_run1(self):
         '''
         Missing RunInfo.xml
@@ -58,6 +84,96 @@ class TestNextSeqRun(unittest.TestCase):
         x.logger = log.remove_all_handlers(logger = x.logger)
         self.assertFalse(x.validate(), 'Invalid run passed validations')
 
+    def test_invalid_NextSeq_run1_explain(self):
+        '''
+        All rules are checked in explain mode; the run is missing RunInfo.xml, seqtype.txt, and its demultiplexing stats
+        '''
+        run_id = '170809_NB501073_0019_AH5FFYBGX3_broke1'
+        x = NextSeqRun(id = run_id, config = configs)
+        x.logger = log.remove_all_handlers(logger = x.logger)
+        self.assertFalse(x.validate(explain = True), 'Invalid run passed validations')
+        self.assertEqual(len(x.validations), len(run_rules.rules))
+        self.assertEqual(sorted(name for name, value in x.validations.items() if not value), ['RunInfo_file_validation', 'demux_stats_validation', 'seqtype_validation'])
+
+    def test_time_rule_last(self):
+        '''
+        The RTA completion time is checked after all of the other rules, so that runs waiting for it can be scheduled
+        '''
+        self.assertEqual(run_rules.rules[-1].name, 'RTA_completion_time_validation')
+        self.assertTrue(all(rule.cost < rules.COST_TIME for rule in run_rules.rules[:-1]))
+
+class TestPlanRuns(unittest.TestCase):
+    def setUp(self):
+        '''
+        Copy the demo runs to two sequencer locations, one with a directory for each instrument
+        '''
+        self.tmpdir = tempfile.mkdtemp()
+        self.flat_dir = os.path.join(self.tmpdir, 'quicksilver')
+        self.instrument_dir = os.path.join(self.tmpdir, 'nextseq')
+        shutil.copytree(os.path.join(sequencer_dir, '170809_NB501073_0019_AH5FFYBGX3_broke1'), os.path.join(self.flat_dir, '170809_NB501073_0019_AH5FFYBGX3_broke1'), symlinks = True)
+        shutil.copytree(os.path.join(sequencer_dir, '170809_NB501073_0019_AH5FFYBGX3'), os.path.join(self.instrument_dir, 'NB501073', '170809_NB501073_0019_AH5FFYBGX3'), symlinks = True)
+        self.locations = NGS580_analysis.sequencer_locations
+        self.configs = dict(NGS580_analysis.configs)
+        NGS580_analysis.sequencer_locations = [
+        locations.Location(name = 'quicksilver', path = self.flat_dir, layout = 'flat'),
+        locations.Location(name = 'nextseq', path = self.instrument_dir, layout = 'by_instrument')
+        ]
+        NGS580_analysis.configs.update(configs)
+        NGS580_analysis.configs['catalog_file'] = os.path.join(self.tmpdir, 'run_catalog.sqlite')
+        NGS580_analysis.configs['validation_threads'] = 1
+        NGS580_analysis.configs['explain_validations'] = False
+        self.handlers = NGS580_analysis.logger.handlers
+        NGS580_analysis.logger.handlers = []
+        # runs waiting for their RTA completion window are scheduled in a temporary queue; the worker processes open the same file
+        self.queue = deadlines._queue
+        deadlines._queue = deadlines.DeadlineQueue(db_file = os.path.join(self.tmpdir, 'deadlines.sqlite'))
+
+    def tearDown(self):
+        deadlines._queue.close()
+        deadlines._queue = self.queue
+        NGS580_analysis.sequencer_locations = self.locations
+        NGS580_analysis.configs.clear()
+        NGS580_analysis.configs.update(self.configs)
+        NGS580_analysis.logger.handlers = self.handlers
+        shutil.rmtree(self.tmpdir)
+
+    def test_plan_runs(self):
+        '''
+        The runs in all of the locations are checked in worker processes; the ready runs are made again with their location's configs
+        '''
+        runs = NGS580_analysis.plan_runs(completed_runs = {}, processes = 2)
+        self.assertEqual([run.id for run in runs], ['170809_NB501073_0019_AH5FFYBGX3'])
+        self.assertEqual(runs[0].run_dir, os.path.join(self.instrument_dir, 'NB501073', '170809_NB501073_0019_AH5FFYBGX3'))
+        self.assertEqual(runs[0].config['location'], 'nextseq')
+        # the facts from the worker's validation are kept, and only the recheck rules are checked again
+        self.assertEqual(runs[0].seqtype, 'NGS580')
+        # so are the log messages from the worker's validation, to be written to the run's log file when it is started
+        self.assertTrue(any('All run validations passed: True' in record.getMessage() for record in runs[0].log_handler.records))
+        self.assertTrue(runs[0].recheck())
+        self.assertEqual(len(runs[0].validations), len(run_rules.rules))
+        # completed runs are skipped
+        self.assertEqual(NGS580_analysis.plan_runs(completed_runs = {'170809_NB501073_0019_AH5FFYBGX3': 'foo'}, processes = 2), [])
+
+    def test_runs_scanned(self):
+        '''
+        Every directory listed is counted once, whether it is dropped by its name or checked in a worker process
+        '''
+        os.makedirs(os.path.join(self.flat_dir, 'to_be_demultiplexed'))
+        for processes in [1, 2]:
+            metrics.start_cycle()
+            NGS580_analysis.plan_runs(completed_runs = {}, processes = processes)
+            counters = [counter['value'] for counter in metrics.get_metrics().to_dict()['counters'] if counter['name'] == 'runs_scanned']
+            self.assertEqual(counters, [3])
+
+    def test_max_run_age(self):
+        '''
+        Runs older than the cutoff are dropped from the listing, before they are sent to the worker processes
+        '''
+        NGS580_analysis.configs['max_run_age_days'] = 30
+        NGS580_analysis.configs['catalog_file'] = os.path.join(self.tmpdir, 'foo', 'run_catalog.sqlite')
+        self.assertEqual(NGS580_analysis.plan_runs(completed_runs = {}, processes = 2), [])
+        self.assertFalse(os.path.exists(os.path.dirname(NGS580_analysis.configs['catalog_file'])))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -6,6 +6,13 @@ unit tests for the find module
 '''
 import unittest
 import os
+import shutil
+import tempfile
+import lease
+import config
+import resources
+import outbox
+import quiescence
 from NGS580_demultiplexing import NextSeqRun
 from util import log
 
@@ -30,6 +37,10 @@ configs['samplesheet_processed_dir'] = samplesheet_processed_dir
 configs['seqtype'] = 'NGS580'
 
 configs['seqtype_file'] = 'seqtype.txt'
+configs['RTA_completion_window'] = 5400
+configs['copy_quiet_period'] = 600
+configs['barcode_mismatches'] = 1
+configs['resources'] = config.NGS580_demultiplexing['resources']
 configs['demultiplexing_started_file'] = 'demultiplexing_started.txt'
 configs['timestamp'] = script_timestamp
 
@@ -63,6 +74,90 @@ class TestNextSeqRun(unittest.TestCase):
         x.logger = log.remove_all_handlers(logger = x.logger)
         self.assertFalse(x.validate(), 'Invalid run passed validations')
 
+    def test_bad_samplesheet_NextSeq_run(self):
+        '''
+        A run whose samplesheet has an index collision is not valid
+        '''
+        run_id = '170809_NB501073_0019_AH5FFYBGX3_notdemultiplexed'
+        tmpdir = tempfile.mkdtemp()
+        try:
+            samplesheet = os.path.join(tmpdir, '{0}-SampleSheet.csv'.format(run_id))
+            with open(samplesheet, 'w') as f:
+                f.write('[Data]\nSample_ID,index\nSample1,GATCGATC\nSample2,GATCGATG\n')
+            x = NextSeqRun(id = run_id, samplesheet = samplesheet, config = configs)
+            x.logger = log.remove_all_handlers(logger = x.logger)
+            self.assertFalse(x.validate(), 'Run with a bad samplesheet passed validations')
+            self.assertFalse(x.validations['samplesheet_validation'])
+            self.assertEqual(len(x.samplesheet_problems), 1)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_estimate_resources(self):
+        '''
+        The resources for the demultiplexing job are estimated from the samplesheet and RunInfo.xml, and passed to the script
+        '''
+        run_id = '170809_NB501073_0019_AH5FFYBGX3_notdemultiplexed'
+        samplesheet = os.path.join(samplesheet_source_dir, '170809_NB501073_0019_AH5FFYBGX3_notdemultiplexed-SampleSheet.csv')
+        tmpdir = tempfile.mkdtemp()
+        history = resources._history
+        resources._history = resources.ResourceHistory(db_file = os.path.join(tmpdir, 'resources.sqlite'))
+        try:
+            x = NextSeqRun(id = run_id, samplesheet = samplesheet, config = configs)
+            x.logger = log.remove_all_handlers(logger = x.logger)
+            self.assertTrue(x.validate())
+            estimate = x.estimate_resources()
+            self.assertEqual((estimate['samples'], estimate['cycles'], estimate['lanes']), (3, 310, 4))
+            self.assertTrue(resources.format_command(command = x.command, estimate = estimate).startswith('LYZ_SLOTS={0} '.format(estimate['slots'])))
+        finally:
+            resources._history.close()
+            resources._history = history
+            shutil.rmtree(tmpdir)
+
+    def test_failed_start_releases_claim(self):
+        '''
+        The claim is removed when the demultiplexing script could not be started, so the run can be tried again
+        '''
+        run_id = '170809_NB501073_0019_AH5FFYBGX3_notdemultiplexed'
+        tmpdir = tempfile.mkdtemp()
+        stores = (outbox._outbox, quiescence._store, resources._history)
+        try:
+            outbox._outbox = outbox.Outbox(outbox_dir = os.path.join(tmpdir, 'outbox'))
+            quiescence._store = quiescence.ManifestStore(db_file = os.path.join(tmpdir, 'manifests.sqlite'))
+            resources._history = resources.ResourceHistory(db_file = os.path.join(tmpdir, 'resources.sqlite'))
+            shutil.copytree(os.path.join(sequencer_dir, run_id), os.path.join(tmpdir, run_id), symlinks = True)
+            samplesheet = os.path.join(tmpdir, '{0}-SampleSheet.csv'.format(run_id))
+            shutil.copy2(os.path.join(samplesheet_source_dir, os.path.basename(samplesheet)), samplesheet)
+            os.makedirs(os.path.join(tmpdir, 'processed'))
+            run_configs = dict(configs, sequencer_dir = tmpdir, logdir = tmpdir, samplesheet_processed_dir = os.path.join(tmpdir, 'processed'),
+            demultiplex_580_script = 'exit 1;', launch_timeout = 10)
+            x = NextSeqRun(id = run_id, samplesheet = samplesheet, config = run_configs)
+            x.logger = log.remove_all_handlers(logger = x.logger)
+            result = x.start()
+            self.assertFalse(result.succeeded)
+            self.assertIsNone(lease.get_claim(run_dir = os.path.join(tmpdir, run_id), task = 'NGS580_demultiplexing'))
+        finally:
+            quiescence._store.close()
+            resources._history.close()
+            outbox._outbox, quiescence._store, resources._history = stores
+            shutil.rmtree(tmpdir)
+
+    def test_claimed_NextSeq_run(self):
+        '''
+        A run that was already claimed for demultiplexing is not valid
+        '''
+        run_id = '170809_NB501073_0019_AH5FFYBGX3_notdemultiplexed'
+        samplesheet = os.path.join(samplesheet_source_dir, '170809_NB501073_0019_AH5FFYBGX3_notdemultiplexed-SampleSheet.csv')
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copytree(os.path.join(sequencer_dir, run_id), os.path.join(tmpdir, run_id), symlinks = True)
+            run_configs = dict(configs, sequencer_dir = tmpdir)
+            self.assertTrue(lease.claim_run(run_dir = os.path.join(tmpdir, run_id), task = 'NGS580_demultiplexing'))
+            x = NextSeqRun(id = run_id, samplesheet = samplesheet, config = run_configs)
+            x.logger = log.remove_all_handlers(logger = x.logger)
+            self.assertFalse(x.validate(), 'Claimed run passed validations')
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()
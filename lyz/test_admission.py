@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the admission module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+import admission
+import deadlines
+
+class DemoRun(object):
+    '''
+    Minimal stand-in for a validated NextSeqRun
+    '''
+    def __init__(self, id, RTAComplete_time = None):
+        self.id = id
+        self.RTAComplete_time = RTAComplete_time
+        self.run_dir = os.path.join('/data', id)
+        self.deferred = None
+
+    def log_deferred(self, reason):
+        self.deferred = reason
+
+def make_settings(**kwargs):
+    settings = {'max_in_flight_runs': 0, 'max_queue_depth': 0, 'min_free_gb': 0, 'retry_interval': 900, 'priorities': {}}
+    settings.update(kwargs)
+    return(settings)
+
+class TestAdmission(unittest.TestCase):
+    def setUp(self):
+        self.runs = [
+        DemoRun(id = '170811_NB501073_0021_AHHK37BGX3', RTAComplete_time = datetime(2017, 8, 11, 9, 0)),
+        DemoRun(id = '170809_NB501073_0019_AH5FFYBGX3', RTAComplete_time = datetime(2017, 8, 9, 9, 0)),
+        DemoRun(id = '170810_NB501073_0020_AHCLLMBGX2'),
+        DemoRun(id = '170810_NB501074_0005_AHHHHHBGX2', RTAComplete_time = datetime(2017, 8, 10, 9, 0))
+        ]
+
+    def test_sort_runs(self):
+        '''
+        Oldest RTAComplete time first, runs without one last, and runs with a priority before all of them
+        '''
+        self.assertEqual([run.id for run in admission.sort_runs(self.runs)], [
+        '170809_NB501073_0019_AH5FFYBGX3', '170810_NB501074_0005_AHHHHHBGX2', '170811_NB501073_0021_AHHK37BGX3', '170810_NB501073_0020_AHCLLMBGX2'])
+        priorities = {'*_AHHK37BGX3': 10, '*_NB501074_*': 5}
+        self.assertEqual([run.id for run in admission.sort_runs(self.runs, priorities = priorities)][:2], ['170811_NB501073_0021_AHHK37BGX3', '170810_NB501074_0005_AHHHHHBGX2'])
+
+    def test_in_flight_cap(self):
+        '''
+        Runs admitted in this cycle count towards the cap
+        '''
+        checker = admission.Admission(task = 'foo', settings = make_settings(max_in_flight_runs = 3), in_flight = 1)
+        admitted, deferred = checker.admit(runs = self.runs, get_output_dir = lambda run: run.run_dir)
+        self.assertEqual([run.id for run in admitted], ['170809_NB501073_0019_AH5FFYBGX3', '170810_NB501074_0005_AHHHHHBGX2'])
+        self.assertEqual(len(deferred), 2)
+        self.assertIn('max_in_flight_runs', deferred[0][1])
+
+    def test_queue_depth(self):
+        checker = admission.Admission(task = 'foo', settings = make_settings(max_queue_depth = 100), queue_depth = 100)
+        admitted, deferred = checker.admit(runs = self.runs, get_output_dir = lambda run: run.run_dir)
+        self.assertEqual(admitted, [])
+        self.assertIn('100 jobs are in the cluster queue', deferred[0][1])
+        checker = admission.Admission(task = 'foo', settings = make_settings(max_queue_depth = 100), queue_depth = 99)
+        self.assertEqual(len(checker.admit(runs = self.runs, get_output_dir = lambda run: run.run_dir)[0]), 4)
+
+    def test_free_space(self):
+        '''
+        Runs are deferred when their output filesystem is short on space; each path is only checked once
+        '''
+        checked = []
+        def get_free_gb(path):
+            checked.append(path)
+            return(10.0 if path == '/full' else 1000.0)
+        checker = admission.Admission(task = 'foo', settings = make_settings(min_free_gb = 500), get_free_gb = get_free_gb)
+        admitted, deferred = checker.admit(runs = self.runs, get_output_dir = lambda run: '/full' if 'NB501074' in run.id else '/empty')
+        self.assertEqual([run.id for run, reason in deferred], ['170810_NB501074_0005_AHHHHHBGX2'])
+        self.assertEqual(len(admitted), 3)
+        self.assertEqual(sorted(checked), ['/empty', '/full'])
+
+    def test_get_free_gb(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            free_gb = admission.get_free_gb(os.path.join(tmpdir, 'foo', 'bar'))
+            self.assertTrue(free_gb is None or free_gb >= 0)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_admit_runs(self):
+        '''
+        Deferred runs are logged and scheduled to be checked again
+        '''
+        tmpdir = tempfile.mkdtemp()
+        queue = deadlines._queue
+        deadlines._queue = deadlines.DeadlineQueue(db_file = os.path.join(tmpdir, 'deadlines.sqlite'))
+        try:
+            admitted = admission.admit_runs(runs = self.runs, task = 'foo', settings = make_settings(min_free_gb = 10 ** 12), get_output_dir = lambda run: tmpdir)
+            self.assertEqual(admitted, [])
+            self.assertTrue(all(run.deferred for run in self.runs))
+            self.assertEqual(sorted(deadlines._queue.pop_due(now = deadlines._queue.next_deadline())['foo']), sorted(run.id for run in self.runs))
+        finally:
+            deadlines._queue.close()
+            deadlines._queue = queue
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the benchmark module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import benchmark
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_results(self):
+        output = os.path.join(self.tmpdir, 'results', 'results.jsonl')
+        record = {'timestamp': '2018-01-01 00:00:00', 'version': 'abc123', 'label': None, 'runs': 10, 'threads': 1,
+        'phases': {'demux_validate': {'seconds': 0.5, 'calls': 100}}}
+        benchmark.save_results(output = output, record = record)
+        benchmark.save_results(output = output, record = record)
+        records = benchmark.load_results(output)
+        self.assertEqual(len(records), 2)
+        self.assertIn('demux_validate', benchmark.format_comparison(records))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the catalog module
+'''
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import catalog
+
+class TestRunCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.run_dir = os.path.join(self.tmpdir, '170809_NB501073_0019_AH5FFYBGX3')
+        os.makedirs(self.run_dir)
+        # make the run dir look old enough to be trusted
+        old_time = time.time() - 3600
+        os.utime(self.run_dir, (old_time, old_time))
+        self.catalog = catalog.RunCatalog(db_file = os.path.join(self.tmpdir, 'db', 'catalog.sqlite'))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup_unchanged_run(self):
+        '''
+        Facts saved for a run are returned while its signature does not change
+        '''
+        signature = catalog.get_signature([self.run_dir])
+        self.assertIsNone(self.catalog.lookup(id = 'foo', signature = signature))
+        self.catalog.update(id = 'foo', signature = signature, facts = {'seqtype': 'NGS580'})
+        self.assertEqual(self.catalog.lookup(id = 'foo', signature = catalog.get_signature([self.run_dir])), {'seqtype': 'NGS580'})
+
+    def test_lookup_changed_run(self):
+        '''
+        Adding a file to the run dir invalidates the saved facts
+        '''
+        signature = catalog.get_signature([self.run_dir])
+        self.catalog.update(id = 'foo', signature = signature, facts = {'seqtype': None})
+        open(os.path.join(self.run_dir, 'seqtype.txt'), 'w').close()
+        self.assertIsNone(self.catalog.lookup(id = 'foo', signature = catalog.get_signature([self.run_dir])))
+
+    def test_recent_signature_not_trusted(self):
+        '''
+        Directories modified within the last 'min_age' seconds are always checked again
+        '''
+        now = time.time()
+        os.utime(self.run_dir, (now, now))
+        signature = catalog.get_signature([self.run_dir])
+        self.catalog.update(id = 'foo', signature = signature, facts = {})
+        self.assertIsNone(self.catalog.lookup(id = 'foo', signature = signature))
+
+    def test_listing(self):
+        '''
+        Cached directory listings are returned until the directory changes
+        '''
+        self.catalog.update_listing(path = self.run_dir, items = {'a': 'b'})
+        self.assertEqual(self.catalog.get_listing(path = self.run_dir), {'a': 'b'})
+        os.makedirs(os.path.join(self.run_dir, 'Data'))
+        self.assertIsNone(self.catalog.get_listing(path = self.run_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the config module
+'''
+import unittest
+import config
+from config.schema import validate, ConfigError
+
+class TestConfig(unittest.TestCase):
+    def test_sections_loaded(self):
+        self.assertEqual(config.NextSeq, config.sections['NextSeq'])
+        self.assertIn('samples_pairs_sheet_pattern', config.NGS580_analysis)
+
+    def test_cache_matches_yaml(self):
+        '''
+        Configs loaded from the cache are the same as the ones parsed from the .yml files
+        '''
+        self.assertEqual(config.load_sections(), config.sections)
+
+    def test_missing_key(self):
+        values = dict(config.NGS580_analysis)
+        del values['samples_pairs_sheet_pattern']
+        with self.assertRaises(ConfigError) as context:
+            validate(name = 'NGS580_analysis', values = values, section_schema = config.schema['NGS580_analysis'])
+        self.assertIn('samples_pairs_sheet_pattern', str(context.exception))
+
+    def test_missing_nested_key(self):
+        values = dict(config.monitor)
+        values['daemon'] = {'poll_interval': 30}
+        with self.assertRaises(ConfigError) as context:
+            validate(name = 'monitor', values = values, section_schema = config.schema['monitor'])
+        self.assertIn('daemon', str(context.exception))
+
+    def test_wrong_type(self):
+        values = dict(config.NextSeq)
+        values['validation_threads'] = 'eight'
+        with self.assertRaises(ConfigError):
+            validate(name = 'NextSeq', values = values, section_schema = config.schema['NextSeq'])
+
+    def test_list_of_sections(self):
+        '''
+        Each of the sequencer locations is checked against the schema
+        '''
+        values = dict(config.NextSeq)
+        values['locations'] = config.NextSeq['locations'] + [{'name': 'archive', 'path': '/data/archive', 'options': {}}]
+        with self.assertRaises(ConfigError) as context:
+            validate(name = 'NextSeq', values = values, section_schema = config.schema['NextSeq'])
+        self.assertIn("locations[1]: missing required key 'layout'", str(context.exception))
+        values['locations'] = []
+        with self.assertRaises(ConfigError):
+            validate(name = 'NextSeq', values = values, section_schema = config.schema['NextSeq'])
+
+
+if __name__ == '__main__':
+    unittest.main()
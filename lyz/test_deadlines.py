@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the deadlines module
+'''
+import unittest
+import os
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import deadlines
+
+class FakeRun(object):
+    def __init__(self, id, RTAComplete_time, validations, window = 5400):
+        self.id = id
+        self.config = {'RTA_completion_window': window}
+        self.RTAComplete_time = RTAComplete_time
+        self.validations = validations
+        self.is_valid = all(validations.values())
+
+class TestDeadlines(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = deadlines.DeadlineQueue(db_file = os.path.join(self.tmpdir, 'db', 'deadlines.sqlite'))
+
+    def tearDown(self):
+        self.queue.close()
+        deadlines._queue = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_completion_time_passed(self):
+        '''
+        The whole time difference is compared to the window, including any days
+        '''
+        now = datetime(2017, 8, 10, 12, 0, 0)
+        self.assertFalse(deadlines.completion_time_passed(RTAComplete_time = now - timedelta(minutes = 80), window = 5400, now = now))
+        self.assertTrue(deadlines.completion_time_passed(RTAComplete_time = now - timedelta(minutes = 100), window = 5400, now = now))
+        self.assertTrue(deadlines.completion_time_passed(RTAComplete_time = now - timedelta(days = 1, minutes = 10), window = 5400, now = now))
+
+    def test_queue(self):
+        '''
+        Deadlines are returned earliest first, and removed once they have passed
+        '''
+        self.assertIsNone(self.queue.next_deadline())
+        self.queue.schedule(task = 'NGS580_demultiplexing', run_id = 'run1', due = 200)
+        self.queue.schedule(task = 'NGS580_analysis', run_id = 'run2', due = 100)
+        self.queue.schedule(task = 'NGS580_demultiplexing', run_id = 'run3', due = 150)
+        self.assertEqual(self.queue.next_deadline(), 100)
+        self.assertEqual(self.queue.pop_due(now = 160), {'NGS580_analysis': ['run2'], 'NGS580_demultiplexing': ['run3']})
+        self.assertEqual(self.queue.next_deadline(), 200)
+        self.assertEqual(self.queue.pop_due(now = 160), {})
+
+    def test_schedule_waiting_runs(self):
+        '''
+        Only runs that are waiting on the RTA completion window are scheduled, with the window from each run's config
+        '''
+        deadlines._queue = self.queue
+        RTAComplete_time = datetime.now() - timedelta(minutes = 30)
+        waiting_run = FakeRun(id = 'run1', RTAComplete_time = RTAComplete_time, validations = {'run_dir_validation': True, 'RTA_completion_time_validation': False})
+        broken_run = FakeRun(id = 'run2', RTAComplete_time = RTAComplete_time, validations = {'run_dir_validation': False})
+        slow_run = FakeRun(id = 'run3', RTAComplete_time = RTAComplete_time, validations = {'run_dir_validation': True, 'RTA_completion_time_validation': False}, window = 7200)
+        deadlines.schedule_waiting_runs(runs = [waiting_run, broken_run, slow_run], task = 'NGS580_demultiplexing')
+        expected = deadlines.get_ready_time(RTAComplete_time = RTAComplete_time, window = 5400)
+        self.assertAlmostEqual(self.queue.next_deadline(), expected, delta = 1)
+        self.assertAlmostEqual(expected - time.time(), 3600, delta = 5)
+        self.assertEqual(self.queue.pop_due(now = expected + 1), {'NGS580_demultiplexing': ['run1']})
+        self.assertAlmostEqual(self.queue.next_deadline() - expected, 1800, delta = 1)
+        self.assertEqual(self.queue.pop_due(now = expected + 1801), {'NGS580_demultiplexing': ['run3']})
+
+
+if __name__ == '__main__':
+    unittest.main()
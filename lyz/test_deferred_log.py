@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the deferred_log module
+'''
+import unittest
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from deferred_log import DeferredHandler, defer_handlers, open_handler, close_handler
+
+class TestDeferredHandler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.tmpdir, 'run.log')
+        self.logger = logging.getLogger('test_deferred_log.{0}'.format(id(self)))
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.main_records = []
+        self.main_handler = logging.Handler(level = logging.DEBUG)
+        self.main_handler.emit = self.main_records.append
+        self.logger.addHandler(self.main_handler)
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+        shutil.rmtree(self.tmpdir)
+
+    def make_filehandler(self):
+        handler = logging.FileHandler(self.logfile)
+        handler.setLevel(logging.INFO)
+        return(handler)
+
+    def test_records_held_until_opened(self):
+        '''
+        No log file is created and no records are written until the handler is opened
+        '''
+        handler = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        self.logger.debug('debug message')
+        self.logger.info('info message')
+        self.assertFalse(os.path.exists(self.logfile))
+        self.assertEqual(self.main_records, [])
+
+        open_handler(logger = self.logger, handler = handler)
+        self.logger.info('after open')
+        self.assertEqual([r.getMessage() for r in self.main_records], ['debug message', 'info message', 'after open'])
+        with open(self.logfile) as f:
+            lines = f.read().splitlines()
+        # the file handler is INFO level
+        self.assertEqual(lines, ['info message', 'after open'])
+        self.assertNotIn(handler, self.logger.handlers)
+
+    def test_discard(self):
+        '''
+        Discarded records are dropped, or only sent to the handlers passed
+        '''
+        handler = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        self.logger.info('first')
+        handler.discard()
+        self.logger.info('second')
+        handler.discard(handlers = handler.handlers)
+        self.assertEqual([r.getMessage() for r in self.main_records], ['second'])
+        self.assertFalse(os.path.exists(self.logfile))
+
+    def test_defer_again(self):
+        '''
+        A DeferredHandler left on the logger by an earlier object for the same run is replaced, not wrapped
+        '''
+        first = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        self.logger.info('first')
+        # the module handlers are added to the logger again for each new object
+        self.logger.addHandler(self.main_handler)
+        second = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        self.assertEqual(self.logger.handlers, [second])
+        self.assertEqual(second.handlers, [self.main_handler])
+        self.assertEqual(first.records, [])
+        self.logger.info('second')
+        open_handler(logger = self.logger, handler = second)
+        self.assertEqual([r.getMessage() for r in self.main_records], ['second'])
+
+    def test_close_handler(self):
+        '''
+        The log file handler is removed and closed once it is no longer needed; the other handlers stay
+        '''
+        handler = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        open_handler(logger = self.logger, handler = handler)
+        file_handler = handler.factory_handler
+        self.assertIn(file_handler, self.logger.handlers)
+        close_handler(logger = self.logger, handler = handler)
+        self.assertEqual(self.logger.handlers, [self.main_handler])
+        self.assertIsNone(file_handler.stream)
+        # the next object for the run only wraps the module handlers
+        second = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        self.assertEqual(second.handlers, [self.main_handler])
+
+    def test_export_records(self):
+        '''
+        Records exported from one handler, e.g. in a worker process, are held by another handler as if they had been logged there
+        '''
+        worker = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        self.logger.debug('run %s found', 'run1')
+        try:
+            raise ValueError('bad value')
+        except ValueError:
+            self.logger.exception('validation failed')
+        exported = pickle.loads(pickle.dumps(worker.export_records()))
+        worker.discard()
+
+        handler = defer_handlers(logger = self.logger, handler_factory = self.make_filehandler)
+        handler.import_records(exported)
+        self.assertEqual([(r.levelno, r.getMessage()) for r in handler.records], [(logging.DEBUG, 'run run1 found'), (logging.ERROR, 'validation failed')])
+        open_handler(logger = self.logger, handler = handler)
+        with open(self.logfile) as f:
+            text = f.read()
+        self.assertIn('validation failed', text)
+        self.assertIn('ValueError: bad value', text)
+        self.assertNotIn('run run1 found', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
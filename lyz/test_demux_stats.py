@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the demux_stats module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import demux_stats
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+unaligned_dir = os.path.join(scriptdir, 'fixtures', 'NextSeq_runs', '170809_NB501073_0019_AH5FFYBGX3', 'Data', 'Intensities', 'BaseCalls', 'Unaligned')
+expected_samples = {'SC-SERACARE': 4010000, 'NC-HAPMAP': 3610000, 'Sample1': 4410000}
+
+class TestDemuxStats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_stats_json(self):
+        stats = demux_stats.parse_stats_json(os.path.join(unaligned_dir, 'Stats', 'Stats.json'))
+        self.assertEqual(stats['samples'], expected_samples)
+        self.assertEqual(stats['undetermined_reads'], 201000)
+        self.assertEqual(stats['total_reads'], 12231000)
+        self.assertAlmostEqual(stats['undetermined_fraction'], 201000.0 / 12231000)
+
+    def test_stats_html(self):
+        '''
+        The HTML report gives the same counts as Stats.json; the tables after the lane barcode table are not used
+        '''
+        stats = demux_stats.parse_stats_html(os.path.join(unaligned_dir, 'Demultiplex_Stats.htm'))
+        self.assertEqual(stats['samples'], expected_samples)
+        self.assertEqual(stats['undetermined_reads'], 201000)
+
+    def test_html_fallback(self):
+        '''
+        The HTML report is used when there is no Stats.json; a run with neither has no stats
+        '''
+        shutil.copy(os.path.join(unaligned_dir, 'Demultiplex_Stats.htm'), self.tmpdir)
+        stats = demux_stats.get_demux_stats(unaligned_dir = self.tmpdir)
+        self.assertEqual(stats['source'], os.path.join(self.tmpdir, 'Demultiplex_Stats.htm'))
+        self.assertEqual(stats['total_reads'], 12231000)
+        self.assertIsNone(demux_stats.get_demux_stats(unaligned_dir = os.path.join(self.tmpdir, 'foo')))
+
+    def test_empty_html(self):
+        html_file = os.path.join(self.tmpdir, 'Demultiplex_Stats.htm')
+        open(html_file, 'w').close()
+        self.assertIsNone(demux_stats.get_demux_stats(unaligned_dir = self.tmpdir, html_file = html_file))
+
+    def test_thresholds(self):
+        stats = demux_stats.get_demux_stats(unaligned_dir = unaligned_dir)
+        self.assertEqual(demux_stats.check_thresholds(stats = stats, min_sample_reads = 100000, max_undetermined_fraction = 0.5), [])
+        problems = demux_stats.check_thresholds(stats = stats, min_sample_reads = 4000000, max_undetermined_fraction = 0.01)
+        self.assertEqual(len(problems), 2)
+        self.assertIn('NC-HAPMAP', problems[0])
+        self.assertIn('undetermined', problems[1])
+
+    def test_describe(self):
+        stats = demux_stats.get_demux_stats(unaligned_dir = unaligned_dir)
+        description = demux_stats.describe(stats)
+        self.assertIn('SC-SERACARE: 4,010,000 reads', description)
+        self.assertIn('Undetermined fraction: 1.6%', description)
+
+
+if __name__ == '__main__':
+    unittest.main()
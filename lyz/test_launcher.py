@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the launcher module
+'''
+import unittest
+import time
+import logging
+import launcher
+
+class TestRunCommand(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test_launcher')
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.records = []
+        handler = logging.Handler()
+        handler.emit = self.records.append
+        self.logger.handlers = [handler]
+
+    def test_success(self):
+        '''
+        Output of the command is logged line by line and returned in the result
+        '''
+        result = launcher.run_command(command = 'echo foo; echo bar >&2', logger = self.logger)
+        self.assertTrue(result.succeeded)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.output, 'foo\nbar\n')
+        self.assertFalse(result.truncated)
+        messages = [record.getMessage() for record in self.records]
+        self.assertIn('foo', messages)
+        self.assertIn('bar', messages)
+
+    def test_failure(self):
+        result = launcher.run_command(command = 'echo broken; exit 3', logger = self.logger)
+        self.assertFalse(result.succeeded)
+        self.assertEqual(result.returncode, 3)
+        self.assertFalse(result.timed_out)
+
+    def test_timeout(self):
+        '''
+        Commands that run too long are killed, including the processes they started
+        '''
+        start_time = time.time()
+        result = launcher.run_command(command = 'echo started; sleep 30 | cat', logger = self.logger, timeout = 0.5)
+        self.assertTrue(result.timed_out)
+        self.assertFalse(result.succeeded)
+        self.assertEqual(result.output, 'started\n')
+        self.assertLess(time.time() - start_time, 10)
+
+    def test_truncated_output(self):
+        '''
+        Only the end of long output is kept
+        '''
+        result = launcher.run_command(command = 'for i in 1 2 3 4 5; do echo line$i; done', logger = self.logger, max_output = 12)
+        self.assertTrue(result.truncated)
+        self.assertEqual(result.output, 'line4\nline5\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the lease module
+'''
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import lease
+
+class TestLease(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.lease_file = os.path.join(self.tmpdir, 'monitor.lease')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_acquire_release(self):
+        '''
+        Only one owner holds the lease at a time; it can be acquired again once it is released
+        '''
+        first = lease.Lease(path = self.lease_file, owner = 'first')
+        second = lease.Lease(path = self.lease_file, owner = 'second')
+        self.assertTrue(first.acquire())
+        self.assertTrue(first.held)
+        self.assertFalse(second.acquire())
+        self.assertFalse(second.held)
+        self.assertEqual(second.get_holder()['owner'], 'first')
+        first.release()
+        self.assertFalse(os.path.exists(self.lease_file))
+        self.assertTrue(second.acquire())
+        second.release()
+        # no temporary files are left behind
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_stale_takeover(self):
+        '''
+        A lease that has not been renewed within its ttl is taken over
+        '''
+        now = time.time()
+        first = lease.Lease(path = self.lease_file, ttl = 300, owner = 'first')
+        second = lease.Lease(path = self.lease_file, ttl = 300, owner = 'second')
+        self.assertTrue(first.acquire(now = now))
+        self.assertFalse(second.acquire(now = now + 299))
+        self.assertTrue(second.acquire(now = now + 301))
+        self.assertEqual(second.get_holder()['owner'], 'second')
+        # the first owner finds out on its next heartbeat, and does not remove the new lease
+        self.assertFalse(first.renew(now = now + 302))
+        self.assertTrue(first.lost.is_set())
+        self.assertFalse(first.held)
+        first.release()
+        self.assertEqual(second.get_holder()['owner'], 'second')
+        self.assertEqual(os.listdir(self.tmpdir), ['monitor.lease'])
+
+    def test_renew(self):
+        '''
+        Renewing the lease keeps it from going stale
+        '''
+        now = time.time()
+        first = lease.Lease(path = self.lease_file, ttl = 300, owner = 'first')
+        second = lease.Lease(path = self.lease_file, ttl = 300, owner = 'second')
+        self.assertTrue(first.acquire(now = now))
+        self.assertTrue(first.renew(now = now + 200))
+        self.assertEqual(first.get_holder()['renewed'], now + 200)
+        self.assertFalse(second.acquire(now = now + 400))
+        self.assertTrue(first.held)
+
+    def test_heartbeat(self):
+        first = lease.Lease(path = self.lease_file, heartbeat_interval = 0.01, owner = 'first')
+        self.assertTrue(first.acquire(now = 0))
+        first.start_heartbeat()
+        time.sleep(0.2)
+        renewed = first.get_holder()['renewed']
+        first.release()
+        self.assertGreater(renewed, 0)
+        self.assertFalse(os.path.exists(self.lease_file))
+
+
+class TestClaims(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_claim_run(self):
+        '''
+        A run can only be claimed once for each task
+        '''
+        self.assertIsNone(lease.get_claim(run_dir = self.tmpdir, task = 'NGS580_demultiplexing'))
+        self.assertTrue(lease.claim_run(run_dir = self.tmpdir, task = 'NGS580_demultiplexing', owner = 'first'))
+        self.assertFalse(lease.claim_run(run_dir = self.tmpdir, task = 'NGS580_demultiplexing', owner = 'second'))
+        self.assertTrue(lease.claim_run(run_dir = self.tmpdir, task = 'NGS580_analysis', owner = 'second'))
+        claim = lease.get_claim(run_dir = self.tmpdir, task = 'NGS580_demultiplexing')
+        self.assertEqual(claim['owner'], 'first')
+        self.assertEqual(claim['task'], 'NGS580_demultiplexing')
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['.NGS580_analysis.claim', '.NGS580_demultiplexing.claim'])
+        self.assertTrue(lease.release_claim(run_dir = self.tmpdir, task = 'NGS580_demultiplexing'))
+        self.assertFalse(lease.release_claim(run_dir = self.tmpdir, task = 'NGS580_demultiplexing'))
+        self.assertTrue(lease.claim_run(run_dir = self.tmpdir, task = 'NGS580_demultiplexing', owner = 'second'))
+
+
+if __name__ == '__main__':
+    unittest.main()
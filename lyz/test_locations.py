@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the locations module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import locations
+
+class TestLocations(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.flat_dir = os.path.join(self.tmpdir, 'quicksilver')
+        self.instrument_dir = os.path.join(self.tmpdir, 'nextseq')
+        for path in [
+        os.path.join(self.flat_dir, '170809_NB501073_0019_AH5FFYBGX3'),
+        os.path.join(self.flat_dir, '170810_NB501074_0020_AHCLLMBGX2'),
+        os.path.join(self.flat_dir, 'to_be_demultiplexed'),
+        os.path.join(self.instrument_dir, 'NB501073', '170811_NB501073_0021_AHHK37BGX3'),
+        os.path.join(self.instrument_dir, 'NB501075', '170812_NB501075_0001_AH5FFYBGX4')
+        ]:
+            os.makedirs(path)
+        open(os.path.join(self.flat_dir, 'README.txt'), 'w').close()
+        self.flat = locations.Location(name = 'quicksilver', path = self.flat_dir, layout = 'flat', options = {'RTA_completion_window': 7200})
+        self.by_instrument = locations.Location(name = 'nextseq', path = self.instrument_dir, layout = 'by_instrument')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_instrument(self):
+        self.assertEqual(locations.get_instrument('170809_NB501073_0019_AH5FFYBGX3'), 'NB501073')
+        self.assertEqual(locations.get_instrument('170809_NB501073_0019_AH5FFYBGX3_broke1'), 'NB501073')
+        self.assertIsNone(locations.get_instrument('to_be_demultiplexed'))
+
+    def test_list_runs(self):
+        self.assertEqual(list(self.flat.list_runs().items()), [
+        ('170809_NB501073_0019_AH5FFYBGX3', self.flat_dir),
+        ('170810_NB501074_0020_AHCLLMBGX2', self.flat_dir),
+        ('to_be_demultiplexed', self.flat_dir)
+        ])
+        self.assertEqual(list(self.by_instrument.list_runs().items()), [
+        ('170811_NB501073_0021_AHHK37BGX3', os.path.join(self.instrument_dir, 'NB501073')),
+        ('170812_NB501075_0001_AH5FFYBGX4', os.path.join(self.instrument_dir, 'NB501075'))
+        ])
+        self.assertEqual(len(locations.Location(name = 'missing', path = os.path.join(self.tmpdir, 'foo')).list_runs()), 0)
+
+    def test_unknown_layout(self):
+        with self.assertRaises(ValueError):
+            locations.Location(name = 'foo', path = self.tmpdir, layout = 'by_date')
+
+    def test_run_config(self):
+        '''
+        The location's options and the directory that holds the run replace the module configs
+        '''
+        configs = {'sequencer_dir': '/ifs/data/molecpathlab/quicksilver', 'RTA_completion_window': 5400, 'seqtype': 'NGS580'}
+        run_config = self.flat.get_run_config(config = configs, run_id = '170809_NB501073_0019_AH5FFYBGX3')
+        self.assertEqual(run_config['sequencer_dir'], self.flat_dir)
+        self.assertEqual(run_config['RTA_completion_window'], 7200)
+        self.assertEqual(run_config['location'], 'quicksilver')
+        run_config = self.by_instrument.get_run_config(config = configs, run_id = '170811_NB501073_0021_AHHK37BGX3')
+        self.assertEqual(run_config['sequencer_dir'], os.path.join(self.instrument_dir, 'NB501073'))
+        self.assertEqual(run_config['RTA_completion_window'], 5400)
+        self.assertEqual(configs['sequencer_dir'], '/ifs/data/molecpathlab/quicksilver')
+
+    def test_find_run_location(self):
+        sequencer_locations = [self.flat, self.by_instrument]
+        self.assertIs(locations.find_run_location(locations = sequencer_locations, run_id = '170811_NB501073_0021_AHHK37BGX3'), self.by_instrument)
+        self.assertIs(locations.find_run_location(locations = sequencer_locations, run_id = '170809_NB501073_0019_AH5FFYBGX3'), self.flat)
+        # runs that are not in any location yet belong to the first one
+        self.assertIs(locations.find_run_location(locations = sequencer_locations, run_id = '170901_NB501073_0030_AHHHHHBGX3'), self.flat)
+
+    def test_make_shards(self):
+        '''
+        Runs are split by location and instrument, largest shard first
+        '''
+        items = [(location, run_id) for location in [self.flat, self.by_instrument] for run_id in location.list_runs()]
+        items.append((self.flat, '170901_NB501074_0031_AHHHHHBGX3', '170901_NB501074_0031_AHHHHHBGX3'))
+        shards = locations.make_shards(items)
+        self.assertEqual([(location.name, instrument, run_ids) for location, instrument, run_ids in shards], [
+        ('quicksilver', 'NB501074', ['170810_NB501074_0020_AHCLLMBGX2', '170901_NB501074_0031_AHHHHHBGX3']),
+        ('quicksilver', 'NB501073', ['170809_NB501073_0019_AH5FFYBGX3']),
+        ('quicksilver', None, ['to_be_demultiplexed']),
+        ('nextseq', 'NB501073', ['170811_NB501073_0021_AHHK37BGX3']),
+        ('nextseq', 'NB501075', ['170812_NB501075_0001_AH5FFYBGX4'])
+        ])
+
+    def test_watch(self):
+        self.assertEqual(self.flat.get_watch(), (self.flat_dir, 1))
+        self.assertEqual(self.by_instrument.get_watch(), (self.instrument_dir, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the log_retention module
+'''
+import unittest
+import os
+import time
+import shutil
+import tarfile
+import tempfile
+import datetime
+import log_retention
+
+class TestLogArchiver(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logdir = os.path.join(self.tmpdir, 'logs')
+        os.makedirs(self.logdir)
+        self.now = time.time()
+        self.archiver = log_retention.LogArchiver(logdir = self.logdir, index_file = os.path.join(self.tmpdir, 'db', 'log_archive.sqlite'), archive_after_days = 7, delete_after_days = 30, max_archive_mb = 1)
+
+    def tearDown(self):
+        self.archiver.close()
+        shutil.rmtree(self.tmpdir)
+
+    def make_item(self, name, days_old, is_dir = False):
+        '''
+        Make a log file, or a cycle log directory with a log file in it, last modified 'days_old' days ago
+        '''
+        path = os.path.join(self.logdir, name)
+        mtime = self.now - days_old * 86400
+        log_file = path
+        if is_dir:
+            os.makedirs(path)
+            log_file = os.path.join(path, 'monitor.py.{0}.log'.format(name))
+        with open(log_file, 'w') as f:
+            f.write('log message\n')
+        os.utime(log_file, (mtime, mtime))
+        os.utime(path, (mtime, mtime))
+        return(path)
+
+    def test_archive_old_items(self):
+        '''
+        Old items are moved to one archive per day and indexed by run; new items are kept
+        '''
+        cycle_dir = self.make_item('2017-08-01-12-00-00', days_old = 10, is_dir = True)
+        run_log = self.make_item('170809_NB501073_0019_AH5FFYBGX3.2017-08-01-12-00-00.log', days_old = 10)
+        new_log = self.make_item('NGS580_demultiplexing.py.2017-08-10-12-00-00.log', days_old = 1)
+
+        archive_files = self.archiver.archive_old_items(now = self.now)
+        self.assertEqual(len(archive_files), 1)
+        self.assertFalse(os.path.exists(cycle_dir))
+        self.assertFalse(os.path.exists(run_log))
+        self.assertTrue(os.path.exists(new_log))
+        with tarfile.open(archive_files[0], 'r:gz') as tar:
+            names = sorted(tar.getnames())
+        self.assertIn('170809_NB501073_0019_AH5FFYBGX3.2017-08-01-12-00-00.log', names)
+        self.assertIn('2017-08-01-12-00-00/monitor.py.2017-08-01-12-00-00.log', names)
+        self.assertEqual(self.archiver.find_run_logs(run_id = '170809_NB501073_0019_AH5FFYBGX3'), [(archive_files[0], '170809_NB501073_0019_AH5FFYBGX3.2017-08-01-12-00-00.log')])
+
+    def test_archive_same_day_again(self):
+        '''
+        Items from a day that already has an archive are added to that archive, replacing any item with the same name
+        '''
+        self.make_item('foo.log', days_old = 10)
+        archive_file = self.archiver.archive_old_items(now = self.now)[0]
+        self.make_item('bar.log', days_old = 10)
+        self.make_item('foo.log', days_old = 10)
+        self.assertEqual(self.archiver.archive_old_items(now = self.now), [archive_file])
+        with tarfile.open(archive_file, 'r:gz') as tar:
+            self.assertEqual(sorted(tar.getnames()), ['bar.log', 'foo.log'])
+
+    def test_whole_day(self):
+        '''
+        A day is only archived once all of it is older than 'archive_after_days'
+        '''
+        cutoff = datetime.datetime.fromtimestamp(self.now - 7 * 86400)
+        day_start = time.mktime(cutoff.replace(hour = 0, minute = 0, second = 0, microsecond = 0).timetuple())
+        self.make_item('cutoff_day.log', days_old = (self.now - day_start - 1) / 86400.0)
+        self.make_item('day_before.log', days_old = (self.now - day_start + 1) / 86400.0)
+        self.assertEqual([[os.path.basename(path) for path in paths] for paths in self.archiver.find_old_items(now = self.now).values()], [['day_before.log']])
+
+    def test_exclude(self):
+        '''
+        Excluded items, like the current cycle's log directory, are not archived
+        '''
+        cycle_dir = self.make_item('2017-08-01-12-00-00', days_old = 10, is_dir = True)
+        self.assertEqual(self.archiver.find_old_items(now = self.now, exclude = [cycle_dir]), {})
+
+    def test_prune_archives(self):
+        '''
+        Archives older than 'delete_after_days' are deleted, and removed from the index
+        '''
+        self.make_item('170809_NB501073_0019_AH5FFYBGX3.2017-08-01-12-00-00.log', days_old = 40)
+        self.make_item('foo.log', days_old = 10)
+        old_archive, new_archive = self.archiver.archive_old_items(now = self.now)
+        self.assertEqual(self.archiver.prune_archives(now = self.now), [old_archive])
+        self.assertTrue(os.path.exists(new_archive))
+        self.assertEqual(self.archiver.find_run_logs(run_id = '170809_NB501073_0019_AH5FFYBGX3'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
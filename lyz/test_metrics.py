@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the metrics module
+'''
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import metrics
+import snapshot
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_spans_and_counters(self):
+        '''
+        Time spent in the same span is added up, and counters with different labels are kept apart
+        '''
+        cycle_metrics = metrics.Metrics()
+        with cycle_metrics.span('validation', task = 'foo'):
+            pass
+        cycle_metrics.add_time('validation', 2.0, task = 'foo')
+        cycle_metrics.increment('runs_skipped', value = 3, task = 'foo')
+        cycle_metrics.increment('runs_skipped', task = 'foo')
+        cycle_metrics.increment('runs_skipped', task = 'bar')
+        record = cycle_metrics.to_dict()
+        self.assertEqual(len(record['spans']), 1)
+        self.assertEqual(record['spans'][0]['calls'], 2)
+        self.assertTrue(record['spans'][0]['seconds'] >= 2.0)
+        self.assertEqual([(counter['labels'], counter['value']) for counter in record['counters']], [({'task': 'foo'}, 4), ({'task': 'bar'}, 1)])
+
+    def test_prometheus(self):
+        cycle_metrics = metrics.Metrics()
+        cycle_metrics.add_time('submission', 1.5, task = 'NGS580_analysis')
+        cycle_metrics.increment('runs-started', value = 2, task = 'NGS580_analysis')
+        text = cycle_metrics.to_prometheus()
+        self.assertIn('lyz_span_seconds{span="submission",task="NGS580_analysis"} 1.5\n', text)
+        self.assertIn('lyz_span_calls{span="submission",task="NGS580_analysis"} 1\n', text)
+        self.assertIn('# TYPE lyz_runs_started gauge\n', text)
+        self.assertIn('lyz_runs_started{task="NGS580_analysis"} 2\n', text)
+
+    def test_write(self):
+        '''
+        Each cycle adds a line to the JSON file, and replaces the Prometheus file
+        '''
+        json_file = os.path.join(self.tmpdir, 'db', 'metrics.jsonl')
+        prometheus_file = os.path.join(self.tmpdir, 'textfile', 'lyz.prom')
+        for i in range(2):
+            cycle_metrics = metrics.Metrics()
+            cycle_metrics.increment('runs_scanned', value = i)
+            cycle_metrics.write(json_file = json_file, prometheus_file = prometheus_file)
+        with open(json_file) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record['counters'][0]['value'] for record in records], [0, 1])
+        with open(prometheus_file) as f:
+            self.assertIn('lyz_runs_scanned 1\n', f.read())
+        self.assertEqual(os.listdir(os.path.dirname(prometheus_file)), ['lyz.prom'])
+
+    def test_start_cycle(self):
+        metrics.start_cycle()
+        metrics.increment('foo')
+        finished = metrics.start_cycle()
+        self.assertEqual(finished.to_dict()['counters'][0]['value'], 1)
+        self.assertEqual(metrics.get_metrics().to_dict()['counters'], [])
+
+    def test_merge(self):
+        '''
+        Spans and counters from another cycle, e.g. a worker process, are added to the ones already recorded
+        '''
+        cycle_metrics = metrics.Metrics()
+        cycle_metrics.add_time('validation', 1.0, task = 'foo')
+        cycle_metrics.increment('runs_valid', value = 2, task = 'foo')
+        worker_metrics = metrics.Metrics()
+        worker_metrics.add_time('validation', 2.0, task = 'foo')
+        worker_metrics.increment('runs_valid', value = 3, task = 'foo')
+        worker_metrics.increment('runs_skipped', task = 'foo')
+        cycle_metrics.merge(json.loads(json.dumps(worker_metrics.to_dict())))
+        record = cycle_metrics.to_dict()
+        self.assertEqual([(span['calls'], span['seconds']) for span in record['spans']], [(2, 3.0)])
+        self.assertEqual([(counter['name'], counter['value']) for counter in record['counters']], [('runs_valid', 5), ('runs_skipped', 1)])
+
+    def test_call_counter(self):
+        '''
+        Calls made through modules that imported the functions by name are counted, and the functions are restored afterwards
+        '''
+        path = os.path.join(self.tmpdir, 'foo.txt')
+        open(path, 'w').close()
+        stat = os.stat
+        with metrics.CallCounter() as counter:
+            os.stat(path)
+            os.path.isfile(path)
+            snapshot.read_first_line(path)
+        self.assertEqual(counter.counts['stat'], 2)
+        self.assertEqual(counter.counts['open'], 1)
+        self.assertTrue(os.stat is stat)
+        with metrics.CallCounter() as counter:
+            snapshot.scan_dir(self.tmpdir)
+        self.assertEqual(counter.counts['scandir'] + counter.counts['listdir'], 1)
+        with metrics.CallCounter(enabled = False) as counter:
+            os.stat(path)
+        self.assertEqual(counter.total, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the outbox module
+'''
+import unittest
+import os
+import stat
+import json
+import shutil
+import time
+import tempfile
+from outbox import Outbox
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outbox_dir = os.path.join(self.tmpdir, 'outbox')
+        self.sent_file = os.path.join(self.tmpdir, 'sent.txt')
+        # fake mutt program that saves its arguments and message instead of sending an email
+        self.mutt = self.make_script('mutt', 'echo "$@" >> "{0}"\ncat >> "{0}"\n'.format(self.sent_file))
+        self.broken_mutt = self.make_script('broken_mutt', 'echo "relay not available"\nexit 1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_script(self, name, contents):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\n' + contents)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return(path)
+
+    def read_sent(self):
+        with open(self.sent_file) as f:
+            return(f.read())
+
+    def test_put_and_drain(self):
+        '''
+        Queued notifications are sent with mutt and removed from the outbox
+        '''
+        outbox = Outbox(outbox_dir = self.outbox_dir, mutt = self.mutt)
+        message_file = os.path.join(self.tmpdir, 'run.log')
+        with open(message_file, 'w') as f:
+            f.write('Run started\n')
+        outbox.put(recipients = 'foo@bar.edu, baz@bar.edu', reply_to = 'me@bar.edu', subject = '[NGS580] Run started', message_file = message_file)
+        self.assertEqual(len(outbox.get_pending()), 1)
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(outbox.get_pending(), [])
+        self.assertEqual(self.read_sent(), '-s [NGS580] Run started -e my_hdr Reply-To:me@bar.edu -- foo@bar.edu baz@bar.edu\nRun started\n')
+
+    def test_retry(self):
+        '''
+        Notifications that fail are retried after a delay, then moved to 'failed'
+        '''
+        outbox = Outbox(outbox_dir = self.outbox_dir, mutt = self.broken_mutt, max_attempts = 2, retry_interval = 10)
+        path = outbox.put(recipients = 'foo@bar.edu', subject = 'foo', body = 'bar')
+        self.assertEqual(outbox.drain(now = 100), 0)
+        with open(path) as f:
+            notification = json.load(f)
+        self.assertEqual(notification['attempts'], 1)
+        self.assertEqual(notification['next_attempt'], 110)
+        # not due yet
+        outbox.mutt = self.mutt
+        self.assertEqual(outbox.drain(now = 105), 0)
+        outbox.mutt = self.broken_mutt
+        outbox.drain(now = 110)
+        self.assertEqual(outbox.get_pending(), [])
+        self.assertEqual(os.listdir(outbox.failed_dir), [os.path.basename(path)])
+
+    def test_send_timeout(self):
+        '''
+        A mail command that hangs is stopped, and counts as a failed attempt
+        '''
+        hung_mutt = self.make_script('hung_mutt', 'cat > /dev/null\nsleep 30\n')
+        outbox = Outbox(outbox_dir = self.outbox_dir, mutt = hung_mutt, retry_interval = 10, send_timeout = 0.5)
+        path = outbox.put(recipients = 'foo@bar.edu', subject = 'foo', body = 'bar')
+        start_time = time.time()
+        self.assertEqual(outbox.drain(now = 100), 0)
+        self.assertTrue(time.time() - start_time < 10)
+        with open(path) as f:
+            notification = json.load(f)
+        self.assertEqual(notification['attempts'], 1)
+        self.assertEqual(notification['next_attempt'], 110)
+
+    def test_digest(self):
+        '''
+        Held notifications are merged into one email at the end of the cycle
+        '''
+        outbox = Outbox(outbox_dir = self.outbox_dir, mutt = self.mutt, digest = True)
+        outbox.put(recipients = 'foo@bar.edu', subject = 'Run 1 started', body = 'run 1')
+        outbox.put(recipients = 'foo@bar.edu', subject = 'Run 2 started', body = 'run 2')
+        # held until the digest is made
+        self.assertEqual(outbox.drain(), 0)
+        outbox.flush_digest()
+        self.assertEqual(outbox.drain(), 1)
+        sent = self.read_sent()
+        self.assertTrue(sent.startswith('-s Run monitor digest: 2 notifications -- foo@bar.edu\n'))
+        self.assertIn('run 1', sent)
+        self.assertIn('run 2', sent)
+
+
+if __name__ == '__main__':
+    unittest.main()
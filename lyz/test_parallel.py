@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the parallel module
+'''
+import unittest
+import time
+import os
+import logging
+import metrics
+import parallel
+
+class DemoRun(object):
+    '''
+    Minimal stand-in for a NextSeqRun with its own logger
+    '''
+    def __init__(self, id, delay, is_valid, records):
+        self.id = id
+        self.delay = delay
+        self.expected = is_valid
+        self.is_valid = False
+        self.logger = logging.getLogger('test_parallel.{0}'.format(id))
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.logger.handlers = [RecordList(records)]
+
+    def validate(self):
+        self.logger.info('{0} start'.format(self.id))
+        time.sleep(self.delay)
+        self.logger.info('{0} end'.format(self.id))
+        return(self.expected)
+
+def count_in_worker(item):
+    '''
+    Function for the worker processes; returns the worker's process ID
+    '''
+    metrics.increment('items', value = item)
+    return(item * 2, os.getpid())
+
+class RecordList(logging.Handler):
+    def __init__(self, records):
+        logging.Handler.__init__(self)
+        self.records = records
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+class TestParallel(unittest.TestCase):
+    def make_runs(self, records):
+        # the first runs take the longest, so they would finish last without buffering
+        return([DemoRun(id = i, delay = 0.05 * (4 - i), is_valid = i % 2 == 0, records = records) for i in range(4)])
+
+    def test_map_threads_order(self):
+        self.assertEqual(parallel.map_threads(func = lambda x: x * 2, items = range(10), threads = 4), [x * 2 for x in range(10)])
+
+    def test_validate_runs_same_as_serial(self):
+        '''
+        Results and log messages from the thread pool match the serial validation
+        '''
+        serial_records = []
+        serial_runs = self.make_runs(serial_records)
+        serial_results = parallel.validate_runs(runs = serial_runs, threads = 1)
+
+        threaded_records = []
+        threaded_runs = self.make_runs(threaded_records)
+        threaded_results = parallel.validate_runs(runs = threaded_runs, threads = 4)
+
+        self.assertEqual(serial_results, threaded_results)
+        self.assertEqual([run.is_valid for run in threaded_runs], [True, False, True, False])
+        self.assertEqual(serial_records, threaded_records)
+
+    def test_map_processes(self):
+        '''
+        Results come back in the same order as the items, and the workers' counts are added to the current cycle
+        '''
+        metrics.start_cycle()
+        results = parallel.map_processes(func = count_in_worker, items = range(6), processes = 3)
+        self.assertEqual([result for result, pid in results], [0, 2, 4, 6, 8, 10])
+        self.assertNotIn(os.getpid(), [pid for result, pid in results])
+        self.assertEqual(metrics.get_metrics().to_dict()['counters'][0]['value'], 15)
+        # a single process runs the items in this process
+        metrics.start_cycle()
+        results = parallel.map_processes(func = count_in_worker, items = range(6), processes = 1)
+        self.assertEqual([pid for result, pid in results], [os.getpid()] * 6)
+        self.assertEqual(metrics.get_metrics().to_dict()['counters'][0]['value'], 15)
+
+    def test_handlers_restored(self):
+        records = []
+        runs = self.make_runs(records)
+        handlers = [run.logger.handlers for run in runs]
+        parallel.validate_runs(runs = runs, threads = 4)
+        self.assertEqual([run.logger.handlers for run in runs], handlers)
+
+
+if __name__ == '__main__':
+    unittest.main()
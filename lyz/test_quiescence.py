@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the quiescence module
+'''
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import quiescence
+
+class TestManifestStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.basecalls_dir = os.path.join(self.tmpdir, 'BaseCalls')
+        os.makedirs(os.path.join(self.basecalls_dir, 'L001'))
+        self.write_file(os.path.join('L001', 's_1.bci'), 'foo')
+        self.store = quiescence.ManifestStore(db_file = os.path.join(self.tmpdir, 'db', 'manifests.sqlite'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write_file(self, name, contents, mode = 'w'):
+        with open(os.path.join(self.basecalls_dir, name), mode) as f:
+            f.write(contents)
+
+    def test_quiet_period(self):
+        '''
+        The time since the last change grows while the files stay the same, and resets when a file changes
+        '''
+        now = time.time()
+        self.assertEqual(self.store.update(id = 'run1', path = self.basecalls_dir, now = now), 0)
+        self.assertEqual(self.store.update(id = 'run1', path = self.basecalls_dir, now = now + 300), 300)
+        # a file that is still being written grows without changing its directory
+        self.write_file(os.path.join('L001', 's_1.bci'), 'bar', mode = 'a')
+        self.assertEqual(self.store.update(id = 'run1', path = self.basecalls_dir, now = now + 400), 0)
+        self.assertEqual(self.store.update(id = 'run1', path = self.basecalls_dir, now = now + 1000), 600)
+        summary, dirs, changed = self.store.get('run1')
+        self.assertEqual(summary[:2], [1, 6])
+
+    def test_incremental(self):
+        '''
+        Directories that have not changed are not listed again
+        '''
+        scanned = []
+        scan_dir = quiescence.scan_dir
+        def counting_scan_dir(path):
+            scanned.append(path)
+            return(scan_dir(path))
+        quiescence.scan_dir = counting_scan_dir
+        try:
+            self.store.update(id = 'run1', path = self.basecalls_dir)
+            self.assertEqual(len(scanned), 2)
+            self.store.update(id = 'run1', path = self.basecalls_dir)
+            self.assertEqual(len(scanned), 2)
+            # a new file changes the directory's mtime
+            self.write_file('s_2.bci', 'foo')
+            new_time = time.time() + 10
+            os.utime(self.basecalls_dir, (new_time, new_time))
+            self.assertEqual(self.store.update(id = 'run1', path = self.basecalls_dir, now = new_time), 0)
+            self.assertEqual(scanned[2:], [self.basecalls_dir])
+            self.assertEqual(self.store.get('run1')[0][:2], [2, 6])
+        finally:
+            quiescence.scan_dir = scan_dir
+
+    def test_remove(self):
+        self.store.update(id = 'run1', path = self.basecalls_dir)
+        self.store.remove(id = 'run1')
+        self.assertIsNone(self.store.get('run1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the resources module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import resources
+import sge_tracker
+
+settings = {
+'cpu_minutes_per_cycle_lane': 0.4,
+'cpu_minutes_per_sample': 1,
+'target_runtime_minutes': 60,
+'min_slots': 2,
+'max_slots': 16,
+'base_runtime_minutes': 10,
+'base_memory_gb': 2,
+'memory_gb_per_slot': 0.5,
+'memory_gb_per_sample': 0.05,
+'max_memory_gb': 64,
+'memory_headroom': 1.5,
+'runtime_headroom': 1.5,
+'calibration_runs': 20,
+'min_calibration_runs': 3
+}
+
+class TestEstimate(unittest.TestCase):
+    def test_estimate(self):
+        '''
+        310 cycles on 4 lanes for 24 samples is 520 CPU minutes; 9 slots do it in about 60 minutes
+        '''
+        estimate = resources.estimate_resources(samples = 24, cycles = 310, lanes = 4, settings = settings)
+        self.assertEqual(estimate['slots'], 9)
+        self.assertAlmostEqual(estimate['model_runtime_minutes'], 10 + 520 / 9.0)
+        self.assertEqual(estimate['runtime_minutes'], 102)
+        self.assertAlmostEqual(estimate['model_memory_gb'], 2 + 4.5 + 1.2)
+        self.assertEqual(estimate['memory_gb'], 12)
+
+    def test_small_and_large_runs(self):
+        small = resources.estimate_resources(samples = 8, cycles = 75, lanes = 1, settings = settings)
+        self.assertEqual(small['slots'], settings['min_slots'])
+        large = resources.estimate_resources(samples = 96, cycles = 310, lanes = 16, settings = settings)
+        self.assertEqual(large['slots'], settings['max_slots'])
+        self.assertTrue(small['memory_gb'] < large['memory_gb'])
+        self.assertTrue(small['runtime_minutes'] < large['runtime_minutes'])
+
+    def test_calibration(self):
+        estimate = resources.estimate_resources(samples = 24, cycles = 310, lanes = 4, settings = settings, calibration = {'runtime': 2.0, 'memory': 100.0})
+        self.assertEqual(estimate['runtime_minutes'], 204)
+        self.assertEqual(estimate['memory_gb'], settings['max_memory_gb'])
+        # the model values are not calibrated, so that they can be compared with the actual use
+        self.assertAlmostEqual(estimate['model_runtime_minutes'], 10 + 520 / 9.0)
+
+    def test_format_command(self):
+        estimate = resources.estimate_resources(samples = 24, cycles = 310, lanes = 4, settings = settings)
+        self.assertEqual(resources.format_command(command = 'demultiplex.sh run1', estimate = estimate),
+        'LYZ_SLOTS=9 LYZ_MEMORY_GB=12 LYZ_RUNTIME_MINUTES=102 demultiplex.sh run1')
+
+class TestResourceHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.history = resources.ResourceHistory(db_file = os.path.join(self.tmpdir, 'resources.sqlite'))
+        self.task = 'NGS580_demultiplexing'
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.tmpdir)
+
+    def add_run(self, run_id, wallclock, maxvmem_gb, state = sge_tracker.JOB_FINISHED):
+        estimate = resources.estimate_resources(samples = 24, cycles = 310, lanes = 4, settings = settings)
+        self.history.add_estimate(run_id = run_id, task = self.task, estimate = estimate)
+        self.history.add_actual(run_id = run_id, task = self.task, usage = {'state': state, 'wallclock': wallclock, 'maxvmem_gb': maxvmem_gb})
+
+    def test_pending(self):
+        estimate = resources.estimate_resources(samples = 24, cycles = 310, lanes = 4, settings = settings)
+        self.history.add_estimate(run_id = 'run1', task = self.task, estimate = estimate)
+        self.history.add_estimate(run_id = 'run2', task = self.task, estimate = estimate, now = 0)
+        self.assertEqual(self.history.get_pending(), [('run1', self.task)])
+        self.history.add_actual(run_id = 'run1', task = self.task, usage = {'state': sge_tracker.JOB_FINISHED, 'wallclock': 600.0, 'maxvmem_gb': 4.0})
+        self.assertEqual(self.history.get_pending(), [])
+        saved = self.history.get_estimate(run_id = 'run1', task = self.task)
+        self.assertEqual(saved['actual_runtime_minutes'], 10.0)
+        self.assertEqual(saved['slots'], 9)
+
+    def test_calibration(self):
+        '''
+        Factors are the median ratio of actual to model use of the finished runs, once there are enough of them
+        '''
+        model_runtime = 10 + 520 / 9.0
+        model_memory = 7.7
+        self.add_run('run1', wallclock = model_runtime * 60 * 2, maxvmem_gb = model_memory / 2)
+        self.add_run('run2', wallclock = model_runtime * 60 * 3, maxvmem_gb = model_memory / 2)
+        self.assertEqual(self.history.get_calibration(task = self.task, min_runs = 3), {'runtime': 1.0, 'memory': 1.0})
+        self.add_run('run3', wallclock = model_runtime * 60 * 4, maxvmem_gb = None)
+        # failed runs are not used
+        self.add_run('run4', wallclock = 60, maxvmem_gb = 1, state = sge_tracker.JOB_FAILED)
+        calibration = self.history.get_calibration(task = self.task, min_runs = 3)
+        self.assertAlmostEqual(calibration['runtime'], 3.0)
+        self.assertEqual(calibration['memory'], 1.0)
+        self.assertAlmostEqual(self.history.get_calibration(task = self.task, min_runs = 2)['memory'], 0.5)
+        self.add_run('run5', wallclock = model_runtime * 60 * 100, maxvmem_gb = None)
+        self.add_run('run6', wallclock = model_runtime * 60 * 100, maxvmem_gb = None)
+        self.add_run('run7', wallclock = model_runtime * 60 * 100, maxvmem_gb = None)
+        self.assertEqual(self.history.get_calibration(task = self.task, min_runs = 3)['runtime'], resources.max_calibration_factor)
+
+
+if __name__ == '__main__':
+    unittest.main()
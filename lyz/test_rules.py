@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the rules module
+'''
+import unittest
+from rules import Rule, RuleSet, COST_MEMORY, COST_STAT, COST_READ
+
+class TestRuleSet(unittest.TestCase):
+    def setUp(self):
+        self.checked = []
+        def check(name, value):
+            def func(subject):
+                self.checked.append(name)
+                return(value)
+            return(func)
+        self.rule_set = RuleSet(rules = [
+        Rule(name = 'read', cost = COST_READ, func = check('read', True)),
+        Rule(name = 'stat', cost = COST_STAT, func = check('stat', False)),
+        Rule(name = 'memory1', cost = COST_MEMORY, func = check('memory1', True)),
+        Rule(name = 'memory2', cost = COST_MEMORY, func = check('memory2', True))
+        ])
+
+    def test_cost_order_short_circuit(self):
+        '''
+        Rules are checked from cheapest to most expensive, stopping at the first failure
+        '''
+        is_valid, results = self.rule_set.evaluate(subject = None)
+        self.assertFalse(is_valid)
+        self.assertEqual(self.checked, ['memory1', 'memory2', 'stat'])
+        self.assertEqual(list(results.items()), [('memory1', True), ('memory2', True), ('stat', False)])
+
+    def test_explain(self):
+        '''
+        All rules are checked in explain mode
+        '''
+        is_valid, results = self.rule_set.evaluate(subject = None, explain = True)
+        self.assertFalse(is_valid)
+        self.assertEqual(self.checked, ['memory1', 'memory2', 'stat', 'read'])
+        self.assertEqual(len(results), 4)
+
+    def test_all_pass(self):
+        rule_set = RuleSet(rules = [Rule(name = 'a', func = lambda x: x > 0), Rule(name = 'b', cost = COST_STAT, func = lambda x: x > 1)])
+        self.assertTrue(rule_set.evaluate(subject = 2)[0])
+        self.assertFalse(rule_set.evaluate(subject = 1)[0])
+
+    def test_select(self):
+        rule_set = self.rule_set.select(names = ['read', 'memory2'])
+        self.assertEqual([rule.name for rule in rule_set.rules], ['memory2', 'read'])
+        self.assertTrue(rule_set.evaluate(subject = None)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the run_ids module
+'''
+import unittest
+from datetime import date
+import run_ids
+
+class TestRunIDs(unittest.TestCase):
+    def test_parse(self):
+        run = run_ids.parse('170809_NB501073_0019_AH5FFYBGX3')
+        self.assertEqual(run.date, date(2017, 8, 9))
+        self.assertEqual(run.instrument, 'NB501073')
+        self.assertEqual(run.run_number, 19)
+        self.assertEqual(run.flowcell, 'AH5FFYBGX3')
+        self.assertIsNone(run.suffix)
+        self.assertEqual(run_ids.parse('170809_NB501073_0019_AH5FFYBGX3_run_before_sequencing_done').suffix, 'run_before_sequencing_done')
+
+    def test_not_run_ids(self):
+        for name in ['to_be_demultiplexed', 'automatic_demultiplexing_logs', 'ArcherRun', '171309_NB501073_0019_AH5FFYBGX3', '170809_NB501073_AH5FFYBGX3', '']:
+            self.assertIsNone(run_ids.parse(name), name)
+            self.assertIsNone(run_ids.get_instrument(name), name)
+
+    def test_slots(self):
+        run = run_ids.parse('170809_NB501073_0019_AH5FFYBGX3')
+        self.assertFalse(hasattr(run, '__dict__'))
+        self.assertEqual(run, run_ids.parse('170809_NB501073_0019_AH5FFYBGX3'))
+        self.assertNotEqual(run, run_ids.parse('170809_NB501073_0019_AH5FFYBGX3_test'))
+
+    def test_is_recent(self):
+        run = run_ids.parse('170809_NB501073_0019_AH5FFYBGX3')
+        self.assertEqual(run.age_days(today = date(2017, 9, 8)), 30)
+        self.assertTrue(run.is_recent(max_age_days = 30, today = date(2017, 9, 8)))
+        self.assertFalse(run.is_recent(max_age_days = 30, today = date(2017, 9, 9)))
+        self.assertTrue(run.is_recent(max_age_days = 0, today = date(2020, 1, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
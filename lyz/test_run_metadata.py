@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the run_metadata module
+'''
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import run_metadata
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+run_dir = os.path.join(scriptdir, 'fixtures', 'NextSeq_runs', '170809_NB501073_0019_AH5FFYBGX3')
+
+class TestRunMetadata(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run_info(self):
+        run_info = run_metadata.get_run_info(os.path.join(run_dir, 'RunInfo.xml'))
+        self.assertEqual(run_info['run_id'], '170809_NB501073_0019_AH5FFYBGX3')
+        self.assertEqual(run_info['flowcell'], 'H5FFYBGX3')
+        self.assertEqual(run_info['instrument'], 'NB501073')
+        self.assertEqual(run_info['lane_count'], 4)
+        self.assertEqual([(read['cycles'], read['is_index']) for read in run_info['reads']], [(151, False), (8, True), (151, False)])
+
+    def test_completion_status(self):
+        completion_status = run_metadata.get_completion_status(os.path.join(run_dir, 'RunCompletionStatus.xml'))
+        self.assertEqual(completion_status, {'status': 'CompletedAsPlanned', 'run_id': '170809_NB501073_0019_AH5FFYBGX3', 'error_description': 'None'})
+        self.assertTrue(run_metadata.is_completed(completion_status))
+        self.assertFalse(run_metadata.is_completed(None))
+
+    def test_stops_early(self):
+        '''
+        Parsing stops once the needed elements are read, so a file that is still being written can be read
+        '''
+        path = os.path.join(self.tmpdir, 'RunCompletionStatus.xml')
+        with open(path, 'w') as f:
+            f.write('<RunCompletionStatus><CompletionStatus>UserEndedEarly</CompletionStatus><RunId>foo</RunId><ErrorDescription>None</ErrorDescription><CalculatedTo')
+        completion_status = run_metadata.get_completion_status(path)
+        self.assertEqual(completion_status['status'], 'UserEndedEarly')
+        self.assertFalse(run_metadata.is_completed(completion_status))
+
+    def test_cache(self):
+        '''
+        Files are parsed again only when they change; unreadable files give None
+        '''
+        path = os.path.join(self.tmpdir, 'RunCompletionStatus.xml')
+        open(path, 'w').close()
+        self.assertIsNone(run_metadata.get_completion_status(path))
+        with open(path, 'w') as f:
+            f.write('<RunCompletionStatus><CompletionStatus>CompletedAsPlanned</CompletionStatus></RunCompletionStatus>')
+        new_time = time.time() + 10
+        os.utime(path, (new_time, new_time))
+        self.assertEqual(run_metadata.get_completion_status(path)['status'], 'CompletedAsPlanned')
+        self.assertIs(run_metadata.get_completion_status(path), run_metadata.get_completion_status(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the samplesheet module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import samplesheet
+
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+fixture_samplesheet = os.path.join(scriptdir, 'fixtures', 'to_be_demultiplexed', 'NGS580', '170809_NB501073_0019_AH5FFYBGX3-SampleSheet.csv')
+
+header = '''[Header],,,
+IEMFileVersion,4,,
+Experiment Name,NS17-16,,
+
+[Reads],,,
+151,,,
+151,,,
+
+[Data],,,
+'''
+
+class TestSampleSheet(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_samplesheet(self, data):
+        path = os.path.join(self.tmpdir, 'SampleSheet.csv')
+        with open(path, 'w') as f:
+            f.write(header + data)
+        return(path)
+
+    def test_parse(self):
+        parsed = samplesheet.parse_samplesheet(fixture_samplesheet)
+        self.assertEqual(parsed['header']['Experiment Name'], 'NS17-16')
+        self.assertEqual(parsed['reads'], [151, 151])
+        self.assertEqual(parsed['settings']['Adapter'], 'CTGTCTCTTATACACATCT')
+        self.assertEqual([(sample.sample_id, sample.index, sample.line) for sample in parsed['samples']], [
+        ('SC-SERACARE', 'ACGTACGT', 21), ('NC-HAPMAP', 'TGCATGCA', 22), ('Sample1', 'GATCGATC', 23)])
+        self.assertEqual(samplesheet.check_samplesheet(fixture_samplesheet), [])
+
+    def test_get_neighbors(self):
+        neighbors = samplesheet.get_neighbors('ACGT', mismatches = 1)
+        self.assertEqual(len(neighbors), 1 + 4 * 3)
+        self.assertTrue(all(samplesheet.hamming_distance('ACGT', neighbor) <= 1 for neighbor in neighbors))
+        self.assertEqual(samplesheet.get_neighbors('ACGT', mismatches = 0), set(['ACGT']))
+
+    def test_duplicate_samples(self):
+        path = self.make_samplesheet('Lane,Sample_ID,index\n1,S1,AAAAAAAA\n1,S2,CCCCCCCC\n1,S1,GGGGGGGG\n2,S1,AAAAAAAA\n')
+        self.assertEqual(samplesheet.check_samplesheet(path), ["Duplicate Sample_ID 'S1' in lane 1 on lines 11, 13"])
+
+    def test_index_collision(self):
+        '''
+        Indexes 2 apart collide with 1 mismatch, but not with 0; indexes 3 apart do not collide
+        '''
+        path = self.make_samplesheet('Sample_ID,index\nS1,ACGTACGT\nS2,ACGTACCA\nS3,TTTTACGT\n')
+        problems = samplesheet.check_samplesheet(path, mismatches = 1)
+        self.assertEqual(len(problems), 1)
+        self.assertIn("'S1' (line 11, index ACGTACGT) and 'S2' (line 12, index ACGTACCA) differ at 2 position(s)", problems[0])
+        self.assertEqual(samplesheet.check_samplesheet(path, mismatches = 0), [])
+
+    def test_dual_index(self):
+        '''
+        Index pairs collide only if both of their indexes are close; samples in different lanes do not collide
+        '''
+        path = self.make_samplesheet('Lane,Sample_ID,index,index2\n1,S1,ACGTACGT,AAAAAAAA\n1,S2,ACGTACGA,CCCCCCCC\n2,S3,ACGTACGT,AAAAAAAA\n')
+        self.assertEqual(samplesheet.check_samplesheet(path), [])
+        path = self.make_samplesheet('Lane,Sample_ID,index,index2\n1,S1,ACGTACGT,AAAAAAAA\n1,S2,ACGTACGA,AAAAAAAC\n')
+        problems = samplesheet.check_samplesheet(path)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('Index collision in lane 1', problems[0])
+        # the distance of each index read is reported against its own threshold
+        path = self.make_samplesheet('Sample_ID,index,index2\nS1,AAAAAAAA,CCCCCCCC\nS2,AAAAAATT,CCCCCCGG\n')
+        problems = samplesheet.check_samplesheet(path, mismatches = 1)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('differ at 2 position(s) in index and 2 in index2; at least 3 are needed in index or in index2 with 1 barcode mismatch(es)', problems[0])
+
+    def test_bad_samplesheets(self):
+        self.assertIn('No samples', samplesheet.check_samplesheet(self.make_samplesheet('Sample_ID,index\n'))[0])
+        self.assertIn('Could not parse', samplesheet.check_samplesheet(self.make_samplesheet('Sample_Name,index\nS1,ACGTACGT\n'))[0])
+        self.assertIn('Could not parse', samplesheet.check_samplesheet(os.path.join(self.tmpdir, 'foo.csv'))[0])
+        self.assertIn('characters other than', samplesheet.check_samplesheet(self.make_samplesheet('Sample_ID,index\nS1,ACGT-ACGT\n'))[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
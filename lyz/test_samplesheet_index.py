@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the samplesheet_index module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import samplesheet_index
+
+class TestSamplesheetIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = [
+        '170809_NB501073_0019_AH5FFYBGX3-SampleSheet.csv',
+        '170809_NB501073_0019_AH5FFYBGX3-samples.pairs.csv',
+        '170824_NB501073_0020_AHHK37BGX3-SampleSheet.csv',
+        os.path.join('old', '170519_NB501073_0010_AHCLLMBGX2-SampleSheet.csv')
+        ]
+        os.makedirs(os.path.join(self.tmpdir, 'old'))
+        for item in self.files:
+            open(os.path.join(self.tmpdir, item), 'w').close()
+        samplesheet_index.reset()
+
+    def tearDown(self):
+        samplesheet_index.reset()
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_files(self):
+        index = samplesheet_index.SamplesheetIndex(search_dir = self.tmpdir)
+        found = index.find_files(pattern = '*-SampleSheet.csv')
+        self.assertEqual(sorted(found), sorted([os.path.join(self.tmpdir, item) for item in self.files if item.endswith('-SampleSheet.csv')]))
+        self.assertEqual(len(index.find_files(pattern = '*-SampleSheet.csv', max_depth = 0)), 2)
+
+    def test_find_run_files(self):
+        index = samplesheet_index.SamplesheetIndex(search_dir = self.tmpdir)
+        self.assertEqual(index.find_run_files(id = '170809_NB501073_0019_AH5FFYBGX3', pattern = '*-samples.pairs.csv'), [os.path.join(self.tmpdir, self.files[1])])
+        self.assertEqual(index.find_run_files(id = '170824_NB501073_0020_AHHK37BGX3', pattern = '*-samples.pairs.csv'), [])
+        self.assertEqual(index.find_run_files(id = 'foo', pattern = '*'), [])
+
+    def test_shared_index(self):
+        '''
+        The index is shared until it is reset
+        '''
+        index = samplesheet_index.get_index(search_dir = self.tmpdir)
+        self.assertIs(samplesheet_index.get_index(search_dir = self.tmpdir), index)
+        samplesheet_index.reset()
+        self.assertIsNot(samplesheet_index.get_index(search_dir = self.tmpdir), index)
+
+    def test_missing_dir(self):
+        index = samplesheet_index.SamplesheetIndex(search_dir = os.path.join(self.tmpdir, 'foo'))
+        self.assertEqual(index.find_files(pattern = '*'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the sge_tracker module
+'''
+import unittest
+import os
+import stat
+import shutil
+import tempfile
+import time
+import sge_tracker
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+fixtures_dir = os.path.join(scriptdir, 'fixtures')
+
+class TestParse(unittest.TestCase):
+    def test_parse_job_ids(self):
+        output = 'Your job 2495634 ("demultiplex-NGS580") has been submitted\nfoo\nYour job-array 2495640.1-4:1 ("bar") has been submitted\n'
+        self.assertEqual(sge_tracker.parse_job_ids(output), ['2495634', '2495640'])
+        self.assertEqual(sge_tracker.parse_job_ids(None), [])
+
+    def test_parse_qstat(self):
+        with open(os.path.join(fixtures_dir, 'qstat_stdout_r_Eqw.txt')) as f:
+            states = sge_tracker.parse_qstat(f.read())
+        self.assertEqual(states['2495632'], 'r')
+        self.assertEqual(states['2493897'], 'Eqw')
+        self.assertNotIn('job-ID', states)
+
+    def test_parse_qacct(self):
+        with open(os.path.join(fixtures_dir, 'qacct_stdout.txt')) as f:
+            results = sge_tracker.parse_qacct(f.read())
+        self.assertEqual(results, {'2495601': ('0', '0'), '2495602': ('0', '1')})
+
+    def test_job_usage(self):
+        with open(os.path.join(fixtures_dir, 'qacct_stdout.txt')) as f:
+            records = sge_tracker.parse_qacct_records(f.read())
+        wallclock, maxvmem_gb = sge_tracker.get_job_usage(records['2495601'])
+        self.assertEqual(wallclock, 5318.0)
+        self.assertAlmostEqual(maxvmem_gb, 6.01)
+        self.assertAlmostEqual(sge_tracker.parse_memory_gb('512.000M'), 0.5)
+        self.assertIsNone(sge_tracker.parse_memory_gb('foo'))
+        self.assertEqual(sge_tracker.get_job_usage({}), (None, None))
+
+    def test_get_job_state(self):
+        self.assertEqual(sge_tracker.get_job_state(qstat_state = 'qw'), sge_tracker.JOB_QUEUED)
+        self.assertEqual(sge_tracker.get_job_state(qstat_state = 'r'), sge_tracker.JOB_RUNNING)
+        self.assertEqual(sge_tracker.get_job_state(qstat_state = 'Eqw'), sge_tracker.JOB_FAILED)
+        self.assertEqual(sge_tracker.get_job_state(qacct_result = ('0', '0')), sge_tracker.JOB_FINISHED)
+        self.assertEqual(sge_tracker.get_job_state(qacct_result = ('0', '1')), sge_tracker.JOB_FAILED)
+        self.assertEqual(sge_tracker.get_job_state(), sge_tracker.JOB_UNKNOWN)
+
+class TestJobTracker(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.calls_file = os.path.join(self.tmpdir, 'calls.txt')
+        # stub qstat and qacct programs that print the fixture output and record each call
+        qstat = self.make_script('qstat', 'qstat_stdout_r_Eqw.txt')
+        qacct = self.make_script('qacct', 'qacct_stdout.txt')
+        self.tracker = sge_tracker.JobTracker(db_file = os.path.join(self.tmpdir, 'db', 'sge_jobs.sqlite'), qstat = qstat, qacct = qacct)
+
+    def tearDown(self):
+        self.tracker.close()
+        shutil.rmtree(self.tmpdir)
+
+    def make_script(self, name, fixture):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\necho {0} >> "{1}"\ncat "{2}"\n'.format(name, self.calls_file, os.path.join(fixtures_dir, fixture)))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return(path)
+
+    def get_calls(self):
+        if not os.path.exists(self.calls_file):
+            return([])
+        with open(self.calls_file) as f:
+            return(f.read().split())
+
+    def test_poll(self):
+        '''
+        All of the jobs are checked with one qstat call and one qacct call
+        '''
+        self.tracker.add_jobs(run_id = 'run1', task = 'NGS580_demultiplexing', job_ids = ['2495632', '2495601'])
+        self.tracker.add_jobs(run_id = 'run2', task = 'NGS580_demultiplexing', job_ids = ['2493897'])
+        self.tracker.add_jobs(run_id = 'run3', task = 'NGS580_analysis', job_ids = ['2495602'])
+        changes = self.tracker.poll()
+        self.assertEqual(self.get_calls(), ['qstat', 'qacct'])
+        self.assertEqual(sorted((job_id, state) for job_id, run_id, task, old_state, state in changes),
+        [('2493897', 'failed'), ('2495601', 'finished'), ('2495602', 'failed'), ('2495632', 'running')])
+        self.assertEqual(self.tracker.get_run_states(active_only = False), {
+        ('run1', 'NGS580_demultiplexing'): 'running',
+        ('run2', 'NGS580_demultiplexing'): 'failed',
+        ('run3', 'NGS580_analysis'): 'failed'
+        })
+        self.assertEqual(self.tracker.get_run_states(), {('run1', 'NGS580_demultiplexing'): 'running'})
+        # only the running job is checked again, and it is still in the queue
+        self.assertEqual(list(self.tracker.get_active_jobs().keys()), ['2495632'])
+        self.assertEqual(self.tracker.poll(), [])
+        self.assertEqual(self.get_calls(), ['qstat', 'qacct', 'qstat'])
+
+    def test_unknown_jobs(self):
+        '''
+        Jobs that are not in the accounting records are looked up for a few minutes after they leave the queue,
+        and expire after 'accounting_days'; qacct is not run when no job has just left the queue
+        '''
+        self.tracker.add_jobs(run_id = 'run1', task = 'NGS580_demultiplexing', job_ids = ['2495632'])
+        self.tracker.add_jobs(run_id = 'run2', task = 'NGS580_demultiplexing', job_ids = ['1000001'])
+        now = time.time()
+        self.assertEqual([state for job_id, run_id, task, old_state, state in self.tracker.poll(now = now)], ['unknown', 'running'])
+        self.assertEqual(self.get_calls(), ['qstat', 'qacct'])
+        self.tracker.poll(now = now + 60)
+        self.assertEqual(self.get_calls(), ['qstat', 'qacct', 'qstat', 'qacct'])
+        # the unknown job only holds a slot for its run while it is still looked up
+        self.assertEqual(self.tracker.get_in_flight_runs(task = 'NGS580_demultiplexing', now = now + 60), set(['run1', 'run2']))
+        self.assertEqual(self.tracker.get_in_flight_runs(task = 'NGS580_demultiplexing', now = now + sge_tracker.accounting_retry_minutes * 60), set(['run1']))
+        self.assertEqual(self.tracker.get_in_flight_runs(task = 'NGS580_analysis', now = now + 60), set())
+        self.tracker.poll(now = now + sge_tracker.accounting_retry_minutes * 60)
+        self.assertEqual(self.get_calls(), ['qstat', 'qacct', 'qstat', 'qacct', 'qstat'])
+        changes = self.tracker.poll(now = now + self.tracker.accounting_days * 86400)
+        self.assertEqual(changes, [('1000001', 'run2', 'NGS580_demultiplexing', 'unknown', 'expired')])
+        self.assertEqual(self.get_calls(), ['qstat', 'qacct', 'qstat', 'qacct', 'qstat', 'qstat'])
+        self.assertEqual(list(self.tracker.get_active_jobs().keys()), ['2495632'])
+
+    def test_run_usage(self):
+        '''
+        The wallclock time and peak memory of the jobs are saved from the qacct output once they are done
+        '''
+        self.tracker.add_jobs(run_id = 'run1', task = 'NGS580_demultiplexing', job_ids = ['2495601'])
+        self.tracker.add_jobs(run_id = 'run2', task = 'NGS580_demultiplexing', job_ids = ['2495632'])
+        self.assertIsNone(self.tracker.get_run_usage(run_id = 'run1', task = 'NGS580_demultiplexing'))
+        self.tracker.poll()
+        usage = self.tracker.get_run_usage(run_id = 'run1', task = 'NGS580_demultiplexing')
+        self.assertEqual(usage['state'], sge_tracker.JOB_FINISHED)
+        self.assertEqual(usage['wallclock'], 5318.0)
+        self.assertAlmostEqual(usage['maxvmem_gb'], 6.01)
+        # still running
+        self.assertIsNone(self.tracker.get_run_usage(run_id = 'run2', task = 'NGS580_demultiplexing'))
+        self.assertIsNone(self.tracker.get_run_usage(run_id = 'run3', task = 'NGS580_demultiplexing'))
+
+    def test_queue_depth(self):
+        '''
+        The queue depth is the number of jobs for all users listed by one qstat call
+        '''
+        with open(os.path.join(fixtures_dir, 'qstat_stdout_r_Eqw.txt')) as f:
+            num_jobs = len(sge_tracker.parse_qstat(f.read()))
+        self.assertEqual(self.tracker.get_queue_depth(), num_jobs)
+        self.assertEqual(self.get_calls(), ['qstat'])
+        # a qstat that only lists the jobs of all users with '-u *'
+        with open(self.tracker.qstat, 'w') as f:
+            f.write('#!/bin/sh\nif [ "$1" = "-u" ] && [ "$2" = "*" ]; then cat "{0}"; fi\n'.format(os.path.join(fixtures_dir, 'qstat_stdout_r_Eqw.txt')))
+        self.assertEqual(self.tracker.get_queue_depth(), num_jobs)
+
+    def test_no_active_jobs(self):
+        '''
+        qstat is not run when there are no jobs to check
+        '''
+        self.assertEqual(self.tracker.poll(), [])
+        self.assertEqual(self.get_calls(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
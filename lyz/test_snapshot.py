@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the snapshot module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from snapshot import RunSnapshot
+
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+fixture_dir = os.path.join(scriptdir, "fixtures")
+sequencer_dir =  os.path.join(fixture_dir, 'NextSeq_runs')
+
+class TestRunSnapshot(unittest.TestCase):
+    def test_demultiplexed_run(self):
+        x = RunSnapshot(run_dir = os.path.join(sequencer_dir, '170809_NB501073_0019_AH5FFYBGX3'))
+        self.assertTrue(x.run_dir_exists)
+        self.assertTrue(x.basecalls_dir_exists)
+        self.assertTrue(x.unaligned_dir_exists)
+        self.assertTrue(x.RTAComplete_file_exists)
+        self.assertTrue(x.RunInfo_file_exists)
+        self.assertTrue(x.RunCompletionStatus_file_exists)
+        self.assertEqual(x.seqtype, 'NGS580')
+        self.assertEqual(x.RTAComplete_time, datetime(2017, 8, 10, 23, 28, 41))
+
+    def test_not_demultiplexed_run(self):
+        x = RunSnapshot(run_dir = os.path.join(sequencer_dir, '170809_NB501073_0019_AH5FFYBGX3_notdemultiplexed'))
+        self.assertTrue(x.basecalls_dir_exists)
+        self.assertFalse(x.unaligned_dir_exists)
+        self.assertIsNone(x.seqtype)
+
+    def test_missing_RunInfo(self):
+        x = RunSnapshot(run_dir = os.path.join(sequencer_dir, '170809_NB501073_0019_AH5FFYBGX3_broke1'))
+        self.assertFalse(x.RunInfo_file_exists)
+        self.assertTrue(x.RunCompletionStatus_file_exists)
+
+    def test_empty_basecalls_dir(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmpdir, 'Data', 'Intensities', 'BaseCalls'))
+            x = RunSnapshot(run_dir = tmpdir)
+            self.assertTrue(x.basecalls_dir_exists)
+            self.assertFalse(x.unaligned_dir_exists)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_missing_run(self):
+        x = RunSnapshot(run_dir = os.path.join(sequencer_dir, 'foo'))
+        self.assertFalse(x.run_dir_exists)
+        self.assertFalse(x.basecalls_dir_exists)
+        self.assertFalse(x.RTAComplete_file_exists)
+        self.assertIsNone(x.RTAComplete_time)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the synthetic_tree module
+'''
+import unittest
+import os
+import shutil
+import tempfile
+import synthetic_tree
+from snapshot import RunSnapshot
+
+class TestSyntheticTree(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'tree')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_states(self):
+        '''
+        Every run is made in one of the states, in the proportions of the mix
+        '''
+        tree = synthetic_tree.make_tree(root = self.root, n_runs = 40)
+        runs = tree['runs']
+        self.assertEqual(sum(len(ids) for ids in runs.values()), 40)
+        self.assertEqual(len(runs['analyzed']), 28)
+        layout = tree['layout']
+        run_dirs = [name for name in os.listdir(layout['sequencer_dir']) if name != 'to_be_demultiplexed']
+        self.assertEqual(len(run_dirs), 40)
+        self.assertTrue(all(run_id.endswith('_test') for run_id in runs['test']))
+        self.assertEqual(sorted(os.listdir(layout['analysis_output_dir'])), sorted(runs['analyzed'] + ['targets']))
+        samplesheets = [name for name in os.listdir(layout['samplesheet_source_dir']) if name.endswith('-SampleSheet.csv')]
+        self.assertEqual(len(samplesheets), len(runs['complete'] + runs['recent'] + runs['broken']))
+
+    def test_run_files(self):
+        '''
+        The runs' files can be read by the monitors
+        '''
+        mix = [('complete', 1), ('in_progress', 1), ('broken', 1), ('demultiplexed', 1)]
+        tree = synthetic_tree.make_tree(root = self.root, n_runs = 4, mix = mix)
+        sequencer_dir = tree['layout']['sequencer_dir']
+        complete = RunSnapshot(run_dir = os.path.join(sequencer_dir, tree['runs']['complete'][0]), seqtype_file = 'seqtype.txt')
+        self.assertIsNotNone(complete.RTAComplete_time)
+        self.assertEqual(complete.run_info['run_id'], tree['runs']['complete'][0])
+        self.assertFalse(complete.unaligned_dir_exists)
+        in_progress = RunSnapshot(run_dir = os.path.join(sequencer_dir, tree['runs']['in_progress'][0]), seqtype_file = 'seqtype.txt')
+        self.assertFalse(in_progress.RTAComplete_file_exists)
+        broken = RunSnapshot(run_dir = os.path.join(sequencer_dir, tree['runs']['broken'][0]), seqtype_file = 'seqtype.txt')
+        self.assertFalse(broken.RunInfo_file_exists)
+        demultiplexed = RunSnapshot(run_dir = os.path.join(sequencer_dir, tree['runs']['demultiplexed'][0]), seqtype_file = 'seqtype.txt')
+        self.assertTrue(demultiplexed.unaligned_dir_exists)
+        self.assertEqual(demultiplexed.seqtype, 'NGS580')
+
+    def test_repeatable(self):
+        '''
+        The same seed makes the same runs
+        '''
+        first = synthetic_tree.make_tree(root = self.root, n_runs = 10, now = synthetic_tree.datetime(2018, 1, 1))
+        second = synthetic_tree.make_tree(root = os.path.join(self.tmpdir, 'tree2'), n_runs = 10, now = synthetic_tree.datetime(2018, 1, 1))
+        self.assertEqual(first['runs'], second['runs'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+unit tests for the watcher module
+'''
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import watcher
+
+class TestDirectoryWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.samplesheet_dir = os.path.join(self.tmpdir, 'to_be_demultiplexed')
+        self.sequencer_dir = os.path.join(self.tmpdir, 'quicksilver')
+        self.run_dir = os.path.join(self.sequencer_dir, '170809_NB501073_0019_AH5FFYBGX3')
+        os.makedirs(self.samplesheet_dir)
+        os.makedirs(self.run_dir)
+        # set old mtimes so that new changes are always seen
+        old_time = time.time() - 3600
+        for path in [self.samplesheet_dir, self.sequencer_dir, self.run_dir]:
+            os.utime(path, (old_time, old_time))
+        watches = [(self.samplesheet_dir, 0), (self.sequencer_dir, 1)]
+        self.watcher = watcher.DirectoryWatcher(watches = watches, poll_interval = 0.1, use_inotify = False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_no_changes(self):
+        self.assertEqual(self.watcher.wait(timeout = 0), set())
+
+    def test_new_samplesheet(self):
+        '''
+        A new file in a watched dir is reported as a change to that dir
+        '''
+        open(os.path.join(self.samplesheet_dir, 'foo-SampleSheet.csv'), 'w').close()
+        self.assertEqual(self.watcher.wait(timeout = 1), set([os.path.realpath(self.samplesheet_dir)]))
+
+    def test_change_in_run_dir(self):
+        '''
+        A new file in a subdirectory of a depth 1 watch is reported as a change to the parent dir
+        '''
+        open(os.path.join(self.run_dir, 'RTAComplete.txt'), 'w').close()
+        self.assertEqual(self.watcher.wait(timeout = 1), set([os.path.realpath(self.sequencer_dir)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Watch directories for changes, for running the monitor as a long-running daemon
+
+Uses inotify (through the optional 'pyinotify' package) for directories on local filesystems.
+inotify does not see changes made by other hosts on network filesystems (NFS, Isilon, etc.),
+so those directories are polled instead, by checking their modification times.
+
+Developed and tested with Python 2.7
+'''
+# ~~~~~ LOGGING ~~~~~~ #
+import logging
+logger = logging.getLogger("watcher")
+logger.debug("loading watcher module")
+
+# ~~~~ LOAD PACKAGES ~~~~~~ #
+import os
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# filesystem types where inotify events are not delivered for changes from other hosts
+network_fstypes = ['nfs', 'nfs4', 'cifs', 'smbfs', 'fuse.sshfs', 'lustre', 'gpfs', 'panfs', 'afs']
+
+
+# ~~~~ CUSTOM FUNCTIONS ~~~~~~ #
+def get_fstype(path, mounts_file = '/proc/mounts'):
+    '''
+    Get the filesystem type for a path, from the longest matching mount point in /proc/mounts
+    returns None if it cannot be determined
+    '''
+    path = os.path.realpath(path)
+    fstype = None
+    mount_point_length = -1
+    try:
+        with open(mounts_file) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point = parts[1]
+                if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+                    if len(mount_point) > mount_point_length:
+                        mount_point_length = len(mount_point)
+                        fstype = parts[2]
+    except IOError:
+        logger.debug('Could not read mounts file: {0}'.format(mounts_file))
+    return(fstype)
+
+def is_network_fs(path):
+    '''
+    Check if a path is on a network filesystem
+    '''
+    return(get_fstype(path) in network_fstypes)
+
+def list_subdirs(path):
+    '''
+    Get the paths to the subdirectories of a directory
+    '''
+    subdirs = []
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return(subdirs)
+    for name in names:
+        subdir = os.path.join(path, name)
+        if os.path.isdir(subdir):
+            subdirs.append(subdir)
+    return(subdirs)
+
+def get_mtime(path):
+    '''
+    Get the modification time of a path, or None if it does not exist
+    '''
+    try:
+        return(os.stat(path).st_mtime)
+    except OSError:
+        return(None)
+
+
+# ~~~~ CUSTOM CLASSES ~~~~~~ #
+class DirectoryWatcher(object):
+    '''
+    Watch a set of directories and report which of them changed
+
+    watches is a list of (path, depth) tuples; depth 0 watches only the directory itself,
+    depth 1 also watches each of its subdirectories (e.g. the runs in the sequencer directory)
+
+    watcher = DirectoryWatcher(watches = [('/path/to/samplesheets', 0), ('/path/to/sequencer', 1)])
+    changed = watcher.wait(timeout = 60) # set of the watched paths that changed
+    '''
+    def __init__(self, watches, poll_interval = 30, use_inotify = True):
+        self.watches = dict((os.path.realpath(path), depth) for path, depth in watches)
+        self.poll_interval = poll_interval
+        self.inotify_paths = []
+        self.poll_paths = []
+        for path in self.watches.keys():
+            if use_inotify and pyinotify and os.path.isdir(path) and not is_network_fs(path):
+                self.inotify_paths.append(path)
+            else:
+                self.poll_paths.append(path)
+        logger.debug('Directories watched with inotify: {0}'.format(self.inotify_paths))
+        logger.debug('Directories watched by polling: {0}'.format(self.poll_paths))
+        self._init_inotify()
+        self.mtimes = self.get_poll_mtimes()
+
+    def _init_inotify(self):
+        '''
+        Set up inotify watches for the local directories
+        '''
+        self.changed = set()
+        self.notifier = None
+        if not self.inotify_paths:
+            return
+        mask = pyinotify.IN_CREATE | pyinotify.IN_DELETE | pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM | pyinotify.IN_CLOSE_WRITE
+        self.watch_manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.watch_manager, default_proc_fun = self._process_event, timeout = 0)
+        self.inotify_mask = mask
+        for path in self.inotify_paths:
+            self.watch_manager.add_watch(path, mask)
+            if self.watches[path] > 0:
+                for subdir in list_subdirs(path):
+                    self.watch_manager.add_watch(subdir, mask)
+
+    def _process_event(self, event):
+        '''
+        Record the watched path that an inotify event belongs to
+        new subdirectories of depth 1 watches get their own watch
+        '''
+        root = self.get_watch_root(event.path)
+        if root is None:
+            return
+        self.changed.add(root)
+        if event.dir and event.mask & (pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO) and event.path == root and self.watches[root] > 0:
+            self.watch_manager.add_watch(event.pathname, self.inotify_mask)
+
+    def get_watch_root(self, path):
+        '''
+        Get the watched path that a path belongs to
+        '''
+        path = os.path.realpath(path)
+        if path in self.watches:
+            return(path)
+        parent = os.path.dirname(path)
+        if parent in self.watches and self.watches[parent] > 0:
+            return(parent)
+        return(None)
+
+    def get_poll_mtimes(self):
+        '''
+        Get the modification times of all the polled directories and their watched subdirectories
+        '''
+        mtimes = {}
+        for path in self.poll_paths:
+            mtimes[path] = get_mtime(path)
+            if self.watches[path] > 0:
+                for subdir in list_subdirs(path):
+                    mtimes[subdir] = get_mtime(subdir)
+        return(mtimes)
+
+    def poll(self):
+        '''
+        Check the polled directories for changes since the last poll
+        '''
+        changed = set()
+        mtimes = self.get_poll_mtimes()
+        for path in set(mtimes.keys()) | set(self.mtimes.keys()):
+            if mtimes.get(path) != self.mtimes.get(path):
+                changed.add(self.get_watch_root(path))
+        self.mtimes = mtimes
+        changed.discard(None)
+        return(changed)
+
+    def check_inotify(self, timeout):
+        '''
+        Wait up to 'timeout' seconds for inotify events
+        '''
+        if self.notifier is None:
+            time.sleep(timeout)
+            return(set())
+        if self.notifier.check_events(timeout = int(timeout * 1000)):
+            self.notifier.read_events()
+            self.notifier.process_events()
+        changed = self.changed
+        self.changed = set()
+        return(changed)
+
+    def wait(self, timeout):
+        '''
+        Wait until one of the watched directories changes, or until the timeout in seconds has passed
+        returns the set of watched paths that changed
+        '''
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            interval = max(0, min(remaining, self.poll_interval))
+            changed = self.check_inotify(timeout = interval)
+            if self.poll_paths:
+                changed.update(self.poll())
+            if changed or remaining <= 0:
+                return(changed)